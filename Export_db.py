@@ -1,34 +1,294 @@
-import sqlite3
+# nightly export / backup, cheap enough to run against the live app:
+#   python Export_db.py export [--format csv|parquet]   new activity_log rows + small tables
+#   python Export_db.py snapshot                        consistent copy of the whole db
+#   python Export_db.py verify                          re-check snapshots and exported parts
+# activity_log is append-only, so only rows past the id exported last time are read; the
+# high-water mark and a checksum of every part live in db_exports/export_state.json.
+# snapshots use sqlite's online backup a few pages at a time, writers are never held up for long.
+import argparse
 import csv
+import gzip
+import hashlib
+import json
 import os
+import sqlite3
+import time
+
+import vault_db
 
-DB_NAME = "securevault.db"
-OUTPUT_DIR = "db_exports"  
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except Exception:
+    PYARROW_AVAILABLE = False    # --format parquet isn't offered, gzipped CSV only
+
+DB_NAME = vault_db.DB_NAME
+OUTPUT_DIR = "db_exports"
+BACKUP_DIR = "db_backups"
+CHUNK_ROWS = 1000  # rows held in memory at a time
+PART_ROWS = 1000000  # incremental rows per output file
+BACKUP_PAGES = 1024  # pages copied per backup step (4 MB with the default page size)
+BACKUP_SLEEP = 0.005  # seconds between steps, lets the app's writers in
+BACKUP_RESTARTS = 3  # a step-wise copy restarted this often (the app kept writing) is redone in one step
+KEEP_SNAPSHOTS = 7
+INCREMENTAL = ["activity_log"]  # append-only tables keyed by an AUTOINCREMENT id
+FULL = ["users"]  # small tables rewritten whole every run
+STATE_FILE = "export_state.json"
 
 os.makedirs(OUTPUT_DIR, exist_ok=True)  # created folder id does not exist
 
+
 def export_table(table_name):
     conn = sqlite3.connect(DB_NAME)
-    cur = conn.cursor() 
+    cur = conn.cursor()
 
-    cur.execute(f"SELECT * FROM {table_name}")
-    rows = cur.fetchall()  # gets all user info from DB table
+    cur.execute(f"SELECT * FROM {table_name}")  # rows are read in chunks below, never all at once
 
     col_names = [desc[0] for desc in cur.description]  # puts column names for table
 
     file_path = os.path.join(OUTPUT_DIR, f"{table_name}.csv")  # updates the table details to a CSV file
 
-    with open(file_path, "w", newline="") as f:
+    with open(file_path + ".tmp", "w", newline="") as f:
         writer = csv.writer(f)
         writer.writerow(col_names)
-        writer.writerows(rows)   # provides CSV file
+        while True:
+            rows = cur.fetchmany(CHUNK_ROWS)
+            if not rows:
+                break
+            writer.writerows(rows)   # provides CSV file
+    os.replace(file_path + ".tmp", file_path)   # a failed run leaves the previous export in place
 
     conn.close()
     print(f"Exported {table_name} → {file_path}")
 
+
+def _load_state():
+    try:
+        with open(os.path.join(OUTPUT_DIR, STATE_FILE)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"tables": {}}
+
+
+def _save_state(state):
+    path = os.path.join(OUTPUT_DIR, STATE_FILE)
+    with open(path + ".tmp", "w") as f:
+        json.dump(state, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + ".tmp", path)  # the mark only moves once the part it covers is on disk
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _arrow_schema(conn, table_name):
+    types = {"INTEGER": pa.int64(), "REAL": pa.float64()}
+    return pa.schema([
+        (row[1], types.get(row[2].upper(), pa.string()))  # TEXT / DATETIME stay strings, as sqlite stores them
+        for row in conn.execute(f"PRAGMA table_info({table_name})")
+    ])
+
+
+def _write_csv(path, cur, col_names, rows, limit):
+    written = 0
+    last_id = None
+    with gzip.open(path, "wt", newline="", compresslevel=6) as f:
+        writer = csv.writer(f)
+        writer.writerow(col_names)
+        while rows:
+            writer.writerows(rows)
+            written += len(rows)
+            last_id = rows[-1][0]
+            rows = cur.fetchmany(min(CHUNK_ROWS, limit - written)) if written < limit else []
+    return written, last_id
+
+
+def _write_parquet(path, cur, schema, rows, limit):
+    written = 0
+    last_id = None
+    with pq.ParquetWriter(path, schema, compression="zstd") as writer:
+        while rows:
+            columns = list(zip(*rows))
+            writer.write_table(pa.table([pa.array(col, type=t) for col, t in zip(columns, schema.types)], schema=schema))
+            written += len(rows)
+            last_id = rows[-1][0]
+            rows = cur.fetchmany(min(CHUNK_ROWS, limit - written)) if written < limit else []
+    return written, last_id
+
+
+def _count_rows(path, fmt):
+    if fmt == "parquet":
+        return pq.ParquetFile(path).metadata.num_rows
+    with gzip.open(path, "rt", newline="") as f:
+        return sum(1 for _ in csv.reader(f)) - 1  # minus the header
+
+
+def export_incremental(table_name, fmt="csv"):
+    # rows with id past the stored mark, in parts of at most PART_ROWS; returns rows exported
+    state = _load_state()
+    table = state["tables"].setdefault(table_name, {"last_id": 0, "parts": []})
+    folder = os.path.join(OUTPUT_DIR, table_name)
+    os.makedirs(folder, exist_ok=True)
+    total = 0
+    with vault_db.connection() as conn:
+        while True:
+            cur = conn.execute(f"SELECT * FROM {table_name} WHERE id > ? ORDER BY id", (table["last_id"],))
+            rows = cur.fetchmany(CHUNK_ROWS)
+            if not rows:
+                cur.close()
+                break
+            name = f"{table_name}-{rows[0][0]:012d}.{'parquet' if fmt == 'parquet' else 'csv.gz'}"
+            path = os.path.join(folder, name)
+            if fmt == "parquet":
+                written, last_id = _write_parquet(path + ".tmp", cur, _arrow_schema(conn, table_name), rows, PART_ROWS)
+            else:
+                written, last_id = _write_csv(path + ".tmp", cur, [d[0] for d in cur.description], rows, PART_ROWS)
+            cur.close()
+            with open(path + ".tmp", "rb") as f:
+                os.fsync(f.fileno())
+            os.replace(path + ".tmp", path)  # same name if a crashed run is repeated, no duplicate parts
+            table["parts"] = [p for p in table["parts"] if p["file"] != name] + [{
+                "file": name, "format": fmt, "first_id": rows[0][0], "last_id": last_id,
+                "rows": written, "sha256": _sha256(path), "exported_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+            }]
+            table["last_id"] = last_id
+            _save_state(state)
+            total += written
+            print(f"Exported {written} {table_name} rows (ids {rows[0][0]}..{last_id}) → {path}")
+    return total
+
+
+class _BackupRestarted(Exception):
+    pass
+
+
+def _backup(source, dest):
+    # step-wise first; every write by another connection restarts it, so a busy app could keep it
+    # going forever. one step instead copies from a single WAL read snapshot, which doesn't block writers
+    seen = {"remaining": None, "restarts": 0}
+
+    def progress(status, remaining, total):
+        if seen["remaining"] is not None and remaining > seen["remaining"]:
+            seen["restarts"] += 1
+            if seen["restarts"] >= BACKUP_RESTARTS:
+                raise _BackupRestarted()
+        seen["remaining"] = remaining
+
+    try:
+        source.backup(dest, pages=BACKUP_PAGES, progress=progress, sleep=BACKUP_SLEEP)
+        return "stepped"
+    except _BackupRestarted:
+        source.backup(dest)
+        return "single step"
+
+
+def snapshot(folder=BACKUP_DIR):
+    # point-in-time copy via the online backup API; the copy is checked before it replaces anything
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, f"securevault-{time.strftime('%Y%m%d-%H%M%S')}.db")
+    started = time.perf_counter()
+    dest = sqlite3.connect(path + ".tmp")
+    try:
+        with vault_db.connection() as source:
+            mode = _backup(source, dest)
+        dest.execute("PRAGMA journal_mode=DELETE")  # self-contained single file, no -wal next to it
+        counts = {
+            name: dest.execute(f"SELECT COUNT(*) FROM {name}").fetchone()[0]
+            for (name,) in dest.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'")
+        }
+    finally:
+        dest.close()
+    problem = _check_db(path + ".tmp")
+    if problem:
+        os.remove(path + ".tmp")
+        raise RuntimeError(f"snapshot failed verification: {problem}")
+    os.replace(path + ".tmp", path)
+    manifest = {"file": os.path.basename(path), "sha256": _sha256(path), "bytes": os.path.getsize(path), "tables": counts}
+    with open(path + ".json", "w") as f:
+        json.dump(manifest, f, indent=2)
+    for old in sorted(n for n in os.listdir(folder) if n.endswith(".db"))[:-KEEP_SNAPSHOTS]:
+        for name in (old, old + ".json"):
+            if os.path.exists(os.path.join(folder, name)):
+                os.remove(os.path.join(folder, name))
+    print(f"Snapshot {path} ({manifest['bytes'] / 1e6:.1f} MB) in {time.perf_counter() - started:.1f} s, {mode}")
+    return path
+
+
+def _check_db(path):
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        result = conn.execute("PRAGMA integrity_check").fetchone()[0]
+        return None if result == "ok" else result
+    finally:
+        conn.close()
+
+
+def verify(folder=BACKUP_DIR):
+    # every snapshot against its manifest, every exported part against its checksum and row count
+    problems = []
+    for name in sorted(n for n in os.listdir(folder) if n.endswith(".db")) if os.path.isdir(folder) else []:
+        path = os.path.join(folder, name)
+        try:
+            with open(path + ".json") as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            problems.append(f"{name}: no manifest")
+            continue
+        if _sha256(path) != manifest["sha256"]:
+            problems.append(f"{name}: checksum mismatch")
+            continue
+        problem = _check_db(path)
+        if problem:
+            problems.append(f"{name}: {problem}")
+    for table_name, table in _load_state()["tables"].items():
+        expected = 0
+        for part in table["parts"]:
+            path = os.path.join(OUTPUT_DIR, table_name, part["file"])
+            if not os.path.exists(path):
+                problems.append(f"{part['file']}: missing")
+            elif _sha256(path) != part["sha256"]:
+                problems.append(f"{part['file']}: checksum mismatch")
+            elif _count_rows(path, part["format"]) != part["rows"]:
+                problems.append(f"{part['file']}: row count differs from the state file")
+            if expected and part["first_id"] <= expected:
+                problems.append(f"{part['file']}: overlaps the previous part")
+            expected = part["last_id"]
+    return problems
+
+
 def main():
-    export_table("users")
-    export_table("activity_log")
+    global DB_NAME
+    parser = argparse.ArgumentParser(description="SecureVault export / backup")
+    parser.add_argument("command", nargs="?", default="export", choices=["export", "snapshot", "verify"])
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv")
+    parser.add_argument("--db", default=DB_NAME)
+    args = parser.parse_args()
+
+    DB_NAME = args.db
+    vault_db.configure(args.db)
+    if args.command == "export":
+        if args.format == "parquet" and not PYARROW_AVAILABLE:
+            raise SystemExit("--format parquet needs pyarrow (pip install pyarrow)")
+        for table_name in INCREMENTAL:
+            export_incremental(table_name, args.format)
+        for table_name in FULL:
+            export_table(table_name)
+    elif args.command == "snapshot":
+        snapshot()
+    else:
+        problems = verify()
+        for problem in problems:
+            print(problem)
+        print("all snapshots and exported parts verified" if not problems else f"{len(problems)} problems")
+        if problems:
+            raise SystemExit(1)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
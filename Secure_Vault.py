@@ -1,35 +1,33 @@
 import io
 import streamlit as st  # Streamlit
 import sqlite3  # DB
-import hashlib  # Password Hashing 
+import passwords  # Password Hashing (salted scrypt on a bounded pool)
+import hmac  # constant-time token compare
+import rate_limit  # login throttling
+import session_cache  # per-user rows cached between reruns
 import random  # Captcha
 import os 
 import re
 import datetime
+import time
 import requests
-import base64   # Backgroung images 
-
-try:
-    from reportlab.lib.pagesizes import letter
-    from reportlab.pdfgen import canvas
-    REPORTLAB_AVAILABLE = True
-except Exception:
-    REPORTLAB_AVAILABLE = False    # this try block is added if the Report lab gives an error then Activity is downloaded as CSV
-
+import theme_assets   # cached theme CSS and background images
+import vault_db  # pooled SQLite connections
+import activity_writer  # batched activity log inserts
+import activity_queries  # paginated activity reads
+import activity_export  # streaming CSV / PDF exports
+import export_cache  # finished exports kept in memory
+import blob_store  # content-addressed file storage
+import file_search  # indexed file search
+import analytics  # admin dashboard aggregates
+import jobs  # background job queue
+import metrics  # timing spans, histograms and the optional rerun profiler
+import previews  # cached thumbnails and text snippets
+
+@metrics.timed("setup")
 def set_bg(image_path):
-    with open(image_path, "rb") as f:
-        data = f.read()
-    encoded = base64.b64encode(data).decode()   # converting image to base64 for stramlit
     st.markdown(
-        f"""
-        <style>
-        [data-testid="stAppViewContainer"] {{
-            background-image: url("data:image/jpg;base64,{encoded}");
-            background-size: cover;
-            background-position: center;
-        }}
-        </style> 
-        """,   # CSS for image import
+        f"<style>{theme_assets.background_css(image_path)}</style>",   # encoded once per image version, not every rerun
         unsafe_allow_html=True,
     )      # this function to set background image
 
@@ -37,6 +35,7 @@ from streamlit_extras.stylable_container import stylable_container # stlable con
 
 
 st.set_page_config(page_title="SecureVault", layout="centered", page_icon="🔐")  # setting page details
+metrics.start_rerun()  # whole-rerun timing (and a stack profile with SECUREVAULT_PROFILE=1) from here to the bottom
 
 
 if "theme" not in st.session_state:
@@ -47,9 +46,9 @@ with st.sidebar:
     theme_choice = st.radio("Theme", ["Dark", "Light"], horizontal=True)
     st.session_state["theme"] = "dark" if theme_choice == "Dark" else "light"   # Mode changing Switch in Navigation Bar
 
+@metrics.timed("setup")
 def load_css(path):
-    with open(path) as f:
-        st.markdown(f"<style>{f.read()}</style>", unsafe_allow_html=True) # load the css theme light or dark as per our selection
+    st.markdown(f"<style>{theme_assets.css(path)}</style>", unsafe_allow_html=True) # load the css theme light or dark as per our selection
 
 
 if st.session_state["theme"] == "dark":
@@ -86,7 +85,7 @@ def render_top_nav():
     )        # top navigation bar
 
 def hash_password(password: str) -> str: # uses hashing password for providing security
-    return hashlib.sha256(password.encode()).hexdigest() # SHA-256 Hashing is used
+    return passwords.hash_password(password) # salted scrypt, parameters stored with the hash
 
 def check_password_strength(password):
     score = 0
@@ -103,101 +102,65 @@ def check_password_strength(password):
     else:
         return "Strong", "🥳"     # logic for password strength checking
 
-def get_db_connection():
-    conn = sqlite3.connect("securevault.db")
-    conn.row_factory = sqlite3.Row
-    return conn    # connect to SQLite Database
-
 def init_activity_log():
-    conn = get_db_connection()
-    conn.execute(
-        """
-        CREATE TABLE IF NOT EXISTS activity_log (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            userid TEXT,
-            action TEXT NOT NULL,
-            details TEXT,
-            ts DATETIME DEFAULT CURRENT_TIMESTAMP
-        )
-        """
-    )
-    conn.commit()
-    conn.close()     # user activity log table (structure)
+    vault_db.migrate()     # user activity log table (structure) and its indexes, see vault_db.MIGRATIONS
 
 def log_activity(userid, action, details=None):
-    conn = get_db_connection()
-    conn.execute(
-        "INSERT INTO activity_log (userid, action, details, ts) VALUES (?,?,?,CURRENT_TIMESTAMP)",
-        (userid, action, details),
-    )
-    conn.commit()
-    conn.close()  # insert user activity into the above table
-
+    activity_writer.log(userid, action, details)  # queued, written to the above table in batches by a background thread
+    session_cache.invalidate(userid)  # cached profile / activity for this user is stale now
+
+
+def client_key():
+    try:
+        ip = getattr(st.context, "ip_address", None)
+        if ip:
+            return ip
+        forwarded = st.context.headers.get("X-Forwarded-For")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    except Exception:
+        pass
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx else "unknown"   # who is trying to log in, for rate limiting
 
 def is_admin():
     return st.session_state.get("userid") == "admin" # checks if logged in user is admin or not 
 
 
-init_activity_log() # calling it again to display user activity after login
-
-UPLOAD_FOLDER = "uploads"
-os.makedirs(UPLOAD_FOLDER, exist_ok=True) # folder to save uploaded files
-
-def make_activity_pdf_bytes(filter_user=None):
-    if not REPORTLAB_AVAILABLE:
-        raise ImportError("reportlab not installed")
-    conn = get_db_connection()
-    cur = conn.cursor()
-    if filter_user:
-        cur.execute("SELECT userid, action, details, ts FROM activity_log WHERE userid=? ORDER BY ts DESC", (filter_user,))
-    else:
-        cur.execute("SELECT userid, action, details, ts FROM activity_log ORDER BY ts DESC")
-    rows = cur.fetchall()
-    conn.close()
-    buffer = io.BytesIO()
-    c = canvas.Canvas(buffer, pagesize=letter)
-    width, height = letter
-    x = 40
-    y = height - 50
-    c.setFont("Helvetica-Bold", 16)
-    c.drawString(x, y, "SecureVault - User Activity Log")
-    y -= 30
-    c.setFont("Helvetica", 10)
-    c.drawString(x, y, f"Generated: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    y -= 20
-    c.line(x, y, width - 40, y)
-    y -= 20
-    for row in rows:
-        userid, action, details, ts = row
-        details = details if details is not None else ""
-        line = f"{ts} | {userid} | {action} | {details}"
-        c.drawString(x, y, line[:120])
-        y -= 12
-        if y < 60:
-            c.showPage()
-            c.setFont("Helvetica", 10)
-            y = height - 40
-    c.save()
-    buffer.seek(0)
-    return buffer.read()  # for downloading user activity as pdf 
-
-def export_activity_csv(filter_user=None):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    if filter_user:
-        cur.execute("SELECT userid, action, details, ts FROM activity_log WHERE userid=? ORDER BY ts DESC", (filter_user,))
-    else:
-        cur.execute("SELECT userid, action, details, ts FROM activity_log ORDER BY ts DESC")
-    rows = cur.fetchall()
-    conn.close()
-    output = io.StringIO()
-    import csv
-    w = csv.writer(output)
-    w.writerow(["userid", "action", "details", "ts"])
-    for r in rows:
-        w.writerow([r["userid"], r["action"], r["details"], r["ts"]])
-    return output.getvalue().encode("utf-8")   # for downloading user activity as CSV 
-
+with metrics.span("setup", "init"):
+    init_activity_log() # calling it again to display user activity after login
+
+    UPLOAD_FOLDER = blob_store.UPLOAD_FOLDER
+    blob_store.init() # folder + tables for uploaded files (deduplicated blobs)
+    file_search.init() # search index over file names and text
+    jobs.start() # background workers for exports and maintenance
+
+def poll_job(job_id):
+    job = jobs.get(job_id)
+    if job["status"] not in jobs.ACTIVE:
+        st.rerun()   # finished, redraw the page around the result
+    st.progress(job["progress"], text=job["message"] or f"Job {job['status']}...")
+
+if hasattr(st, "fragment"):
+    poll_job = st.fragment(run_every=2)(poll_job)   # only this block reruns while a job is going
+
+def job_status(job, key):
+    # progress while queued / running, the error and a retry button when it failed. True once done
+    if job["status"] in jobs.ACTIVE:
+        poll_job(job["id"])
+        if not hasattr(st, "fragment"):
+            st.button("🔄 Refresh status", key=f"{key}_refresh")
+        return False
+    if job["status"] == "failed":
+        st.error(f"Job failed: {job['error']}")
+        if st.button("Try again", key=f"{key}_retry"):
+            jobs.retry(job["id"])
+            st.rerun()
+        return False
+    return job["status"] == "done"
+
+@metrics.timed("page")
 def login_page():
     with stylable_container(key="login_card", css_styles="{}"):
         st.markdown("### 🔐 SecureVault Login")
@@ -214,6 +177,11 @@ def login_page():
         captcha_answer = st.text_input(f"Solve CAPTCHA: {a} + {b} = ?") 
 
         if st.button("Login"):
+            allowed, retry_after = rate_limit.check_login(userid, client_key())
+            if not allowed:
+                st.error(f"Too many login attempts. Try again in {int(retry_after) + 1} seconds.")
+                return   # throttled before any DB or hashing work
+
             try:
                 if int(captcha_answer) != a + b:
                     st.error("Incorrect CAPTCHA.")
@@ -224,20 +192,28 @@ def login_page():
                 st.error("Enter a valid number.")
                 return   # This provides a captcha for user before login
 
-            conn = get_db_connection()
-            user = conn.execute(
-                "SELECT * FROM users WHERE userid = ?", (userid,)
-            ).fetchone()
-            conn.close()
+            user = vault_db.query_one(
+                "SELECT userid, password FROM users WHERE userid = ?", (userid,)
+            )
 
-            if user and user["password"] == hash_password(password):
+            try:
+                ok, upgraded = passwords.verify_password(password, user["password"] if user else None)
+            except passwords.PoolBusyError:
+                st.error("Server is busy, please try again in a moment.")
+                return
+
+            if user and ok:
+                if upgraded:
+                    vault_db.execute("UPDATE users SET password = ? WHERE userid = ?", (upgraded, userid))   # old hash upgraded transparently
                 st.session_state["userid"] = userid
                 log_activity(userid, "login", "User logged in")
                 st.success("Login successful!")
                 st.rerun()
             else:
+                log_activity(userid if user else None, "login_failed", "Wrong password" if user else "Unknown user ID")
                 st.error("Invalid credentials.") # logic for login page
 
+@metrics.timed("page")
 def signup_page():
     with stylable_container(key="signup_card", css_styles="{}"):
         st.markdown("### 📝 Create SecureVault Account")
@@ -255,19 +231,48 @@ def signup_page():
                 st.error("All fields required.")
                 return
 
-            conn = get_db_connection()
             try:
-                conn.execute(
+                vault_db.execute(
                     "INSERT INTO users (userid, password, email) VALUES (?,?,?)",
                     (userid, hash_password(password), email),
                 )
-                conn.commit()
-                conn.close()
                 st.success("Account created!")
                 log_activity(userid, "signup", "New account created")
-            except:
+            except passwords.PoolBusyError:
+                st.error("Server is busy, please try again in a moment.")
+            except sqlite3.IntegrityError:
                 st.error("UserID already exists.")   # logic for signup page
 
+@metrics.timed("page")
+def reset_password_page():
+    with stylable_container(key="reset_card", css_styles="{}"):
+        st.markdown("### 🔑 Reset Password")
+        userid = st.text_input("User ID", key="reset_userid")
+        token = st.text_input("Reset token", type="password")
+        password = st.text_input("New password", type="password", key="reset_password")
+
+        if st.button("Set new password"):
+            if not userid or not token or not password:
+                st.error("All fields required.")
+                return
+            row = vault_db.query_one(
+                "SELECT token_hash FROM password_resets WHERE userid = ? AND expires_at > CURRENT_TIMESTAMP", (userid,)
+            )
+            if not row or not hmac.compare_digest(row["token_hash"], passwords.hash_token(token)):
+                st.error("Invalid or expired token.")
+                return
+            try:
+                new_hash = hash_password(password)
+            except passwords.PoolBusyError:
+                st.error("Server is busy, please try again in a moment.")
+                return
+            with vault_db.connection() as conn:
+                conn.execute("UPDATE users SET password = ? WHERE userid = ?", (new_hash, userid))
+                conn.execute("DELETE FROM password_resets WHERE userid = ?", (userid,))   # tokens work once
+            log_activity(userid, "password_reset", "Password reset with token")
+            st.success("Password updated, you can log in now.")   # logic for one-time reset tokens from provision_users.py
+
+@metrics.timed("page")
 def upload_file_page():
     with stylable_container(key="upload_card", css_styles="{}"):
         st.markdown("### 📤 Upload File")
@@ -279,16 +284,25 @@ def upload_file_page():
         uploaded_file = st.file_uploader("Choose a file")
 
         if uploaded_file:
-            user_folder = os.path.join(UPLOAD_FOLDER, st.session_state["userid"])
-            os.makedirs(user_folder, exist_ok=True)
-            file_path = os.path.join(user_folder, uploaded_file.name)
+            upload_id = getattr(uploaded_file, "file_id", None) or (uploaded_file.name, uploaded_file.size)
+            if st.session_state.get("last_upload") == upload_id:
+                st.success(f"Uploaded: {uploaded_file.name}")
+                return   # same file still in the widget on a rerun, it is already stored
 
-            with open(file_path, "wb") as f:
-                f.write(uploaded_file.getbuffer())
+            uploaded_file.seek(0)
+            try:
+                blob_store.store_file(st.session_state["userid"], uploaded_file.name, uploaded_file, uploaded_file.type)   # streamed in chunks, identical content is stored only once
+            except blob_store.QuotaExceededError as e:
+                st.error(f"Upload rejected: {e}")
+                return
 
+            st.session_state["last_upload"] = upload_id
+            jobs.submit("index", {"owner": st.session_state["userid"], "filename": uploaded_file.name},
+                        owner=st.session_state["userid"])   # text for search, then thumbnail / snippet, in the background
             st.success(f"Uploaded: {uploaded_file.name}")
             log_activity(st.session_state["userid"], "upload", f"Uploaded {uploaded_file.name}")   # login for file upload page
 
+@metrics.timed("page")
 def view_files_page():
     with stylable_container(key="files_card", css_styles="{}"):
         st.markdown("### 📁 Your Files")
@@ -297,27 +311,46 @@ def view_files_page():
             st.warning("Login first.")
             return
 
-        user_folder = os.path.join(UPLOAD_FOLDER, st.session_state["userid"])
-        os.makedirs(user_folder, exist_ok=True)
-        files = sorted(os.listdir(user_folder))
+        userid = st.session_state["userid"]
+        total_files, _ = session_cache.get_or_load(("usage", userid), lambda: blob_store.usage(userid))
 
-        st.write(f"📦 Total Files: {len(files)}")
+        st.write(f"📦 Total Files: {total_files}")
 
         search = st.text_input("Search files:")
+        page = result_page("files", search)
         if search:
-            files = [f for f in files if search.lower() in f.lower()]
+            found, has_more = file_search.search(search, owner=userid, page=page)   # trigram index, no listing scan
+        else:
+            found = blob_store.list_files(userid, file_search.PAGE_SIZE + 1, page * file_search.PAGE_SIZE)
+            has_more = len(found) > file_search.PAGE_SIZE
+            found = found[:file_search.PAGE_SIZE]
+        rows = {r["filename"]: r for r in found}
+        files = list(rows)
+        shown = previews.lookup([r["blob_hash"] for r in found])   # cached previews only, the files themselves aren't read
+        page_buttons("files", page, has_more)
 
         if not files:
             st.info("No files found.")
             return
 
         for f in files:
-            file_path = os.path.join(user_folder, f)
             col1, col2, col3 = st.columns([3, 1, 1])
             col1.write(f"📄 {f}")
-
-            with open(file_path, "rb") as file:
-                col2.download_button("Download", file, file_name=f, key=f"dl_{f}")
+            kind, preview = shown.get(rows[f]["blob_hash"], (None, None))
+            if kind == "thumbnail":
+                col1.image(preview, width=previews.THUMB_SIZE)
+            elif kind == "text":
+                col1.caption(preview)
+            elif kind == "evicted":
+                jobs.submit("preview", {"owner": userid, "filename": f}, owner=userid)   # made again in the background
+
+            col2.download_button(
+                "Download",
+                data=lambda f=f: blob_store.read_file(userid, f),
+                file_name=f,
+                mime=rows[f]["mime_type"],
+                key=f"dl_{f}",
+            )   # read on click only, reruns never touch the file
 
             if col3.button("⋮", key=f"menu_{f}"):
                 st.session_state["file_menu"] = f
@@ -326,17 +359,21 @@ def view_files_page():
                 new_name = st.text_input("Rename to:", value=f, key=f"rn_{f}")
                 c1, c2 = st.columns(2)
                 if c1.button("Save name", key=f"sv_{f}"):
-                    new_path = os.path.join(user_folder, new_name)
-                    os.rename(file_path, new_path)
+                    try:
+                        blob_store.rename_file(userid, f, new_name)
+                    except FileExistsError:
+                        st.error(f"A file named {new_name} already exists.")
+                        return
                     log_activity(st.session_state["userid"], "rename", f"{f} → {new_name}")
                     st.session_state["file_menu"] = None
                     st.rerun()
                 if c2.button("Delete", key=f"del_{f}"):
-                    os.remove(file_path)
+                    blob_store.delete_file(userid, f)
                     log_activity(st.session_state["userid"], "delete", f"Deleted {f}")
                     st.session_state["file_menu"] = None
                     st.rerun()     # Logic for file viewing page and it also inclides logic for file renaming as well as file deletion 
 
+@metrics.timed("page")
 def account_page():
     with stylable_container(key="account_card", css_styles="{}"):
         st.markdown("### 👤 My Account")
@@ -345,46 +382,28 @@ def account_page():
             st.warning("Login first.")
             return
 
-        conn = get_db_connection()
-        user = conn.execute(
+        user = session_cache.get_or_load(("profile", userid), lambda: vault_db.query_one(
             "SELECT userid, email FROM users WHERE userid = ?", (userid,)
-        ).fetchone()
-        conn.close()
+        ))   # cached, only re-read after new activity or when the TTL runs out
 
         st.write(f"**User ID:** {user['userid']}")
         st.write(f"**Email:** {user['email']}")
 
-        user_folder = os.path.join(UPLOAD_FOLDER, userid)
-        files = os.listdir(user_folder) if os.path.exists(user_folder) else []
-
-        total_bytes = 0
-        if os.path.exists(user_folder):
-            for name in files:
-                fp = os.path.join(user_folder, name)
-                if os.path.isfile(fp):
-                    total_bytes += os.path.getsize(fp)
+        file_count, total_bytes = session_cache.get_or_load(("usage", userid), lambda: blob_store.usage(userid))
 
         mb = total_bytes / (1024 * 1024)
-        limit_mb = 200
+        limit_mb = blob_store.QUOTA_BYTES // (1024 * 1024)
         used_pct = min(int((mb / limit_mb) * 100), 100)
 
-        st.write(f"📦 Files stored: **{len(files)}**")
+        st.write(f"📦 Files stored: **{file_count}**")
         st.write(f"💾 Storage used: **{mb:.2f} MB / {limit_mb} MB**")
+        on_disk = session_cache.get_or_load(("physical", userid), lambda: blob_store.physical_usage(userid))
+        if total_bytes and on_disk != total_bytes:
+            st.caption(f"{on_disk / (1024 * 1024):.2f} MB on disk after compression / encryption")  # quota counts the logical size
         st.progress(used_pct)
 
-        conn = get_db_connection()
-        rows = conn.execute(
-            "SELECT action, details, ts FROM activity_log WHERE userid = ? ORDER BY ts DESC LIMIT 10",
-            (userid,),
-        ).fetchall()
-        conn.close()
-
         st.markdown("#### Recent Activity")
-        if not rows:
-            st.write("No recent activity yet.")
-        else:
-            for r in rows:
-                st.write(f"• {r['ts']} — **{r['action']}** — {r['details'] or ''}") # logic for user account page with user activity table and Storage used bar
+        activity_pager("account", userid=userid, cached=True) # logic for user account page with user activity table and Storage used bar
                 
         st.markdown("---")
         st.markdown("### Export activity")
@@ -393,24 +412,33 @@ def account_page():
             include_all = st.checkbox("Include all users (admin only)", value=False)
         filter_user = None if include_all else userid
 
-        if REPORTLAB_AVAILABLE:
-            try:
-                pdf_bytes = make_activity_pdf_bytes(filter_user)
-                st.download_button(
-                    label="📥 Download Activity as PDF",
-                    data=pdf_bytes,
-                    file_name="activity_log.pdf",
-                    mime="application/pdf",
-                )
-            except Exception as e:
-                st.error("Could not generate PDF: " + str(e))
-                csv_bytes = export_activity_csv(filter_user)
-                st.download_button("Download activity as CSV (fallback)", data=csv_bytes, file_name="activity_log.csv", mime="text/csv")
-        else:
-            st.warning("ReportLab is not installed. Install it with: pip install reportlab")
-            csv_bytes = export_activity_csv(filter_user)
-            st.download_button("Download activity as CSV", data=csv_bytes, file_name="activity_log.csv", mime="text/csv")
+        c1, c2 = st.columns(2)
+        since = c1.date_input("From", value=None, key="export_since")
+        until = c2.date_input("To", value=None, key="export_until")
+        start, end = activity_export.date_range(since, until)
+        compress = st.checkbox("Compress download (.gz)", value=False)
+        fmt = st.radio("Format", ["PDF", "CSV"], horizontal=True, key="export_fmt").lower()
+        ext, mime = (".gz", "application/gzip") if compress else ("", "application/pdf" if fmt == "pdf" else "text/csv")
+
+        version = session_cache.get_or_load(("last_id", filter_user), lambda: activity_queries.last_activity_id(filter_user))   # changes whenever a new row is logged
+        params = {"fmt": fmt, "user": filter_user, "start": start, "end": end, "compress": compress, "version": version}
+        job = jobs.find("export", params, owner=userid)
+        if job is not None and job_status(job, "export") and os.path.exists(job["result_path"] or ""):
+            def read_result():
+                with open(job["result_path"], "rb") as f:
+                    return f.read()
+            st.download_button(
+                label=f"📥 Download Activity as {fmt.upper()}",
+                data=lambda: export_cache.get_or_create(("job", job["id"]), read_result),   # read on click, not on every rerun
+                file_name=f"activity_log.{fmt}{ext}",
+                mime=mime,
+            )    # export is only built when asked for, repeat downloads of an unchanged log reuse the finished job
+        elif job is None or job["status"] in ("done", "cancelled"):   # never prepared, or its file was purged since
+            if st.button("⚙️ Prepare export"):
+                jobs.submit("export", params, owner=userid)   # built by a background worker
+                st.rerun()
 
+@metrics.timed("page")
 def support_page():
     with stylable_container(key="support_card", css_styles="{}"):
         st.markdown("### 🛟 Support")
@@ -426,6 +454,148 @@ def support_page():
                 userid = st.session_state.get("userid")
                 log_activity(userid, "support", f"{issue_type}: {message[:80]}")   # logic for support page
                 
+def result_page(key, query):
+    if st.session_state.get(f"{key}_query") != query:
+        st.session_state[f"{key}_query"] = query
+        st.session_state[f"{key}_page"] = 0   # a new search starts on the first page
+    return st.session_state.get(f"{key}_page", 0)
+
+def page_buttons(key, page, has_more):
+    if page == 0 and not has_more:
+        return
+    c1, c2, c3 = st.columns([1, 1, 2])
+    if page > 0 and c1.button("⬅ Prev", key=f"{key}_prev"):
+        st.session_state[f"{key}_page"] = page - 1
+        st.rerun()
+    if has_more and c2.button("Next ➡", key=f"{key}_next"):
+        st.session_state[f"{key}_page"] = page + 1
+        st.rerun()
+    c3.caption(f"Page {page + 1}")
+
+def activity_pager(key, userid=None, page_size=10, show_user=False, cached=False):
+    stack_key = f"{key}_cursors"
+    cursors = st.session_state.setdefault(stack_key, [None])   # cursors[-1] is where the current page starts
+    load = lambda: activity_queries.page_activity(userid, cursors[-1], page_size)
+    if cached:
+        rows, next_cursor = session_cache.get_or_load(("activity", userid, cursors[-1], page_size), load)
+    else:
+        rows, next_cursor = load()
+
+    if not rows:
+        st.write("No recent activity yet.")
+    for r in rows:
+        who = f"{r['userid']} — " if show_user else ""
+        st.write(f"• {r['ts']} — {who}**{r['action']}** — {r['details'] or ''}")
+
+    c1, c2 = st.columns(2)
+    if len(cursors) > 1 and c1.button("⬅ Newer", key=f"{key}_newer"):
+        cursors.pop()
+        st.rerun()
+    if next_cursor and c2.button("Older ➡", key=f"{key}_older"):
+        cursors.append(next_cursor)
+        st.rerun()     # keyset paging, each page is a single index range scan
+
+def analytics_section():
+    started = time.perf_counter()
+    analytics.refresh()   # catches up on activity since the last rollup, never rescans the log
+    st.markdown("#### 📊 Analytics")
+    totals = analytics.totals()
+    c1, c2, c3 = st.columns(3)
+    c1.metric("Users", totals["users"])
+    c2.metric("Files", totals["files"])
+    c3.metric("Stored", f"{totals['bytes'] / (1024 * 1024):.1f} MB")
+
+    st.markdown("**Uploads per day (last 30 days)**")
+    st.bar_chart(analytics.uploads_per_day())
+    st.markdown("**Failed logins per hour (last 48 hours)**")
+    st.line_chart(analytics.login_failures_per_hour())
+
+    left, right = st.columns(2)
+    with left:
+        st.markdown("**Top storage users**")
+        for row in analytics.top_storage():
+            st.write(f"• {row['owner']}: {row['bytes_used'] / (1024 * 1024):.2f} MB in {row['file_count']} files")
+    with right:
+        st.markdown("**Events by type (30 days)**")
+        st.bar_chart(analytics.action_totals())
+    st.caption(f"Built from precomputed aggregates in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+def maintenance_section():
+    st.markdown("#### 🧰 Maintenance")
+    st.caption("Runs in the background job queue, the page stays usable meanwhile.")
+    for col, kind in zip(st.columns(len(jobs.MAINTENANCE)), jobs.MAINTENANCE):
+        if col.button(kind.capitalize(), key=f"maintenance_{kind}"):
+            jobs.submit(kind, owner=st.session_state.get("userid"))
+            st.rerun()
+    for job in jobs.list_jobs(limit=10):
+        st.write(f"**#{job['id']} {job['kind']}** · {job['owner'] or 'system'} · {job['status']} · {job['created_at']}")
+        if job_status(job, f"job_{job['id']}") and job["result"]:
+            st.caption(job["result"])
+
+def metrics_section():
+    st.markdown("#### ⏱️ Performance")
+    kinds = ["all", "rerun", "page", "setup", "db", "file", "job"]
+    kind = st.selectbox("Spans", kinds, key="metrics_kind")
+    rows = metrics.snapshot(None if kind == "all" else kind)
+    if not rows:
+        st.write("Nothing recorded yet.")
+    else:
+        st.dataframe(rows[:50])   # slowest in total first
+    c1, c2, c3 = st.columns(3)
+    c1.download_button("Prometheus", metrics.prometheus(), file_name="securevault.prom", mime="text/plain")
+    c2.download_button("JSONL", metrics.jsonl(), file_name="securevault-metrics.jsonl", mime="application/json")
+    if c3.button("Reset", key="metrics_reset"):
+        metrics.reset()
+        st.rerun()
+    if metrics.PROFILE:
+        st.caption(f"Rerun profiles (folded stacks) in {metrics.PROFILE_FOLDER}/, newest first:")
+        for path in metrics.profiles(5):
+            st.write(f"• {os.path.basename(path)}")
+    else:
+        st.caption("Set SECUREVAULT_PROFILE=1 to write a sampled stack profile for every rerun.")
+
+CHANGED_WITHIN = {"Any time": None, "Last day": 1, "Last week": 7, "Last month": 30, "Last year": 365}
+
+def admin_file_browser(page_size=25):
+    st.markdown("#### 📂 User files")
+    c1, c2 = st.columns(2)
+    prefix = c1.text_input("User ID starts with", key="admin_user_prefix").strip()
+    user_sort = c2.selectbox("Sort users by", list(blob_store.USER_SORTS), key="admin_user_sort")
+    page = result_page("admin_users", (prefix, user_sort))
+    users = session_cache.get_or_load(
+        ("admin_users", None, prefix, user_sort, page),   # None: dropped whenever anyone's activity is logged
+        lambda: blob_store.usage_page(prefix, user_sort, page_size + 1, page * page_size),
+    )
+    if not users:
+        st.write("No uploads yet.")
+    for row in users[:page_size]:
+        c1, c2 = st.columns([4, 1])
+        c1.write(f"👤 **{row['owner']}** · {row['file_count']} files · {row['bytes_used'] / (1024 * 1024):.2f} MB")
+        if c2.button("Open", key=f"admin_open_{row['owner']}"):
+            st.session_state["admin_open_user"] = row["owner"]
+    page_buttons("admin_users", page, len(users) > page_size)
+
+    owner = st.session_state.get("admin_open_user")
+    if not owner:
+        return
+    st.markdown(f"##### 📁 {owner}")
+    c1, c2, c3 = st.columns(3)
+    sort = c1.selectbox("Sort files by", list(blob_store.FILE_SORTS), key="admin_file_sort")
+    min_mb = c2.number_input("Min size (MB)", min_value=0.0, value=0.0, step=1.0, key="admin_file_min_mb")
+    changed = c3.selectbox("Changed", list(CHANGED_WITHIN), key="admin_file_changed")
+    days = CHANGED_WITHIN[changed]
+    since = None
+    if days:
+        since = (datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
+    page = result_page("admin_files", (owner, sort, min_mb, changed))
+    files = blob_store.browse_files(owner, sort, int(min_mb * 1024 * 1024), since, page_size + 1, page * page_size)
+    if not files:
+        st.write("No matching files.")
+    for f in files[:page_size]:
+        st.write(f"• {f['filename']} · {f['size_bytes'] / 1024:.1f} KB · {f['modified_at']}")
+    page_buttons("admin_files", page, len(files) > page_size)
+
+@metrics.timed("page")
 def admin_page():
     with stylable_container(key="admin_card", css_styles="{}"):
         st.markdown("### 🛡️ Admin Panel")
@@ -434,24 +604,39 @@ def admin_page():
             st.warning("Admin access only.")
             return
 
+        analytics_section()
+
+        st.markdown("---")
+        maintenance_section()
+
+        st.markdown("---")
+        metrics_section()
+
+        st.markdown("---")
         st.caption("View all user folders and files.")
-        if not os.path.exists(UPLOAD_FOLDER):
-            st.write("No uploads folder yet.")
-            return
+        admin_file_browser()    # Logic for Admin Page
 
-        users = sorted(os.listdir(UPLOAD_FOLDER))
-        for u in users:
-            user_folder = os.path.join(UPLOAD_FOLDER, u)
-            if not os.path.isdir(user_folder):
-                continue
-            st.markdown(f"#### 👤 {u}")
-            files = os.listdir(user_folder)
-            if not files:
-                st.write("No files.")
-                continue
-            for f in files:
-                st.write(f"• {f}")    # Logic for Admin Page
+        st.markdown("---")
+        st.markdown("#### 🔎 Search all files")
+        query = st.text_input("File name or text", key="admin_file_search").strip()
+        if query:
+            page = result_page("admin_search", query)
+            found, has_more = file_search.search(query, page=page)
+            if not found:
+                st.write("No matching files.")
+            for row in found:
+                st.write(f"• {row['owner']} / {row['filename']}")
+            page_buttons("admin_search", page, has_more)
 
+        st.markdown("---")
+        st.markdown("#### 📜 Activity browser")
+        who = st.text_input("Filter by User ID (blank for everyone)", key="admin_activity_user").strip()
+        if st.session_state.get("admin_activity_filter") != who:
+            st.session_state["admin_activity_filter"] = who
+            st.session_state["admin_activity_cursors"] = [None]   # new filter starts from the newest page
+        activity_pager("admin_activity", userid=who or None, page_size=25, show_user=True)
+
+@metrics.timed("page")
 def dashboard():
     username = st.session_state.get("userid", "User")
     with stylable_container(key="dashboard_card", css_styles="{}"):
@@ -489,11 +674,15 @@ render_top_nav()  # Calling so that the navigation bar on top is always displaye
 
 if "userid" not in st.session_state:
     st.sidebar.title("Menu")
-    page = st.sidebar.radio("Choose Page", ["Login", "Signup"])
+    page = st.sidebar.radio("Choose Page", ["Login", "Signup", "Reset Password"])
     if page == "Login":
         login_page()
-    else:
+    elif page == "Signup":
         signup_page()
+    else:
+        reset_password_page()
 else:
-    dashboard()     # This shows login or signup if user not logged in or not.  
+    dashboard()     # This shows login or signup if user not logged in or not.
+
+metrics.end_rerun(page if "userid" not in st.session_state else selected)  # reruns cut short by st.rerun() aren't counted  
 
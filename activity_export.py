@@ -0,0 +1,154 @@
+# streaming activity exports: rows are pulled from the db in chunks and turned into
+# encoded CSV / PDF bytes as they go, so memory stays flat however big the log is
+import csv
+import datetime
+import io
+import itertools
+import zlib
+
+import activity_queries
+import retention
+
+CHUNK_ROWS = 1000
+HEADER = ["userid", "action", "details", "ts"]
+
+PAGE_WIDTH, PAGE_HEIGHT = 612, 792  # US letter, same as reportlab's letter
+MARGIN_X = 40
+LINE_HEIGHT = 12
+MAX_LINE = 120  # characters per row before it is cut off
+
+
+def _rows(filter_user=None, start=None, end=None, progress=None):
+    chunks = activity_queries.iter_activity(filter_user, start, end, CHUNK_ROWS)
+    # archived rows are all older than anything still in the hot table, so they simply follow
+    oldest = retention.oldest_hot_ts()
+    if start is None or oldest is None or start < oldest:
+        chunks = itertools.chain(chunks, retention.iter_archived(filter_user, start, end, CHUNK_ROWS))
+    for chunk in chunks:
+        yield chunk
+        if progress:
+            progress(len(chunk))  # rows done so far, for background jobs
+
+
+def stream_csv(filter_user=None, start=None, end=None, progress=None):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(HEADER)
+    for chunk in _rows(filter_user, start, end, progress):
+        for r in chunk:
+            writer.writerow([r["userid"], r["action"], r["details"], r["ts"]])
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()  # reuse the buffer, only one chunk is ever held
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")  # header only, the log was empty
+
+
+def _pdf_text(text):
+    data = text.replace("\r", " ").replace("\n", " ").encode("cp1252", errors="replace")
+    return data.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)")
+
+
+class _PdfWriter:
+    # just enough PDF to lay out lines of text: every page is written out as soon as
+    # it is full, only object offsets are kept until the xref table at the end
+    def __init__(self):
+        self.offsets = {}
+        self.pos = 0
+        self.next_obj = 5  # 1 catalog, 2 page tree, 3/4 fonts
+        self.pages = []
+
+    def _emit(self, data):
+        self.pos += len(data)
+        return data
+
+    def _obj(self, number, body):
+        self.offsets[number] = self.pos
+        return self._emit(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+
+    def start(self):
+        out = self._emit(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        out += self._obj(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+        out += self._obj(3, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+        out += self._obj(4, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>")
+        return out
+
+    def page(self, content):
+        stream = zlib.compress(content)
+        contents, page = self.next_obj, self.next_obj + 1
+        self.next_obj += 2
+        self.pages.append(page)
+        out = self._obj(contents, b"<< /Length %d /Filter /FlateDecode >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        out += self._obj(page, (
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] "
+            b"/Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> /Contents %d 0 R >>"
+        ) % (PAGE_WIDTH, PAGE_HEIGHT, contents))
+        return out
+
+    def finish(self):
+        kids = b" ".join(b"%d 0 R" % p for p in self.pages)
+        out = self._obj(2, b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(self.pages)))
+        xref = self.pos
+        lines = [b"xref\n0 %d\n" % self.next_obj, b"0000000000 65535 f \n"]
+        lines += [b"%010d 00000 n \n" % self.offsets[n] for n in range(1, self.next_obj)]
+        out += self._emit(b"".join(lines))
+        out += self._emit(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (self.next_obj, xref))
+        return out
+
+
+def stream_pdf(filter_user=None, start=None, end=None, progress=None):
+    pdf = _PdfWriter()
+    yield pdf.start()
+
+    y = PAGE_HEIGHT - 50
+    content = [b"BT /F2 16 Tf %d %d Td (SecureVault - User Activity Log) Tj ET" % (MARGIN_X, y)]
+    y -= 30
+    generated = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    content.append(b"BT /F1 10 Tf %d %d Td (%s) Tj ET" % (MARGIN_X, y, _pdf_text(f"Generated: {generated}")))
+    y -= 20
+    content.append(b"%d %d m %d %d l S" % (MARGIN_X, y, PAGE_WIDTH - 40, y))
+    y -= 20
+
+    for chunk in _rows(filter_user, start, end, progress):
+        for r in chunk:
+            line = f"{r['ts']} | {r['userid']} | {r['action']} | {r['details'] or ''}"
+            content.append(b"BT /F1 10 Tf %d %d Td (%s) Tj ET" % (MARGIN_X, y, _pdf_text(line[:MAX_LINE])))
+            y -= LINE_HEIGHT
+            if y < 60:
+                yield pdf.page(b"\n".join(content))
+                content = []
+                y = PAGE_HEIGHT - 40  # page full, send it and start the next one
+    if content:
+        yield pdf.page(b"\n".join(content))
+    yield pdf.finish()
+
+
+def gzip_stream(chunks, level=6):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits 31 = gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_activity(fmt="pdf", filter_user=None, start=None, end=None, compress=False, progress=None):
+    stream = stream_pdf if fmt == "pdf" else stream_csv
+    chunks = stream(filter_user, start, end, progress)
+    return gzip_stream(chunks) if compress else chunks
+
+
+def export_to_file(path, fmt="pdf", filter_user=None, start=None, end=None, compress=False, progress=None):
+    size = 0
+    with open(path, "wb") as f:
+        for chunk in export_activity(fmt, filter_user, start, end, compress, progress):
+            f.write(chunk)
+            size += len(chunk)
+    return size  # bytes written
+
+
+def date_range(since=None, until=None):
+    # date objects (inclusive on both ends) -> the [start, end) ts strings page_activity expects
+    start = since.isoformat() if since else None
+    end = (until + datetime.timedelta(days=1)).isoformat() if until else None
+    return start, end
@@ -0,0 +1,72 @@
+# read side of activity_log: keyset pagination over the (userid, ts) and (ts) indexes
+import vault_db
+
+COLUMNS = "id, userid, action, details, ts"
+
+
+def _filters(userid=None, start=None, end=None):
+    where = []
+    params = []
+    if userid is not None:
+        where.append("userid = ?")
+        params.append(userid)
+    if start is not None:
+        where.append("ts >= ?")
+        params.append(start)
+    if end is not None:
+        where.append("ts < ?")
+        params.append(end)
+    return where, params
+
+
+def page_activity(userid=None, cursor=None, limit=10, start=None, end=None):
+    # cursor is the (ts, id) of the last row of the previous page, None for the newest page.
+    # start/end optionally bound ts to [start, end). each page is one index range scan,
+    # so page 1000 costs the same as page 1
+    where, params = _filters(userid, start, end)
+    if cursor is not None:
+        where.append("(ts, id) < (?, ?)")
+        params.extend(cursor)
+    sql = f"SELECT {COLUMNS} FROM activity_log"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY ts DESC, id DESC LIMIT ?"
+    params.append(limit + 1)  # one extra row tells us whether there is a next page
+
+    rows = vault_db.query_all(sql, params)
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = (rows[-1]["ts"], rows[-1]["id"])
+    return rows, next_cursor
+
+
+def iter_activity(userid=None, start=None, end=None, chunk_size=1000):
+    # newest first, one short query per chunk so no connection is held between chunks
+    cursor = None
+    while True:
+        rows, cursor = page_activity(userid, cursor, chunk_size, start, end)
+        if rows:
+            yield rows
+        if cursor is None:
+            return
+
+
+def last_activity_id(userid=None):
+    # id of the newest row, cheap version stamp for caches (index seek, not a scan)
+    if userid is None:
+        row = vault_db.query_one("SELECT MAX(id) FROM activity_log")
+    else:
+        row = vault_db.query_one(
+            "SELECT id FROM activity_log WHERE userid = ? ORDER BY ts DESC, id DESC LIMIT 1", (userid,)
+        )
+    return row[0] if row else None
+
+
+def count_activity(userid=None, start=None, end=None):
+    # rows in the hot table for a filter, counted on the index (used to report export progress)
+    where, params = _filters(userid, start, end)
+    sql = "SELECT COUNT(*) FROM activity_log"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    return vault_db.query_one(sql, params)[0]
@@ -0,0 +1,133 @@
+# background writer for activity_log: callers enqueue events and return straight away,
+# a worker thread batches them into one executemany + COMMIT
+import atexit
+import datetime
+import os
+import queue
+import sys
+import threading
+import time
+
+import vault_db
+
+BATCH_SIZE = 200  # flush as soon as this many events are waiting
+MAX_LATENCY = 0.25  # ... or this many seconds after the oldest waiting event
+QUEUE_SIZE = 10000  # bounded so a stalled disk can't eat all memory
+PUT_TIMEOUT = 2.0  # how long a caller blocks on a full queue before writing inline
+SYNC = os.environ.get("SECUREVAULT_SYNC_LOG") == "1"  # write inline (tests, scripts)
+
+INSERT_SQL = "INSERT INTO activity_log (userid, action, details, ts) VALUES (?,?,?,?)"
+
+_queue = queue.Queue(maxsize=QUEUE_SIZE)
+_stop = object()
+_worker = None
+_worker_lock = threading.Lock()
+_listeners = []  # called with the set of user ids after each committed batch
+
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%d %H:%M:%S")  # same format as CURRENT_TIMESTAMP
+
+
+def _write(events):
+    with vault_db.connection() as conn:
+        conn.executemany(INSERT_SQL, events)  # one transaction for the whole batch
+    _notify({event[0] for event in events})
+
+
+def _notify(userids):
+    for listener in _listeners:
+        try:
+            listener(userids)
+        except Exception as e:
+            print(f"activity_writer: listener failed: {e}", file=sys.stderr)
+
+
+def add_listener(fn):
+    if fn not in _listeners:
+        _listeners.append(fn)
+
+
+def _write_safely(events):
+    for attempt in range(3):
+        try:
+            _write(events)
+            return
+        except Exception as e:
+            if attempt == 2:
+                print(f"activity_writer: dropped {len(events)} events: {e}", file=sys.stderr)
+            else:
+                time.sleep(0.1 * (attempt + 1))  # db locked or busy, try again shortly
+
+
+def _run():
+    while True:
+        item = _queue.get()
+        if item is _stop:
+            _queue.task_done()
+            return
+        batch = [item]
+        deadline = time.monotonic() + MAX_LATENCY
+        stopping = False
+        while len(batch) < BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = _queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is _stop:
+                stopping = True
+                break
+            batch.append(item)
+        _write_safely(batch)
+        for _ in range(len(batch) + stopping):
+            _queue.task_done()
+        if stopping:
+            return
+
+
+def _ensure_worker():
+    global _worker
+    if _worker is not None and _worker.is_alive():
+        return
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_run, name="activity-writer", daemon=True)
+            _worker.start()
+
+
+def log(userid, action, details=None):
+    event = (userid, action, details, _now())
+    if SYNC:
+        _write([event])
+        return
+    _ensure_worker()
+    try:
+        _queue.put(event, timeout=PUT_TIMEOUT)
+    except queue.Full:
+        _write_safely([event])  # backpressure: queue is full, pay for the write ourselves
+
+
+def flush():
+    if _worker is not None and _worker.is_alive():
+        _queue.join()  # returns once every queued event is committed
+
+
+def shutdown():
+    global _worker
+    if _worker is not None and _worker.is_alive():
+        _queue.put(_stop)
+        _worker.join()
+    _worker = None
+
+
+def set_sync(enabled):
+    global SYNC
+    if enabled:
+        flush()
+    SYNC = enabled
+
+
+atexit.register(shutdown)  # don't lose queued events when the server stops
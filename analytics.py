@@ -0,0 +1,150 @@
+# admin analytics read from the aggregate tables (activity_hourly, user_storage), never
+# from activity_log itself, so the dashboard costs the same whatever the size of the log.
+# the aggregates catch up on their own thread after activity batches are written, at most
+# every REFRESH_INTERVAL, so a long rollup never holds up the activity writer
+import datetime
+import sys
+import threading
+import time
+
+import activity_writer
+import retention
+import vault_db
+
+try:
+    import pandas as pd
+    PANDAS_AVAILABLE = True
+except Exception:
+    PANDAS_AVAILABLE = False    # plain dicts instead of frames, charts still draw from them
+
+REFRESH_INTERVAL = 30  # seconds between rollups triggered by new activity
+WINDOW_DAYS = 30
+
+_refresh_lock = threading.Lock()
+_last_refresh = 0.0
+_frames = {}  # (days, first hour, rollup high-water mark) -> hourly counts
+_frames_lock = threading.Lock()  # admin sessions run on separate script threads
+_wake = threading.Event()
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def refresh(force=False):
+    global _last_refresh
+    if not force and time.monotonic() - _last_refresh < REFRESH_INTERVAL:
+        return 0
+    if not _refresh_lock.acquire(blocking=force):
+        return 0  # someone else is already rolling up
+    try:
+        rolled = retention.rollup()
+        _last_refresh = time.monotonic()
+        return rolled
+    finally:
+        _refresh_lock.release()
+
+
+def _run():
+    while True:
+        _wake.wait()
+        time.sleep(max(0.0, REFRESH_INTERVAL - (time.monotonic() - _last_refresh)))  # batches arriving meanwhile share one rollup
+        _wake.clear()
+        try:
+            refresh(force=True)
+        except Exception as e:
+            print(f"analytics: rollup failed: {e}", file=sys.stderr)
+
+
+def _on_activity_written(userids):
+    # runs on the activity writer thread, so only hand the work over
+    global _worker
+    if _worker is None or not _worker.is_alive():
+        with _worker_lock:
+            if _worker is None or not _worker.is_alive():
+                _worker = threading.Thread(target=_run, name="analytics-rollup", daemon=True)
+                _worker.start()
+    _wake.set()
+
+
+activity_writer.add_listener(_on_activity_written)
+
+
+def _high_water():
+    row = vault_db.query_one("SELECT last_id FROM rollup_state WHERE name = 'activity_hourly'")
+    return row[0] if row else 0
+
+
+def _window(days):
+    end = datetime.datetime.now(datetime.timezone.utc).replace(minute=0, second=0, microsecond=0, tzinfo=None)
+    hours = days * 24
+    return end - datetime.timedelta(hours=hours - 1), hours
+
+
+def hourly_counts(days=WINDOW_DAYS):
+    # hour x action counts for the last `days` days, hours without activity filled with zeros.
+    # a DataFrame when pandas is there, otherwise {action: {hour: count}}
+    start, hours = _window(days)
+    key = (days, start, _high_water())
+    with _frames_lock:
+        if key in _frames:
+            return _frames[key]
+    rows = vault_db.query_all(
+        "SELECT hour, action, count FROM activity_hourly WHERE hour >= ?", (start.strftime("%Y-%m-%d %H:00"),)
+    )
+    if PANDAS_AVAILABLE:
+        frame = pd.DataFrame([tuple(r) for r in rows], columns=["hour", "action", "count"])
+        frame["hour"] = pd.to_datetime(frame["hour"])
+        index = pd.date_range(start, periods=hours, freq="h")
+        result = frame.pivot_table(index="hour", columns="action", values="count", aggfunc="sum", fill_value=0)
+        result = result.reindex(index, fill_value=0)
+    else:
+        result = {}
+        for r in rows:
+            result.setdefault(r["action"], {})[r["hour"]] = r["count"]
+    with _frames_lock:
+        for old in [k for k in _frames if k[0] == days]:
+            del _frames[old]  # only the newest version of each window is worth keeping
+        _frames[key] = result
+    return result
+
+
+def _action(counts, action):
+    if PANDAS_AVAILABLE:
+        return counts[action] if action in counts.columns else pd.Series(0, index=counts.index, dtype="int64")
+    return counts.get(action, {})
+
+
+def uploads_per_day(days=WINDOW_DAYS):
+    uploads = _action(hourly_counts(days), "upload")
+    if PANDAS_AVAILABLE:
+        return uploads.resample("D").sum()
+    per_day = {}
+    for hour, count in uploads.items():
+        per_day[hour[:10]] = per_day.get(hour[:10], 0) + count
+    return dict(sorted(per_day.items()))
+
+
+def login_failures_per_hour(hours=48):
+    failures = _action(hourly_counts(max(1, -(-hours // 24))), "login_failed")
+    if PANDAS_AVAILABLE:
+        return failures.iloc[-hours:]
+    return dict(sorted(failures.items())[-hours:])
+
+
+def action_totals(days=WINDOW_DAYS):
+    counts = hourly_counts(days)
+    if PANDAS_AVAILABLE:
+        return counts.sum().sort_values(ascending=False)
+    return dict(sorted(((a, sum(c.values())) for a, c in counts.items()), key=lambda t: -t[1]))
+
+
+def top_storage(limit=10):
+    return vault_db.query_all(
+        "SELECT owner, file_count, bytes_used FROM user_storage ORDER BY bytes_used DESC LIMIT ?", (limit,)
+    )
+
+
+def totals():
+    row = vault_db.query_one(
+        "SELECT (SELECT COUNT(*) FROM users), COALESCE(SUM(file_count), 0), COALESCE(SUM(bytes_used), 0) FROM user_storage"
+    )
+    return {"users": row[0], "files": row[1], "bytes": row[2]}
@@ -0,0 +1,973 @@
+# micro benchmarks for SecureVault internals, run from the project folder:
+#   python benchmark.py db
+#   python benchmark.py log
+#   python benchmark.py activity --rows 5000000
+#   python benchmark.py export
+#   python benchmark.py dedupe
+#   python benchmark.py ingest --mb 500
+#   python benchmark.py search --files 50000
+#   python benchmark.py theme
+#   python benchmark.py passwords --target-ms 250
+#   python benchmark.py retention --rows 1000000
+#   python benchmark.py analytics
+#   python benchmark.py browse --users 5000 --files 200000
+#   python benchmark.py jobs --rows 500000
+#   python benchmark.py crypto --mb 256
+#   python benchmark.py tier
+#   python benchmark.py metrics
+#   python benchmark.py pages --sessions 8 --json results.json   (drives Secure_Vault.py through AppTest)
+#   python benchmark.py compare before.json after.json
+#   python benchmark.py previews --copies 20
+import argparse
+import base64
+import io
+import json
+import logging
+import multiprocessing
+import os
+import sqlite3
+import subprocess
+import sys
+import threading
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import tracemalloc
+
+try:
+    from streamlit.testing.v1 import AppTest
+    APPTEST_AVAILABLE = True
+except Exception:
+    APPTEST_AVAILABLE = False    # the pages benchmark needs streamlit installed
+
+import activity_export
+import analytics
+import activity_queries
+import activity_writer
+import blob_codecs
+import blob_store
+import encryption
+import file_search
+import jobs
+import metrics
+import passwords
+import previews
+import retention
+import storage_tier
+import theme_assets
+import vault_db
+
+
+def _seed_db(path, users=200, rows=20000):
+    conn = sqlite3.connect(path)
+    conn.executescript(
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            userid TEXT UNIQUE,
+            password TEXT,
+            email TEXT
+        );
+        CREATE TABLE IF NOT EXISTS activity_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            userid TEXT,
+            action TEXT NOT NULL,
+            details TEXT,
+            ts DATETIME DEFAULT CURRENT_TIMESTAMP
+        );
+        """
+    )
+    conn.executemany(
+        "INSERT INTO users (userid, password, email) VALUES (?,?,?)",
+        ((f"user{i}", "x" * 64, f"user{i}@example.com") for i in range(users)),
+    )
+    conn.executemany(
+        "INSERT INTO activity_log (userid, action, details, ts) VALUES (?,?,?,datetime('now', ?))",
+        ((f"user{i % users}", "login", "User logged in", f"-{i} seconds") for i in range(rows)),
+    )
+    conn.commit()
+    conn.close()  # synthetic users + activity rows
+
+
+def _rerun_direct(path, userid):
+    def connect():
+        conn = sqlite3.connect(path)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    conn = connect()
+    conn.execute("CREATE TABLE IF NOT EXISTS activity_log (id INTEGER PRIMARY KEY AUTOINCREMENT, userid TEXT, action TEXT NOT NULL, details TEXT, ts DATETIME DEFAULT CURRENT_TIMESTAMP)")
+    conn.commit()
+    conn.close()
+    conn = connect()
+    conn.execute("SELECT userid, email FROM users WHERE userid = ?", (userid,)).fetchone()
+    conn.close()
+    conn = connect()
+    conn.execute("SELECT action, details, ts FROM activity_log WHERE userid = ? ORDER BY ts DESC LIMIT 10", (userid,)).fetchall()
+    conn.close()
+    conn = connect()
+    conn.execute("INSERT INTO activity_log (userid, action, details, ts) VALUES (?,?,?,CURRENT_TIMESTAMP)", (userid, "view", None))
+    conn.commit()
+    conn.close()  # the db work of one account page rerun, the way it was done before the pool
+
+
+def _rerun_pooled(userid):
+    vault_db.execute("CREATE TABLE IF NOT EXISTS activity_log (id INTEGER PRIMARY KEY AUTOINCREMENT, userid TEXT, action TEXT NOT NULL, details TEXT, ts DATETIME DEFAULT CURRENT_TIMESTAMP)")
+    vault_db.query_one("SELECT userid, email FROM users WHERE userid = ?", (userid,))
+    vault_db.query_all("SELECT action, details, ts FROM activity_log WHERE userid = ? ORDER BY ts DESC LIMIT 10", (userid,))
+    vault_db.execute("INSERT INTO activity_log (userid, action, details, ts) VALUES (?,?,?,CURRENT_TIMESTAMP)", (userid, "view", None))
+
+
+def _rate(fn, seconds):
+    n = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        fn(n)
+        n += 1
+    return n / (time.perf_counter() - start)
+
+
+def bench_db(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        _seed_db(path, args.users, args.rows)
+        before = _rate(lambda n: _rerun_direct(path, f"user{n % args.users}"), args.seconds)
+        vault_db.configure(path)
+        after = _rate(lambda n: _rerun_pooled(f"user{n % args.users}"), args.seconds)
+        vault_db.close_all()
+    print(f"per-call connect : {before:8.1f} reruns/s")
+    print(f"pooled + WAL     : {after:8.1f} reruns/s  ({after / before:.1f}x)")
+
+
+def _percentile(samples, pct):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+def bench_log(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        _seed_db(path, users=10, rows=0)
+        vault_db.configure(path)
+        vault_db.migrate()  # the analytics listener rolls up into tables the seed doesn't create
+        for mode, sync in (("inline", True), ("queued", False)):
+            activity_writer.set_sync(sync)
+            samples = []
+            for i in range(args.events):
+                start = time.perf_counter()
+                activity_writer.log(f"user{i % 10}", "upload", "Uploaded bench.bin")
+                samples.append(time.perf_counter() - start)
+            activity_writer.flush()
+            print(f"{mode:7s} log_activity  p50 {_percentile(samples, 50) * 1e6:8.1f} us"
+                  f"  p99 {_percentile(samples, 99) * 1e6:8.1f} us")
+        activity_writer.shutdown()
+        count = vault_db.query_one("SELECT COUNT(*) FROM activity_log")[0]
+        vault_db.close_all()
+    print(f"rows written: {count} (expected {2 * args.events})")
+
+
+def _timed(fn, repeat=20):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000  # ms per call
+
+
+def _activity_timings(args):
+    user = "user7"
+    deep = args.rows // args.users // 2  # halfway through one user's history
+    offset_sql = "SELECT id, userid, action, details, ts FROM activity_log WHERE userid = ? ORDER BY ts DESC, id DESC LIMIT 10 OFFSET ?"
+    cursor_row = vault_db.query_one(offset_sql, (user, deep))
+    cursor = (cursor_row["ts"], cursor_row["id"])
+    return {
+        "account page (newest 10)": _timed(lambda: activity_queries.page_activity(user), 5),
+        f"user page via OFFSET {deep}": _timed(lambda: vault_db.query_all(offset_sql, (user, deep)), 5),
+        "user page via keyset cursor": _timed(lambda: activity_queries.page_activity(user, cursor), 5),
+        "admin page (all users, newest)": _timed(lambda: activity_queries.page_activity(None), 5),
+    }
+
+
+def bench_activity(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        print(f"seeding {args.rows} activity rows ...")
+        _seed_db(path, args.users, args.rows)
+        vault_db.configure(path)
+        before = _activity_timings(args)
+        start = time.perf_counter()
+        vault_db.migrate()
+        print(f"migrations (index build) took {time.perf_counter() - start:.1f} s")
+        after = _activity_timings(args)
+        vault_db.close_all()
+    for name in before:
+        print(f"{name:34s} no index {before[name]:10.2f} ms   indexed {after[name]:8.3f} ms")
+
+
+def _export_peak(fmt, compress):
+    tracemalloc.start()
+    size = 0
+    start = time.perf_counter()
+    for chunk in activity_export.export_activity(fmt, compress=compress):
+        size += len(chunk)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return size, peak, elapsed
+
+
+def bench_export(args):
+    for rows in (args.rows, args.rows * 4):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "bench.db")
+            _seed_db(path, 100, rows)
+            vault_db.configure(path)
+            vault_db.migrate()
+            for fmt, compress in (("csv", False), ("csv", True), ("pdf", False)):
+                size, peak, elapsed = _export_peak(fmt, compress)
+                label = fmt + (".gz" if compress else "")
+                print(f"{rows:9d} rows {label:7s} {size / 1e6:8.2f} MB out  peak {peak / 1e6:6.2f} MB  {elapsed:6.2f} s")
+            vault_db.close_all()
+
+
+SAMPLE_SKIP = {"images", "db_exports", "uploads", "__pycache__"}
+
+
+def _sample_folders(root="."):
+    # the per-user sample folders shipped with the project (jay/, DBS/, ...)
+    folders = [e for e in os.scandir(root) if e.is_dir() and not e.name.startswith(".") and e.name not in SAMPLE_SKIP]
+    return sorted(folders, key=lambda e: e.name)
+
+
+def _use_temp_store(tmp):
+    blob_store.UPLOAD_FOLDER = os.path.join(tmp, "uploads")
+    blob_store.BLOB_FOLDER = os.path.join(blob_store.UPLOAD_FOLDER, ".blobs")
+    blob_store.TMP_FOLDER = os.path.join(blob_store.BLOB_FOLDER, "tmp")
+    previews.PREVIEW_FOLDER = os.path.join(blob_store.UPLOAD_FOLDER, ".previews")
+
+
+def bench_dedupe(args):
+    folders = _sample_folders()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        _seed_db(path, 0, 0)
+        vault_db.configure(path)
+        vault_db.migrate()
+        _use_temp_store(tmp)
+        owners = [f"{e.name}-{copy}" for copy in range(args.copies) for e in folders]
+        with vault_db.connection() as conn:
+            conn.executemany("INSERT INTO users (userid) VALUES (?)", ((o,) for o in owners))
+        files = 0
+        start = time.perf_counter()
+        for copy in range(args.copies):
+            for e in folders:
+                files += blob_store.import_folder(f"{e.name}-{copy}", e.path)  # every copy re-uploads the same sample data
+        elapsed = time.perf_counter() - start
+        logical = vault_db.query_one("SELECT SUM(size_bytes) FROM files")[0]
+        physical = blob_store.stored_bytes()
+        on_disk = sum(
+            os.path.getsize(os.path.join(d, f))
+            for d, _, names in os.walk(blob_store.BLOB_FOLDER) for f in names
+        )
+        vault_db.close_all()
+    print(f"{files} files from {len(folders)} folders x {args.copies} copies in {elapsed:.2f} s"
+          f" ({logical / elapsed / 1e6:.1f} MB/s)")
+    print(f"logical {logical / 1e6:.2f} MB  stored {physical / 1e6:.2f} MB  on disk {on_disk / 1e6:.2f} MB"
+          f"  dedupe ratio {logical / max(physical, 1):.2f}x")
+
+
+def _rss_mb():
+    with open("/proc/self/status") as f:  # Linux only, current resident set size
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def _write_random_file(path, mb):
+    block = os.urandom(1024 * 1024)
+    with open(path, "wb") as f:
+        for i in range(mb):
+            f.write(i.to_bytes(8, "little") + block[8:])  # unique blocks, nothing dedupes or compresses
+
+
+def bench_ingest(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        _seed_db(path, 1, 0)
+        vault_db.configure(path)
+        vault_db.migrate()
+        _use_temp_store(tmp)
+        sources = []
+        for n in range(args.concurrent):
+            src = os.path.join(tmp, f"upload{n}.bin")
+            _write_random_file(src, args.mb)
+            sources.append(src)
+
+        baseline = _rss_mb()
+        peak = [baseline]
+        done = threading.Event()
+
+        def sample():
+            while not done.is_set():
+                peak[0] = max(peak[0], _rss_mb())
+                time.sleep(0.01)
+
+        def upload(n):
+            with open(sources[n], "rb") as f:
+                blob_store.store_file("user0", f"upload{n}.bin", f, quota=None)
+
+        sampler = threading.Thread(target=sample)
+        sampler.start()
+        start = time.perf_counter()
+        workers = [threading.Thread(target=upload, args=(n,)) for n in range(args.concurrent)]
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+        elapsed = time.perf_counter() - start
+        done.set()
+        sampler.join()
+
+        count, stored = blob_store.usage("user0")
+        vault_db.close_all()
+    total = args.mb * args.concurrent
+    growth = peak[0] - baseline
+    print(f"{args.concurrent} x {args.mb} MB uploads stored ({count} files, {stored / 2**20:.0f} MB) in {elapsed:.2f} s")
+    print(f"RSS baseline {baseline:.1f} MB, peak {peak[0]:.1f} MB, growth {growth:.1f} MB"
+          f" ({growth / args.concurrent:.1f} MB per concurrent upload)")
+    limit = args.concurrent * (blob_store.CHUNK_SIZE / 2**20) * 4 + 16
+    if growth > limit:
+        raise SystemExit(f"FAIL: memory grew {growth:.1f} MB, expected under {limit:.0f} MB for {total} MB ingested")
+    print("OK: memory stayed bounded independent of upload size")
+
+
+def bench_search(args):
+    words = ["report", "notes", "resume", "invoice", "diagram", "budget", "draft", "photo", "thesis", "plan"]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        _seed_db(path, 2, 0)
+        vault_db.configure(path)
+        vault_db.migrate()
+        file_search.init()
+        with vault_db.connection() as conn:
+            conn.executemany(
+                "INSERT INTO files (owner, filename, size_bytes, blob_hash) VALUES (?,?,?,?)",
+                ((f"user{i % 2}", f"{words[i % 10]}_{words[(i // 10) % 10]}_{i:06d}.pdf", 1000, "0" * 64)
+                 for i in range(args.files * 2)),
+            )
+        like_sql = "SELECT filename FROM files WHERE owner = ? AND lower(filename) LIKE ? ORDER BY filename LIMIT 51"
+        for query in ("sis_dra", "invoice_plan_0012", "042"):
+            scan = _timed(lambda: vault_db.query_all(like_sql, ("user0", f"%{query}%")))
+            indexed = _timed(lambda: file_search.search(query, owner="user0"))
+            hits = len(file_search.search(query, owner="user0", page_size=10**6)[0])
+            print(f"'{query}': {hits:6d} hits  LIKE scan {scan:7.2f} ms   trigram index {indexed:7.2f} ms")
+        vault_db.close_all()
+
+
+def _theme_uncached(css_path, image_path):
+    with open(css_path) as f:
+        css = f"<style>{f.read()}</style>"
+    with open(image_path, "rb") as f:
+        encoded = base64.b64encode(f.read()).decode()
+    bg = f'<style>[data-testid="stAppViewContainer"] {{ background-image: url("data:image/jpg;base64,{encoded}"); }}</style>'
+    return css + bg  # what every rerun built and sent before theme_assets
+
+
+def _theme_cached(css_path, image_path):
+    return f"<style>{theme_assets.css(css_path)}</style><style>{theme_assets.background_css(image_path)}</style>"
+
+
+def bench_theme(args):
+    css_path, image_path = "dark.css", os.path.join("images", "dark_bg.jpg")
+    with tempfile.TemporaryDirectory() as tmp:
+        theme_assets.STATIC_FOLDER = os.path.join(tmp, "static")
+        cases = [("read + base64 each rerun", False, _theme_uncached), ("cached inline data URI", False, _theme_cached),
+                 ("cached static URL", True, _theme_cached)]
+        for label, static, build in cases:
+            theme_assets.STATIC_BACKGROUNDS = static
+            build(css_path, image_path)  # first rerun pays for preparing the assets
+            ms = _timed(lambda: build(css_path, image_path), args.reruns)
+            sent = len(build(css_path, image_path).encode())
+            print(f"{label:26s} {ms:8.3f} ms/rerun  {sent / 1024:9.1f} KB sent per rerun")
+    print(f"(Pillow {'available: backgrounds downscaled to WebP' if theme_assets.PIL_AVAILABLE else 'not installed: original images used'})")
+
+
+def bench_retention(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        _seed_db(path, args.users, 0)
+        conn = sqlite3.connect(path)
+        spacing = 365 * 86400 // args.rows or 1  # spread the rows over the last year
+        conn.executemany(
+            "INSERT INTO activity_log (userid, action, details, ts) VALUES (?,?,?,datetime('now', ?))",
+            ((f"user{i % args.users}", ("login", "upload", "download")[i % 3], "bench", f"-{i * spacing} seconds")
+             for i in range(args.rows)),
+        )
+        conn.commit()
+        conn.close()
+        vault_db.configure(path)
+        vault_db.migrate()
+        retention.ARCHIVE_FOLDER = os.path.join(tmp, "archive")
+        retention.enable_incremental_vacuum()
+        before = os.path.getsize(path)
+        start = time.perf_counter()
+        result = retention.run(args.days)
+        elapsed = time.perf_counter() - start
+        hot = vault_db.query_one("SELECT COUNT(*) FROM activity_log")[0]
+        rolled, daily_rows = vault_db.query_one("SELECT SUM(count), COUNT(*) FROM activity_daily")
+        archived = sum(os.path.getsize(os.path.join(retention.ARCHIVE_FOLDER, f)) for f in os.listdir(retention.ARCHIVE_FOLDER))
+        print(f"{result} in {elapsed:.1f} s")
+        print(f"hot rows {hot}, {daily_rows} daily rows cover {rolled} events, db {before / 2**20:.1f} MB -> "
+              f"{os.path.getsize(path) / 2**20:.1f} MB, archives {archived / 2**20:.1f} MB")
+        user_rows = vault_db.query_one("SELECT SUM(count) FROM activity_daily WHERE userid = 'user7'")[0]
+        start = time.perf_counter()
+        exported = sum(len(chunk) for chunk in activity_export._rows("user7"))
+        print(f"user7 export reads {exported} rows (rollup says {user_rows}) in {time.perf_counter() - start:.2f} s")
+        vault_db.close_all()
+
+
+def _dashboard_scans():
+    # the same numbers straight from the raw log
+    vault_db.query_all(
+        "SELECT date(ts), COUNT(*) FROM activity_log WHERE action = 'upload' AND ts >= datetime('now', '-30 days') GROUP BY 1"
+    )
+    vault_db.query_all(
+        "SELECT strftime('%Y-%m-%d %H:00', ts), COUNT(*) FROM activity_log "
+        "WHERE action = 'login_failed' AND ts >= datetime('now', '-2 days') GROUP BY 1"
+    )
+    vault_db.query_all("SELECT action, COUNT(*) FROM activity_log WHERE ts >= datetime('now', '-30 days') GROUP BY 1")
+
+
+def _dashboard_aggregates():
+    analytics._frames.clear()  # measure the queries, not the per-version frame cache
+    analytics.uploads_per_day()
+    analytics.login_failures_per_hour()
+    analytics.action_totals()
+    analytics.top_storage()
+
+
+def bench_analytics(args):
+    for rows in args.rows:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "bench.db")
+            _seed_db(path, 200, 0)
+            conn = sqlite3.connect(path)
+            spacing = 60 * 86400 // rows or 1  # two months of activity
+            conn.executemany(
+                "INSERT INTO activity_log (userid, action, details, ts) VALUES (?,?,?,datetime('now', ?))",
+                ((f"user{i % 200}", ("login", "upload", "login_failed", "download")[i % 4], "bench", f"-{i * spacing} seconds")
+                 for i in range(rows)),
+            )
+            conn.commit()
+            conn.close()
+            vault_db.configure(path)
+            vault_db.migrate()
+            start = time.perf_counter()
+            analytics.refresh(force=True)
+            rollup_s = time.perf_counter() - start
+            scans = _timed(_dashboard_scans, 3)
+            aggregates = _timed(_dashboard_aggregates, 3)
+            print(f"{rows:9d} rows: scanning the log {scans:8.1f} ms   aggregates {aggregates:6.1f} ms"
+                  f"   (one-off rollup {rollup_s:.1f} s)")
+            vault_db.close_all()
+    print(f"(pandas {'available' if analytics.PANDAS_AVAILABLE else 'not installed: plain dict series'})")
+
+
+def bench_browse(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        _seed_db(path, args.users, 0)
+        vault_db.configure(path)
+        vault_db.migrate()
+        with vault_db.connection() as conn:
+            conn.executemany(
+                "INSERT INTO files (owner, filename, size_bytes, blob_hash, uploaded_at, modified_at) "
+                "VALUES (?,?,?,?,datetime('now', ?),datetime('now', ?))",
+                ((f"user{i % args.users}", f"file{i}.txt", (i * 7919) % 10**7, "0" * 64, f"-{i} minutes", f"-{i} minutes")
+                 for i in range(args.files)),
+            )
+        whole = _timed(lambda: vault_db.query_all(
+            "SELECT owner, filename, size_bytes, modified_at FROM files ORDER BY owner, filename"), 3)
+        print(f"whole listing ({args.files} rows rendered): {whole:8.2f} ms")
+        for sort in blob_store.USER_SORTS:
+            ms = _timed(lambda: blob_store.usage_page("", sort, 26, 0))
+            print(f"users page sorted by {sort:5s}: {ms:8.3f} ms")
+        for sort in blob_store.FILE_SORTS:
+            ms = _timed(lambda: blob_store.browse_files("user42", sort, 1024 * 1024, None, 26, 0))
+            print(f"one user's files by {sort:5s}: {ms:8.3f} ms")
+        vault_db.close_all()
+
+
+def bench_jobs(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        _seed_db(path, 200, args.rows)
+        vault_db.configure(path)
+        vault_db.migrate()
+        jobs.RESULT_FOLDER = os.path.join(tmp, "results")
+        start = time.perf_counter()
+        size = activity_export.export_to_file(os.path.join(tmp, "inline.pdf"), "pdf")
+        print(f"inline PDF export: script thread busy {time.perf_counter() - start:7.2f} s ({size / 2**20:.1f} MB)")
+        jobs.start(2)
+        start = time.perf_counter()
+        job_id = jobs.submit("export", {"fmt": "pdf", "user": None, "start": None, "end": None, "compress": False})
+        submitted = time.perf_counter() - start
+        polls = []
+        while jobs.get(job_id)["status"] in jobs.ACTIVE:
+            poll_start = time.perf_counter()
+            jobs.get(job_id)
+            polls.append((time.perf_counter() - poll_start) * 1000)
+            time.sleep(0.1)
+        print(f"queued PDF export:  submit {submitted * 1000:6.2f} ms, status poll p99 {_percentile(polls, 99):.2f} ms, "
+              f"finished in {time.perf_counter() - start:.2f} s ({jobs.get(job_id)['status']})")
+        jobs.stop()
+        vault_db.close_all()
+
+
+def bench_crypto(args):
+    if not encryption.CRYPTO_AVAILABLE:
+        raise SystemExit("cryptography is not installed, nothing to measure")
+    cores = os.cpu_count() or 1
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        _seed_db(path, 1, 0)
+        vault_db.configure(path)
+        vault_db.migrate()
+        _use_temp_store(tmp)
+        encryption.KEY_FILE = os.path.join(tmp, "bench.key")
+        src = os.path.join(tmp, "upload.bin")
+        _write_random_file(src, args.mb)
+        modes = [("plaintext", False, 1), ("encrypted, 1 thread", True, 1)]
+        if cores > 1:
+            modes.append((f"encrypted, {cores} threads", True, cores))
+        for n, (label, encrypt, workers) in enumerate(modes):
+            encryption.ENABLED, encryption.WORKERS = encrypt, workers
+            baseline = _rss_mb()
+            start = time.perf_counter()
+            with open(src, "rb") as f:
+                blob_store.store_file("user0", f"upload{n}.bin", f, quota=None)
+            upload = time.perf_counter() - start
+            grew = _rss_mb() - baseline
+            start = time.perf_counter()
+            with blob_store.open_file("user0", f"upload{n}.bin") as f:
+                while f.read(blob_store.CHUNK_SIZE):
+                    pass  # streamed download, constant memory
+            download = time.perf_counter() - start
+            offsets = [(i * 7919 * 4096) % (args.mb * 2**20 - 4096) for i in range(200)]
+            ranged = _timed(lambda: [blob_store.read_range("user0", f"upload{n}.bin", o, 4096) for o in offsets], 3)
+            print(f"{label:22s} upload {args.mb / upload:7.0f} MB/s   download {args.mb / download:7.0f} MB/s   "
+                  f"4 KB range read {ranged / len(offsets):6.3f} ms   RSS +{grew:.1f} MB")
+        # encrypted text must stay out of the search index (and so out of the db file)
+        file_search.init()
+        encryption.ENABLED = True
+        secret = b"TOP SECRET salary figures 123456"
+        blob_store.store_file("user0", "secret.txt", io.BytesIO(secret), quota=None)
+        file_search.index_text("user0", "secret.txt")
+        found, _ = file_search.search("salary figures", owner="user0")
+        named, _ = file_search.search("secret", owner="user0")
+        vault_db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        with open(path, "rb") as f:
+            leaked = secret in f.read()
+        vault_db.close_all()
+        print(f"encrypted upload: found by name {bool(named)}, by content {bool(found)}, plaintext in db file {leaked}")
+        if found or leaked or not named:
+            raise SystemExit("encrypted file text reached the search index")
+    if cores == 1:
+        print("(one core here, the parallel segment mode was not measured)")
+
+
+def _read_all(owners):
+    rows = vault_db.query_all("SELECT owner, filename FROM files WHERE owner IN (%s)" % ",".join("?" * len(owners)), owners)
+    start = time.perf_counter()
+    total = sum(len(blob_store.read_file(r["owner"], r["filename"])) for r in rows)
+    return total / (time.perf_counter() - start) / 1e6
+
+
+def bench_tier(args):
+    folders = _sample_folders()
+    codecs = ["gzip"] + (["zstd"] if blob_codecs.ZSTD_AVAILABLE else [])
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        _seed_db(path, 0, 0)
+        vault_db.configure(path)
+        vault_db.migrate()
+        _use_temp_store(tmp)
+        with open(os.path.join(tmp, "report.csv"), "w") as f:  # typical compressible upload next to the samples
+            for i in range(200000):
+                f.write(f"{i},user{i % 500},upload,file{i}.pdf,{i * 37 % 100000}\n")
+        for codec in codecs:
+            owners = [f"{e.name}-{codec}" for e in folders] + [f"csv-{codec}"]
+            with vault_db.connection() as conn:
+                conn.executemany("INSERT INTO users (userid) VALUES (?)", ((o,) for o in owners))
+            for e in folders:
+                blob_store.import_folder(f"{e.name}-{codec}", e.path)
+            with open(os.path.join(tmp, "report.csv"), "rb") as f:
+                blob_store.store_file(f"csv-{codec}", f"report-{codec}.csv", f, quota=None)  # distinct name, same content
+            raw_rate = _read_all(owners)
+            vault_db.execute("UPDATE blobs SET last_access = datetime('now', '-1 year') WHERE codec = 'raw'")
+            blob_codecs.DEFAULT = codec
+            start = time.perf_counter()
+            report = storage_tier.run(days=storage_tier.COLD_DAYS, limit=100000)
+            elapsed = time.perf_counter() - start
+            logical = vault_db.query_one("SELECT SUM(size) FROM blobs")[0]
+            stored = blob_store.stored_bytes()
+            skipped = vault_db.query_one(
+                "SELECT COUNT(*) FROM blobs WHERE codec = 'raw' AND entropy > ?", (storage_tier.MAX_ENTROPY,)
+            )[0]
+            cold_rate = _read_all(owners)
+            print(f"{codec:5s} {report['checked']} cold blobs in {elapsed:.2f} s: {report['compressed']} compressed,"
+                  f" {skipped} skipped as incompressible; {logical / 1e6:.2f} MB -> {stored / 1e6:.2f} MB"
+                  f" ({logical / max(stored, 1):.2f}x)")
+            print(f"      read_file throughput raw {raw_rate:7.0f} MB/s   after tiering {cold_rate:7.0f} MB/s")
+            # next codec starts from a clean store
+            with vault_db.connection() as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                conn.execute("DELETE FROM files")
+                conn.execute("UPDATE blobs SET refcount = 0")
+                dead = blob_store._collect_garbage(conn)
+            blob_store._remove_blobs(dead)
+        vault_db.close_all()
+
+
+def bench_metrics(args):
+    # cost of the instrumentation on the pooled rerun workload, and what a profiled rerun looks like
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        _seed_db(path, args.users, args.rows)
+        rates = {}
+        for enabled in (False, True, False, True):  # alternate, so warm-up doesn't favour either
+            metrics.ENABLED = enabled
+            vault_db.configure(path)  # new connections pick the plain or the timed factory
+            rates.setdefault(enabled, []).append(_rate(lambda n: _rerun_pooled(f"user{n % args.users}"), args.seconds))
+        off, on = max(rates[False]), max(rates[True])
+        print(f"metrics off : {off:8.1f} reruns/s")
+        print(f"metrics on  : {on:8.1f} reruns/s  ({(off - on) / off * 100:+.1f}% overhead, 4 statements per rerun)")
+        for row in metrics.snapshot("db"):
+            print(f"  {row['count']:7d} x  p50 {row['p50_ms']:6.2f} ms  p99 {row['p99_ms']:6.2f} ms  {row['name']}")
+
+        metrics.PROFILE, metrics.PROFILE_FOLDER = True, os.path.join(tmp, "profiles")
+        metrics.start_rerun()
+        for n in range(2000):
+            _rerun_pooled(f"user{n % args.users}")
+        profile = metrics.end_rerun("benchmark")
+        with open(profile) as f:
+            lines = [line.rsplit(" ", 1) for line in f]
+        samples = sum(int(count) for _, count in lines)
+        print(f"profiled rerun: {samples} samples, {len(lines)} distinct stacks, hottest:")
+        for stack, count in lines[:3]:
+            print(f"  {int(count) / samples * 100:5.1f}%  ...{stack[-100:]}")
+        vault_db.close_all()
+
+
+LOAD_PASSWORD = "Load-test-1"
+PAGE_TIMEOUT = 120  # seconds one AppTest run may take before it counts as failed
+NAVIGATION = {"view_files": "📁 View Files", "account": "👤 Account", "admin": "🛡️ Admin", "upload": "📤 Upload File"}
+
+
+def _seed_pages(tmp, users, rows):
+    path = os.path.join(tmp, "load.db")
+    _seed_db(path, users, rows)
+    vault_db.configure(path)
+    vault_db.migrate()
+    _use_temp_store(tmp)
+    stored = passwords.hash_password(LOAD_PASSWORD)  # one hash for everyone, logins still verify it each time
+    vault_db.execute("UPDATE users SET password = ?", (stored,))
+    vault_db.execute("INSERT INTO users (userid, password, email) VALUES ('admin', ?, 'admin@example.com')", (stored,))
+    folders = _sample_folders()
+    for i in range(users):
+        blob_store.import_folder(f"user{i}", folders[i % len(folders)].path)  # upload tree like the sample folders
+    file_search.reindex()
+    retention.rollup()  # steady state: the dashboard only catches up on new activity
+    vault_db.close_all()
+    payloads = []
+    for e in folders[:4]:
+        for f in sorted(os.scandir(e.path), key=lambda f: f.name)[:3]:
+            if f.is_file() and f.stat().st_size < 2 * 1024 * 1024:
+                with open(f.path, "rb") as src:
+                    payloads.append((f.name, src.read()))
+    return path, payloads
+
+
+def _init_page_worker(path, tmp):
+    vault_db.configure(path)
+    _use_temp_store(tmp)
+    jobs.RESULT_FOLDER = os.path.join(tmp, "job_results")
+
+
+def _timed_run(at, samples, page):
+    start = time.perf_counter()
+    at.run(timeout=PAGE_TIMEOUT)
+    elapsed = time.perf_counter() - start
+    ok = not at.exception
+    samples.append((page, elapsed, ok))
+    return ok
+
+
+def _navigate(at, samples, page):
+    nav = next(r for r in at.sidebar.radio if r.label == "Navigation")
+    nav.set_value(NAVIGATION[page])
+    return _timed_run(at, samples, page)
+
+
+def _page_session(session):
+    # one simulated user: log in, then upload / view files / account (/ admin) a few times
+    number, userid, iterations, payloads = session
+    samples = []
+    at = AppTest.from_file("Secure_Vault.py", default_timeout=PAGE_TIMEOUT)
+    at.run()
+    a, b = at.session_state["captcha_a"], at.session_state["captcha_b"]
+    fields = {t.label: t for t in at.text_input}
+    fields["User ID"].input(userid)
+    fields["Password"].input(LOAD_PASSWORD)
+    fields[f"Solve CAPTCHA: {a} + {b} = ?"].input(str(a + b))
+    at.button[0].click()
+    if not _timed_run(at, samples, "login") or "userid" not in at.session_state:
+        samples[-1] = ("login", samples[-1][1], False)
+        return samples
+    for n in range(iterations):
+        name, data = payloads[(number + n) % len(payloads)]
+        if NAVIGATION["upload"] != next(r for r in at.sidebar.radio if r.label == "Navigation").value:
+            _navigate(at, [], "upload")  # getting back to the page isn't part of the upload
+        at.file_uploader[0].set_value((f"{n}-{name}", data, "application/octet-stream"))
+        if _timed_run(at, samples, "upload") and not any(m.value.startswith("Uploaded") for m in at.success):
+            samples[-1] = ("upload", samples[-1][1], False)  # rendered, but the file wasn't stored
+        _navigate(at, samples, "view_files")
+        _navigate(at, samples, "account")
+        if userid == "admin":
+            _navigate(at, samples, "admin")
+    return samples
+
+
+def _page_stats(samples, wall):
+    stats = {}
+    for page in sorted({s[0] for s in samples}):
+        times = [s[1] * 1000 for s in samples if s[0] == page]
+        stats[page] = {
+            "runs": len(times),
+            "errors": sum(1 for s in samples if s[0] == page and not s[2]),
+            "per_second": round(len(times) / wall, 2),
+            "mean_ms": round(sum(times) / len(times), 1),
+            "p50_ms": round(_percentile(times, 50), 1),
+            "p95_ms": round(_percentile(times, 95), 1),
+            "p99_ms": round(_percentile(times, 99), 1),
+        }
+    return stats
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+
+def bench_pages(args):
+    if not APPTEST_AVAILABLE:
+        raise SystemExit("streamlit is not installed, nothing to drive")
+    # AppTest sets up a streamlit Runtime per run and isn't thread-safe, so each concurrent
+    # session gets its own process, sharing the db and blob folder like several app servers would
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        path, payloads = _seed_pages(tmp, args.users, args.rows)
+        print(f"seeded {args.users} users, {args.rows} activity rows in {time.perf_counter() - start:.1f} s")
+        userids = ["admin"] * min(args.admins, args.sessions) + [
+            f"user{i % args.users}" for i in range(args.sessions - min(args.admins, args.sessions))
+        ]  # rate limiting allows a few logins per account, so sessions use different users
+        sessions = [(n, userid, args.iterations, payloads) for n, userid in enumerate(userids)]
+        context = multiprocessing.get_context("spawn")  # no forked copies of pool / writer threads
+        with ProcessPoolExecutor(args.sessions, mp_context=context, initializer=_init_page_worker,
+                                 initargs=(path, tmp)) as pool:
+            start = time.perf_counter()
+            samples = [s for result in pool.map(_page_session, sessions) for s in result]
+            wall = time.perf_counter() - start
+    stats = _page_stats(samples, wall)
+    print(f"{args.sessions} sessions x {args.iterations} iterations, {len(samples)} page runs in {wall:.1f} s"
+          f" ({len(samples) / wall:.1f} runs/s)")
+    for page, row in stats.items():
+        print(f"{page:11s} {row['runs']:5d} runs {row['errors']:3d} errors {row['per_second']:7.2f}/s"
+              f"  p50 {row['p50_ms']:7.1f} ms  p95 {row['p95_ms']:7.1f} ms  p99 {row['p99_ms']:7.1f} ms")
+    if args.json:
+        result = {
+            "commit": _git_commit(),
+            "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "python": sys.version.split()[0],
+            "cpus": os.cpu_count(),
+            "params": {k: getattr(args, k) for k in ("sessions", "iterations", "users", "rows", "admins")},
+            "wall_seconds": round(wall, 2),
+            "pages": stats,
+        }
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"saved to {args.json}")
+
+
+def bench_compare(args):
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+    if before.get("params") != after.get("params"):
+        print(f"warning: different parameters {before.get('params')} vs {after.get('params')}")
+    print(f"{before.get('commit')} -> {after.get('commit')}")
+    regressions = 0
+    for page in sorted(set(before["pages"]) & set(after["pages"])):
+        old, new = before["pages"][page], after["pages"][page]
+        line = []
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            change = (new[key] - old[key]) / old[key] * 100 if old[key] else 0.0
+            line.append(f"{key[:3]} {old[key]:7.1f} -> {new[key]:7.1f} ms ({change:+5.1f}%)")
+        slower = old["p95_ms"] and (new["p95_ms"] - old["p95_ms"]) / old["p95_ms"] * 100 > args.threshold
+        regressions += bool(slower)
+        print(f"{page:11s} " + "  ".join(line) + ("  REGRESSION" if slower else ""))
+    if regressions:
+        raise SystemExit(1)  # usable as a CI gate
+
+
+def bench_previews(args):
+    folders = _sample_folders()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        _seed_db(path, 0, 0)
+        vault_db.configure(path)
+        vault_db.migrate()
+        _use_temp_store(tmp)
+        logging.getLogger("pypdf").setLevel(logging.ERROR)  # the sample pdfs make it chatty
+        file_search.init()
+        owners = [f"{e.name}-{copy}" for copy in range(args.copies) for e in folders]
+        with vault_db.connection() as conn:
+            conn.executemany("INSERT INTO users (userid) VALUES (?)", ((o,) for o in owners))
+        for copy in range(args.copies):
+            for e in folders:
+                blob_store.import_folder(f"{e.name}-{copy}", e.path)
+        start = time.perf_counter()
+        made = previews.backfill(limit=len(owners) * 100)
+        print(f"previews for {sum(made.values())} files in {time.perf_counter() - start:.2f} s {made},"
+              f" cache {previews.cache_bytes() / 1024:.1f} KB")
+        pages = [blob_store.list_files(o, file_search.PAGE_SIZE) for o in owners]
+        decoded = _timed(lambda: [previews._render(o, r) for o, rows in zip(owners, pages) for r in rows], 1)
+        cached = _timed(lambda: [previews.lookup([r["blob_hash"] for r in rows]) for rows in pages], 3)
+        print(f"file page, decoding each file : {decoded / len(pages):7.2f} ms per page")
+        print(f"file page, cached previews    : {cached / len(pages):7.2f} ms per page ({decoded / cached:.0f}x)")
+        vault_db.close_all()
+
+
+def bench_passwords(args):
+    (cost, ms), results = passwords.calibrate(args.target_ms, args.scheme)
+    for c, t in results:
+        print(f"cost {c:<10d} {t:8.1f} ms per verify")
+    print(f"suggested cost for ~{args.target_ms:.0f} ms: {cost} ({ms:.0f} ms)")
+
+    stored = passwords.hash_password("correct horse")
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.burst) as sessions:  # a login burst from many sessions at once
+        list(sessions.map(lambda _: passwords.verify_password("correct horse", stored), range(args.burst)))
+    elapsed = time.perf_counter() - start
+    st = passwords.stats()
+    print(f"burst of {args.burst} logins on {st['workers']} hash workers: {elapsed:.2f} s,"
+          f" queue p50 {st['queue_ms_p50']:.0f} ms p95 {st['queue_ms_p95']:.0f} ms,"
+          f" hash p50 {st['run_ms_p50']:.0f} ms, rejected {st['rejected']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SecureVault benchmarks")
+    sub = parser.add_subparsers(dest="bench", required=True)
+
+    p = sub.add_parser("db", help="reruns/s with per-call connections vs the pool")
+    p.add_argument("--users", type=int, default=200)
+    p.add_argument("--rows", type=int, default=20000)
+    p.add_argument("--seconds", type=float, default=3.0)
+    p.set_defaults(func=bench_db)
+
+    p = sub.add_parser("log", help="log_activity latency inline vs queued")
+    p.add_argument("--events", type=int, default=5000)
+    p.set_defaults(func=bench_log)
+
+    p = sub.add_parser("activity", help="activity_log paging with and without the indexes")
+    p.add_argument("--users", type=int, default=1000)
+    p.add_argument("--rows", type=int, default=5_000_000)
+    p.set_defaults(func=bench_activity)
+
+    p = sub.add_parser("export", help="peak memory of the streaming exports at two log sizes")
+    p.add_argument("--rows", type=int, default=100000)
+    p.set_defaults(func=bench_export)
+
+    p = sub.add_parser("dedupe", help="ingest the sample user folders into the blob store")
+    p.add_argument("--copies", type=int, default=3, help="times each folder is uploaded under a new user")
+    p.set_defaults(func=bench_dedupe)
+
+    p = sub.add_parser("ingest", help="peak RSS while streaming large uploads into the store")
+    p.add_argument("--mb", type=int, default=300, help="size of each upload")
+    p.add_argument("--concurrent", type=int, default=4)
+    p.set_defaults(func=bench_ingest)
+
+    p = sub.add_parser("search", help="filename search: LIKE scan vs the trigram index")
+    p.add_argument("--files", type=int, default=50000, help="files per user")
+    p.set_defaults(func=bench_search)
+
+    p = sub.add_parser("theme", help="per-rerun cost of the theme CSS and background")
+    p.add_argument("--reruns", type=int, default=50)
+    p.set_defaults(func=bench_theme)
+
+    p = sub.add_parser("retention", help="roll up + archive a year of activity, check exports still see it all")
+    p.add_argument("--rows", type=int, default=1000000)
+    p.add_argument("--users", type=int, default=20)
+    p.add_argument("--days", type=int, default=90)
+    p.set_defaults(func=bench_retention)
+
+    p = sub.add_parser("analytics", help="admin dashboard from aggregates vs scanning activity_log")
+    p.add_argument("--rows", type=int, nargs="+", default=[100000, 1000000])
+    p.set_defaults(func=bench_analytics)
+
+    p = sub.add_parser("browse", help="admin file browser: whole listing vs one page")
+    p.add_argument("--users", type=int, default=5000)
+    p.add_argument("--files", type=int, default=200000)
+    p.set_defaults(func=bench_browse)
+
+    p = sub.add_parser("jobs", help="time a script thread spends on an export: inline vs queued")
+    p.add_argument("--rows", type=int, default=500000)
+    p.set_defaults(func=bench_jobs)
+
+    p = sub.add_parser("crypto", help="upload / download / range-read cost of at-rest encryption")
+    p.add_argument("--mb", type=int, default=256)
+    p.set_defaults(func=bench_crypto)
+
+    p = sub.add_parser("metrics", help="overhead of the timing spans, sample rerun profile")
+    p.add_argument("--users", type=int, default=200)
+    p.add_argument("--rows", type=int, default=20000)
+    p.add_argument("--seconds", type=float, default=2.0)
+    p.set_defaults(func=bench_metrics)
+
+    p = sub.add_parser("pages", help="concurrent sessions through the real pages: throughput and latency per page")
+    p.add_argument("--sessions", type=int, default=8, help="concurrent sessions (one process each)")
+    p.add_argument("--iterations", type=int, default=5, help="upload / files / account rounds per session")
+    p.add_argument("--users", type=int, default=200)
+    p.add_argument("--rows", type=int, default=100000, help="activity rows seeded")
+    p.add_argument("--admins", type=int, default=1, help="sessions that log in as admin and also load the admin page")
+    p.add_argument("--json", help="write the results here, for benchmark.py compare")
+    p.set_defaults(func=bench_pages)
+
+    p = sub.add_parser("compare", help="p50/p95/p99 per page between two pages --json results")
+    p.add_argument("before")
+    p.add_argument("after")
+    p.add_argument("--threshold", type=float, default=20.0, help="p95 growth in %% that counts as a regression")
+    p.set_defaults(func=bench_compare)
+
+    p = sub.add_parser("previews", help="file page with cached previews vs reading every file")
+    p.add_argument("--copies", type=int, default=20, help="times each sample folder is uploaded under a new user")
+    p.set_defaults(func=bench_previews)
+
+    p = sub.add_parser("tier", help="compression ratio and read cost of the cold storage tier")
+    p.set_defaults(func=bench_tier)
+
+    p = sub.add_parser("passwords", help="calibrate hashing cost and measure a login burst")
+    p.add_argument("--target-ms", type=float, default=250)
+    p.add_argument("--scheme", choices=["scrypt", "pbkdf2_sha256"], default="scrypt")
+    p.add_argument("--burst", type=int, default=20)
+    p.set_defaults(func=bench_passwords)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
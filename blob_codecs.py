@@ -0,0 +1,46 @@
+# codecs for blobs moved to the cold tier: streaming compression into a file and
+# streaming decompression out of one. zstd when the zstandard package is installed, gzip otherwise
+import gzip
+import zlib
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except Exception:
+    ZSTD_AVAILABLE = False    # cold blobs are gzipped instead
+
+SUFFIX = {"raw": "", "gzip": ".gz", "zstd": ".zst"}  # blob file name suffix per codec
+DEFAULT = "zstd" if ZSTD_AVAILABLE else "gzip"
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 10
+CHUNK_SIZE = 1024 * 1024
+
+
+def compress_stream(src, dst, codec=DEFAULT):
+    if codec == "zstd":
+        zstandard.ZstdCompressor(level=ZSTD_LEVEL).copy_stream(src, dst, read_size=CHUNK_SIZE, write_size=CHUNK_SIZE)
+        return
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)  # wbits 31 = gzip container
+    while True:
+        chunk = src.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        dst.write(compressor.compress(chunk))
+    dst.write(compressor.flush())
+
+
+def open_reader(path, codec):
+    # file-like object yielding the original bytes; forward seeks decompress and discard
+    if codec == "zstd":
+        return zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), read_size=CHUNK_SIZE, closefd=True)
+    return gzip.open(path, "rb")
+
+
+def decompress_file(path, codec):
+    parts = []
+    with open_reader(path, codec) as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                return b"".join(parts)
+            parts.append(chunk)
@@ -0,0 +1,419 @@
+# content-addressed file store: every upload is hashed while it is written, identical
+# content is kept once under uploads/.blobs/<aa>/<sha256> and the files table maps
+# (owner, filename) to a blob. rename and delete only touch metadata.
+# with SECUREVAULT_ENCRYPT=1 new blobs are written encrypted (see encryption.py), blobs
+# nobody has read for a while get compressed by storage_tier.py (<sha256>.gz / .zst).
+import hashlib
+import mimetypes
+import os
+import sqlite3
+import sys
+import tempfile
+
+import blob_codecs
+import encryption
+import metrics
+import vault_db
+
+UPLOAD_FOLDER = os.environ.get("SECUREVAULT_UPLOADS", "uploads")
+BLOB_FOLDER = os.path.join(UPLOAD_FOLDER, ".blobs")
+TMP_FOLDER = os.path.join(BLOB_FOLDER, "tmp")
+CHUNK_SIZE = 1024 * 1024  # bytes hashed / written per step
+QUOTA_BYTES = 200 * 1024 * 1024  # per user
+
+
+class QuotaExceededError(Exception):
+    pass
+
+
+def blob_path(blob_hash, codec="raw"):
+    return os.path.join(BLOB_FOLDER, blob_hash[:2], blob_hash + blob_codecs.SUFFIX[codec])
+
+
+def _fsync_dir(path):
+    if os.name != "posix":
+        return  # directories can't be opened for fsync on Windows
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _write_temp(stream, limit=None, owner=None):
+    # one fixed-size chunk in memory at a time: hash, size and quota are all
+    # worked out while streaming, the temp file is fsynced before anyone can see it.
+    # with an owner the content goes through the segment encryptor on its way to disk
+    os.makedirs(TMP_FOLDER, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=TMP_FOLDER)
+    try:
+        with os.fdopen(fd, "wb") as out:
+            sink = encryption.Encryptor(owner, out) if owner is not None else out
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if limit is not None and size > limit:
+                    raise QuotaExceededError(f"upload is over the {QUOTA_BYTES // (1024 * 1024)} MB storage limit")
+                digest.update(chunk)
+                sink.write(chunk)
+            stored = sink.close() if owner is not None else size
+            out.flush()
+            os.fsync(out.fileno())
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return tmp_path, digest.hexdigest(), size, stored  # hash and sizes are known without a second read
+
+
+def _unref(conn, blob_hash):
+    conn.execute("UPDATE blobs SET refcount = refcount - 1 WHERE hash = ?", (blob_hash,))
+
+
+def _collect_garbage(conn, hashes=None):
+    # drops the rows of unreferenced blobs inside the writer's transaction, so no upload can
+    # re-reference one while it goes; only the given hashes are looked at (None = all of them).
+    # returns (hash, codec) pairs whose files _remove_blobs deletes once this has committed
+    if hashes is None:
+        dead = conn.execute("SELECT hash, codec FROM blobs WHERE refcount <= 0").fetchall()
+    else:
+        dead = [
+            row for blob_hash in set(hashes)
+            for row in conn.execute("SELECT hash, codec FROM blobs WHERE hash = ? AND refcount <= 0", (blob_hash,))
+        ]
+    conn.executemany("DELETE FROM blobs WHERE hash = ?", [(row["hash"],) for row in dead])
+    return [(row["hash"], row["codec"]) for row in dead]
+
+
+def _remove_blobs(dead):
+    # after the commit, so a rollback never leaves rows pointing at deleted files. the lock is taken
+    # again so a re-upload of the same content that slipped in meanwhile keeps its new copy
+    if not dead:
+        return
+    with vault_db.connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        for blob_hash, codec in dead:
+            row = conn.execute("SELECT codec FROM blobs WHERE hash = ?", (blob_hash,)).fetchone()
+            if row is not None and row["codec"] == codec:
+                continue
+            try:
+                os.remove(blob_path(blob_hash, codec))
+            except FileNotFoundError:
+                pass
+
+
+def _remaining_quota(owner, filename, quota):
+    _, used = usage(owner)
+    existing = get_file(owner, filename)
+    if existing is not None:
+        used -= existing["size_bytes"]  # re-uploading a name replaces it, its old size is freed
+    return max(quota - used, 0)
+
+
+@metrics.timed("file")
+def store_file(owner, filename, stream, mime_type=None, quota=QUOTA_BYTES):
+    limit = _remaining_quota(owner, filename, quota) if quota is not None else None
+    encrypt = encryption.ENABLED
+    tmp_path, blob_hash, size, stored = _write_temp(stream, limit, owner if encrypt else None)
+    if encrypt:
+        blob_hash = encryption.blob_id(owner, blob_hash)  # per-user name, dedupe only within this owner's files
+    mime_type = mime_type or mimetypes.guess_type(filename)[0]
+    dead = []
+    try:
+        with vault_db.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")  # serialises against garbage collection
+            if quota is not None and size > _remaining_quota(owner, filename, quota):
+                # checked again under the lock, two uploads running at once may each have fit alone
+                raise QuotaExceededError(f"upload is over the {QUOTA_BYTES // (1024 * 1024)} MB storage limit")
+            known = conn.execute("SELECT codec FROM blobs WHERE hash = ?", (blob_hash,)).fetchone()
+            if known is not None and os.path.exists(blob_path(blob_hash, known["codec"])):
+                os.remove(tmp_path)  # same content already stored (maybe compressed), keep one copy
+            else:
+                path = blob_path(blob_hash)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)  # atomic, readers see the whole blob or nothing
+                _fsync_dir(os.path.dirname(path))
+                known = None  # written fresh, the row describes this raw copy from now on
+            conn.execute(
+                "INSERT INTO blobs (hash, size, stored_size, encrypted, refcount, last_access) "
+                "VALUES (?,?,?,?,1,CURRENT_TIMESTAMP) "
+                "ON CONFLICT(hash) DO UPDATE SET refcount = refcount + 1, last_access = CURRENT_TIMESTAMP",
+                (blob_hash, size, stored, int(encrypt)),
+            )
+            if known is None:
+                conn.execute(
+                    "UPDATE blobs SET codec = 'raw', stored_size = ?, encrypted = ? WHERE hash = ?",
+                    (stored, int(encrypt), blob_hash),
+                )
+            old = conn.execute(
+                "SELECT blob_hash FROM files WHERE owner = ? AND filename = ?", (owner, filename)
+            ).fetchone()
+            if old is not None:
+                _unref(conn, old["blob_hash"])  # same name uploaded again, replaces the old content
+            conn.execute(
+                "INSERT INTO files (owner, filename, size_bytes, uploaded_at, modified_at, mime_type, blob_hash) "
+                "VALUES (?,?,?,CURRENT_TIMESTAMP,CURRENT_TIMESTAMP,?,?) "
+                "ON CONFLICT(owner, filename) DO UPDATE SET size_bytes = excluded.size_bytes, "
+                "modified_at = excluded.modified_at, mime_type = excluded.mime_type, blob_hash = excluded.blob_hash",
+                (owner, filename, size, mime_type, blob_hash),
+            )
+            if old is not None:
+                dead = _collect_garbage(conn, [old["blob_hash"]])
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    _remove_blobs(dead)
+    return blob_hash, size
+
+
+def get_file(owner, filename):
+    return vault_db.query_one(
+        "SELECT filename, size_bytes, uploaded_at, modified_at, mime_type, blob_hash FROM files WHERE owner = ? AND filename = ?",
+        (owner, filename),
+    )
+
+
+def _locate(owner, filename):
+    row = vault_db.query_one(
+        "SELECT f.size_bytes, f.blob_hash, b.encrypted, b.codec, b.last_access < datetime('now', '-1 day') AS stale "
+        "FROM files f JOIN blobs b ON b.hash = f.blob_hash WHERE f.owner = ? AND f.filename = ?",
+        (owner, filename),
+    )
+    if row is None:
+        raise FileNotFoundError(filename)
+    if row["stale"]:  # at most one write a day per blob, enough to tell hot from cold
+        vault_db.execute("UPDATE blobs SET last_access = CURRENT_TIMESTAMP WHERE hash = ?", (row["blob_hash"],))
+    return row
+
+
+def _with_blob(owner, filename, fn):
+    # fn(row, path); a blob compressed between the lookup and the open is looked up once more
+    row = _locate(owner, filename)
+    try:
+        return fn(row, blob_path(row["blob_hash"], row["codec"]))
+    except FileNotFoundError:
+        row = _locate(owner, filename)
+        return fn(row, blob_path(row["blob_hash"], row["codec"]))
+
+
+def _open(owner, row, path):
+    if row["encrypted"]:
+        return encryption.open_reader(owner, path, row["size_bytes"])
+    if row["codec"] != "raw":
+        return blob_codecs.open_reader(path, row["codec"])  # decompressed as it is read
+    return open(path, "rb")
+
+
+@metrics.timed("file")
+def open_file(owner, filename):
+    return _with_blob(owner, filename, lambda row, path: _open(owner, row, path))
+
+
+def _read(owner, row, path):
+    if row["encrypted"]:
+        return encryption.decrypt_file(owner, path, row["size_bytes"])
+    if row["codec"] != "raw":
+        return blob_codecs.decompress_file(path, row["codec"])
+    with open(path, "rb") as f:
+        return f.read()  # a full read into memory, open_file streams instead
+
+
+@metrics.timed("file")
+def read_file(owner, filename):
+    # whole content of one file in memory, only called once a download is actually clicked
+    return _with_blob(owner, filename, lambda row, path: _read(owner, row, path))
+
+
+@metrics.timed("file")
+def read_range(owner, filename, offset, length):
+    # encrypted blobs only decrypt the segments covering [offset, offset + length)
+    with open_file(owner, filename) as f:
+        f.seek(offset)
+        return f.read(length)
+
+
+def list_files(owner, limit=-1, offset=0):
+    return vault_db.query_all(
+        "SELECT filename, size_bytes, uploaded_at, modified_at, mime_type, blob_hash FROM files "
+        "WHERE owner = ? ORDER BY filename LIMIT ? OFFSET ?",
+        (owner, limit, offset),
+    )
+
+
+# admin browser orderings, each backed by an index so a page reads only its own rows
+FILE_SORTS = {"name": "filename", "size": "size_bytes DESC, filename", "date": "modified_at DESC, filename"}
+USER_SORTS = {"name": "owner", "size": "bytes_used DESC, owner", "files": "file_count DESC, owner"}
+
+
+def browse_files(owner, sort="name", min_size=0, since=None, limit=50, offset=0):
+    return vault_db.query_all(
+        "SELECT filename, size_bytes, uploaded_at, modified_at, mime_type FROM files "
+        f"WHERE owner = ? AND size_bytes >= ? AND modified_at >= ? ORDER BY {FILE_SORTS[sort]} LIMIT ? OFFSET ?",
+        (owner, min_size, since or "", limit, offset),
+    )
+
+
+def usage(owner):
+    row = vault_db.query_one("SELECT file_count, bytes_used FROM user_storage WHERE owner = ?", (owner,))
+    return (row[0], row[1]) if row else (0, 0)  # file count, logical bytes (kept by triggers on files)
+
+
+def usage_page(prefix="", sort="name", limit=50, offset=0):
+    # one page of per-user totals, optionally only owners starting with prefix
+    where, params = "+file_count > 0", []  # unary + keeps the planner off the file_count index for this filter
+    if prefix:  # without one, the planner can walk the sort column's index instead
+        where += " AND owner >= ? AND owner < ?"
+        params = [prefix, prefix + "\U0010ffff"]
+    return vault_db.query_all(
+        f"SELECT owner, file_count, bytes_used FROM user_storage WHERE {where} ORDER BY {USER_SORTS[sort]} LIMIT ? OFFSET ?",
+        (*params, limit, offset),
+    )
+
+
+def rename_file(owner, filename, new_name):
+    if new_name == filename:
+        return
+    with vault_db.connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")  # check and update together, against other renames / uploads
+        if conn.execute("SELECT 1 FROM files WHERE owner = ? AND filename = ?", (owner, new_name)).fetchone():
+            raise FileExistsError(new_name)
+        try:
+            conn.execute(
+                "UPDATE files SET filename = ?, modified_at = CURRENT_TIMESTAMP WHERE owner = ? AND filename = ?",
+                (new_name, owner, filename),
+            )
+        except sqlite3.IntegrityError:
+            raise FileExistsError(new_name) from None  # the unique index has the last word
+
+
+def delete_file(owner, filename):
+    with vault_db.connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute("SELECT blob_hash FROM files WHERE owner = ? AND filename = ?", (owner, filename)).fetchone()
+        if row is None:
+            raise FileNotFoundError(filename)
+        conn.execute("DELETE FROM files WHERE owner = ? AND filename = ?", (owner, filename))
+        _unref(conn, row["blob_hash"])
+        dead = _collect_garbage(conn, [row["blob_hash"]])
+    _remove_blobs(dead)
+
+
+def physical_usage(owner):
+    # bytes on disk behind this user's files: compressed / encrypted sizes, each blob counted once
+    row = vault_db.query_one(
+        "SELECT COALESCE(SUM(stored_size), 0) FROM blobs WHERE hash IN (SELECT blob_hash FROM files WHERE owner = ?)",
+        (owner,),
+    )
+    return row[0]
+
+
+def stored_bytes():
+    row = vault_db.query_one("SELECT COALESCE(SUM(stored_size), 0) FROM blobs")
+    return row[0]  # physical bytes on disk after dedupe
+
+
+def import_folder(owner, folder, remove=False):
+    imported = 0
+    for entry in sorted(os.scandir(folder), key=lambda e: e.name):
+        if not entry.is_file():
+            continue
+        with open(entry.path, "rb") as f:
+            store_file(owner, entry.name, f, quota=None)  # existing data is imported as-is
+        if remove:
+            os.remove(entry.path)
+        imported += 1
+    return imported
+
+
+def import_legacy_uploads():
+    # files saved as uploads/<userid>/<name> before the blob store existed
+    if not os.path.isdir(UPLOAD_FOLDER):
+        return 0
+    imported = 0
+    users = {r["userid"] for r in vault_db.query_all("SELECT userid FROM users")}
+    for entry in os.scandir(UPLOAD_FOLDER):
+        if entry.is_dir() and entry.name in users:  # .blobs and folders of unknown users are left alone
+            imported += import_folder(entry.name, entry.path, remove=True)
+    return imported
+
+
+def reconcile(fix=True):
+    # catches drift between the counters, the refcounts and what is actually on disk
+    report = {"storage": 0, "refcounts": 0, "missing_blobs": 0, "orphan_blobs": 0, "size_mismatch": 0}
+    with vault_db.connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        wrong = conn.execute(
+            """
+            SELECT owner, SUM(n) AS n, SUM(b) AS b FROM (
+                SELECT owner, COUNT(*) AS n, COALESCE(SUM(size_bytes), 0) AS b, 0 AS sn, 0 AS sb FROM files GROUP BY owner
+                UNION ALL
+                SELECT owner, 0, 0, file_count, bytes_used FROM user_storage
+            ) GROUP BY owner HAVING SUM(n) != SUM(sn) OR SUM(b) != SUM(sb)
+            """
+        ).fetchall()
+        report["storage"] = len(wrong)
+        if fix:
+            conn.executemany(
+                "INSERT OR REPLACE INTO user_storage (owner, file_count, bytes_used) VALUES (?,?,?)",
+                [(r["owner"], r["n"], r["b"]) for r in wrong],
+            )
+
+        refs = conn.execute(
+            """
+            SELECT b.hash, b.refcount, COUNT(f.id) AS actual FROM blobs b
+            LEFT JOIN files f ON f.blob_hash = b.hash GROUP BY b.hash HAVING b.refcount != actual
+            """
+        ).fetchall()
+        report["refcounts"] = len(refs)
+        if fix:
+            conn.executemany("UPDATE blobs SET refcount = ? WHERE hash = ?", [(r["actual"], r["hash"]) for r in refs])
+
+        known = {}
+        for r in conn.execute("SELECT hash, codec, stored_size FROM blobs"):
+            known[os.path.basename(blob_path(r["hash"], r["codec"]))] = r["stored_size"]
+            try:
+                if os.path.getsize(blob_path(r["hash"], r["codec"])) != r["stored_size"]:
+                    report["size_mismatch"] += 1
+            except FileNotFoundError:
+                report["missing_blobs"] += 1
+        for dirpath, _, names in os.walk(BLOB_FOLDER):
+            if os.path.abspath(dirpath) == os.path.abspath(TMP_FOLDER):
+                continue
+            for name in names:
+                if name not in known:
+                    report["orphan_blobs"] += 1
+                    if fix:
+                        os.remove(os.path.join(dirpath, name))
+        dead = _collect_garbage(conn) if fix else []
+    _remove_blobs(dead)
+    return report
+
+
+_ready = False
+
+
+def init():
+    global _ready
+    if _ready:
+        return
+    if encryption.ENABLED and not encryption.CRYPTO_AVAILABLE:
+        raise RuntimeError("SECUREVAULT_ENCRYPT=1 needs the cryptography package (pip install cryptography)")
+    vault_db.migrate()
+    os.makedirs(BLOB_FOLDER, exist_ok=True)
+    import_legacy_uploads()
+    _ready = True
+
+
+if __name__ == "__main__":
+    init()
+    if len(sys.argv) == 4 and sys.argv[1] == "import":
+        count = import_folder(sys.argv[2], sys.argv[3])
+        print(f"Imported {count} files for {sys.argv[2]}")
+    elif len(sys.argv) >= 2 and sys.argv[1] == "reconcile":
+        print(reconcile(fix="--dry-run" not in sys.argv))
+    else:
+        print("usage: python blob_store.py import <userid> <folder>")
+        print("       python blob_store.py reconcile [--dry-run]")
@@ -0,0 +1,216 @@
+# optional at-rest encryption for the blob store (SECUREVAULT_ENCRYPT=1, needs the
+# cryptography package). a blob is a small header followed by SEGMENT_SIZE segments, each
+# sealed with AES-256-GCM under a key derived for that file from its owner's key. files of
+# any size encrypt and decrypt in constant memory, a range read only opens the segments it
+# touches, and segments can be sealed / opened on several cores at once.
+# the nonce carries the segment number and a last-segment flag, so reordered, swapped or
+# truncated segments fail authentication.
+import base64
+import hashlib
+import hmac
+import io
+import os
+import secrets
+import struct
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from cryptography.exceptions import InvalidTag
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+    CRYPTO_AVAILABLE = True
+except Exception:
+    CRYPTO_AVAILABLE = False    # encryption can't be turned on, plaintext blobs only
+
+ENABLED = os.environ.get("SECUREVAULT_ENCRYPT") == "1"
+KEY_FILE = os.environ.get("SECUREVAULT_KEY_FILE", "securevault.key")
+SEGMENT_SIZE = 64 * 1024
+TAG_BYTES = 16
+SALT_BYTES = 16
+HEADER = struct.Struct(">4sI16s")  # magic, segment size, per-file salt
+MAGIC = b"SVE1"
+WORKERS = int(os.environ.get("SECUREVAULT_CRYPTO_WORKERS", str(os.cpu_count() or 1)))
+BATCH_SEGMENTS = 16  # segments handed to each worker per round, bounds memory in parallel mode
+
+
+class DecryptionError(Exception):
+    pass
+
+
+_master = None
+_lock = threading.Lock()
+_executor = None
+
+
+def _master_key():
+    # SECUREVAULT_MASTER_KEY (base64, 32 bytes) or a key file created with 0600 on first use
+    global _master
+    with _lock:
+        if _master is None:
+            if os.environ.get("SECUREVAULT_MASTER_KEY"):
+                _master = base64.b64decode(os.environ["SECUREVAULT_MASTER_KEY"])
+            else:
+                try:
+                    fd = os.open(KEY_FILE, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+                    with os.fdopen(fd, "wb") as f:
+                        f.write(base64.b64encode(secrets.token_bytes(32)))
+                        f.flush()
+                        os.fsync(f.fileno())
+                except FileExistsError:
+                    pass  # another process made it first, use theirs
+                with open(KEY_FILE, "rb") as f:
+                    _master = base64.b64decode(f.read().strip())
+            if len(_master) != 32:
+                raise ValueError("master key must be 32 bytes")
+        return _master
+
+
+def _pool():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="crypto")
+        return _executor
+
+
+def _derive(key, label, data=b""):
+    return hmac.new(key, b"securevault/" + label + b"/" + data, hashlib.sha256).digest()
+
+
+def user_key(owner):
+    return _derive(_master_key(), b"user", owner.encode())
+
+
+def blob_id(owner, content_hash):
+    # encrypted blobs are named by a keyed hash: one user's identical uploads still share a blob,
+    # but the name says nothing about the content and two users never share one
+    return _derive(user_key(owner), b"blob-id", bytes.fromhex(content_hash)).hex()
+
+
+def _nonce(index, final):
+    return struct.pack(">QI", index, 1 if final else 0)
+
+
+def _segments(plain_size, segment_size):
+    return max(1, -(-plain_size // segment_size))  # an empty file is one empty, sealed segment
+
+
+def _map(fn, items, workers):
+    if workers > 1 and len(items) > 1:
+        return list(_pool().map(fn, items))
+    return [fn(item) for item in items]
+
+
+class Encryptor:
+    # file-like sink: write() plaintext in any sizes, close() seals the last segment
+    def __init__(self, owner, out, workers=None):
+        self.workers = WORKERS if workers is None else workers
+        salt = secrets.token_bytes(SALT_BYTES)
+        self.aead = AESGCM(_derive(user_key(owner), b"segment-key", salt))
+        self.out = out
+        self.index = 0
+        self.buffer = bytearray()
+        self.size = HEADER.size
+        out.write(HEADER.pack(MAGIC, SEGMENT_SIZE, salt))
+
+    def _seal(self, count, final=False):
+        pieces = [bytes(self.buffer[i * SEGMENT_SIZE:(i + 1) * SEGMENT_SIZE]) for i in range(count)]
+        del self.buffer[:count * SEGMENT_SIZE]
+        last = self.index + count - 1
+        jobs = [(self.index + i, piece, final and self.index + i == last) for i, piece in enumerate(pieces)]
+        for sealed in _map(lambda job: self.aead.encrypt(_nonce(job[0], job[2]), job[1], None), jobs, self.workers):
+            self.out.write(sealed)
+            self.size += len(sealed)
+        self.index += count
+
+    def write(self, data):
+        self.buffer += data
+        ready = (len(self.buffer) - 1) // SEGMENT_SIZE  # the newest segment may still be the last one
+        if ready >= BATCH_SEGMENTS * max(self.workers, 1):
+            self._seal(ready)
+
+    def close(self):
+        self._seal(max(0, (len(self.buffer) - 1) // SEGMENT_SIZE))
+        self._seal(1, final=True)  # whatever is left, possibly nothing, closes the stream
+        return self.size
+
+
+class DecryptingReader(io.RawIOBase):
+    # seekable plaintext view of one encrypted blob; only the segments read are decrypted
+    def __init__(self, owner, f, plain_size):
+        magic, self.segment_size, salt = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC:
+            raise DecryptionError("not an encrypted blob")
+        self.aead = AESGCM(_derive(user_key(owner), b"segment-key", salt))
+        self.f = f
+        self.plain_size = plain_size
+        self.count = _segments(plain_size, self.segment_size)
+        self.pos = 0
+        self.cached = (None, b"")
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def _open(self, index, data):
+        try:
+            return self.aead.decrypt(_nonce(index, index == self.count - 1), data, None)
+        except InvalidTag:
+            raise DecryptionError(f"segment {index} failed authentication") from None
+
+    def _read_sealed(self, first, count):
+        stride = self.segment_size + TAG_BYTES
+        self.f.seek(HEADER.size + first * stride)
+        data = self.f.read(count * stride)
+        return [data[i * stride:(i + 1) * stride] for i in range(count)]
+
+    def segment(self, index):
+        if self.cached[0] != index:
+            self.cached = (index, self._open(index, self._read_sealed(index, 1)[0]))
+        return self.cached[1]
+
+    def readinto(self, b):
+        if self.pos >= self.plain_size:
+            return 0
+        index, offset = divmod(self.pos, self.segment_size)
+        plain = self.segment(index)
+        n = min(len(b), len(plain) - offset, self.plain_size - self.pos)
+        b[:n] = plain[offset:offset + n]
+        self.pos += n
+        return n
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self.pos, io.SEEK_END: self.plain_size}[whence]
+        self.pos = max(0, base + offset)
+        return self.pos
+
+    def tell(self):
+        return self.pos
+
+    def read_all(self, workers=None):
+        # whole plaintext, segments opened a batch at a time (in parallel when there are cores for it)
+        workers = WORKERS if workers is None else workers
+        out = bytearray()
+        batch = BATCH_SEGMENTS * max(workers, 1)
+        for first in range(0, self.count, batch):
+            sealed = self._read_sealed(first, min(batch, self.count - first))
+            jobs = [(first + i, data) for i, data in enumerate(sealed)]
+            for plain in _map(lambda job: self._open(*job), jobs, workers):
+                out += plain
+        return bytes(out)
+
+    def close(self):
+        if not self.closed:
+            self.f.close()
+        super().close()
+
+
+def open_reader(owner, path, plain_size):
+    return io.BufferedReader(DecryptingReader(owner, open(path, "rb"), plain_size), buffer_size=SEGMENT_SIZE)
+
+
+def decrypt_file(owner, path, plain_size, workers=None):
+    with DecryptingReader(owner, open(path, "rb"), plain_size) as reader:
+        return reader.read_all(workers)
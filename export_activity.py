@@ -1,42 +1,31 @@
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
-import sqlite3
+import argparse
+import datetime
+
+import activity_export
+import vault_db
 
 DB = "securevault.db"
 OUTPUT = "activity_log.pdf"
 
-def export_to_pdf():
-    conn = sqlite3.connect(DB)
-    cur = conn.cursor()
-
-    cur.execute("SELECT userid, action, details, ts FROM activity_log ORDER BY ts DESC")
-    rows = cur.fetchall()
-    conn.close() # gets activity log data 
-
-    c = canvas.Canvas(OUTPUT, pagesize=letter)
-    width, height = letter   # Create a PDF with specified page size
-
-    x = 40
-    y = height - 50 # text starting point
-
-    c.setFont("Helvetica-Bold", 16)
-    c.drawString(x, y, "SecureVault - User Activity Log")
-    y -= 40  # PDf title and font 
-
-    c.setFont("Helvetica", 10) # font fo records
-
-    for row in rows:
-        line = f"User: {row[0]} | Action: {row[1]} | Details: {row[2]} | Time: {row[3]}"
-        c.drawString(x, y, line)
-        y -= 15 # input all details in puf
-
-        if y < 40:  
-            c.showPage()
-            c.setFont("Helvetica", 10)
-            y = height - 40  # if page is over this creates a new page
-
-    c.save()
-    print("PDF exported successfully →", OUTPUT)  # saves pdf with filename specified above
+def export_to_pdf(output=OUTPUT, fmt="pdf", user=None, since=None, until=None, compress=False):
+    vault_db.configure(DB)
+    start, end = activity_export.date_range(since, until)  # optional date range filter
+    size = activity_export.export_to_file(output, fmt, user, start, end, compress)  # rows are streamed page by page into the file
+    print("PDF exported successfully →" if fmt == "pdf" else "CSV exported successfully →", output, f"({size} bytes)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the SecureVault activity log")
+    parser.add_argument("--csv", action="store_true", help="write CSV instead of PDF")
+    parser.add_argument("--gzip", action="store_true", help="gzip the output")
+    parser.add_argument("--user", help="only this user's activity")
+    parser.add_argument("--since", type=datetime.date.fromisoformat, help="YYYY-MM-DD, inclusive")
+    parser.add_argument("--until", type=datetime.date.fromisoformat, help="YYYY-MM-DD, inclusive")
+    parser.add_argument("--output", help="output file name")
+    args = parser.parse_args()
+
+    fmt = "csv" if args.csv else "pdf"
+    output = args.output or f"activity_log.{fmt}" + (".gz" if args.gzip else "")
+    export_to_pdf(output, fmt, args.user, args.since, args.until, args.gzip)
 
 if __name__ == "__main__":
-    export_to_pdf()
\ No newline at end of file
+    main()
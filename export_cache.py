@@ -0,0 +1,57 @@
+# in-memory LRU of finished export files, shared by every session in the process.
+# keys include the newest activity id, so a new log row makes old entries unreachable
+# and they simply age out
+import os
+import threading
+from collections import OrderedDict
+
+MAX_BYTES = int(os.environ.get("SECUREVAULT_EXPORT_CACHE_MB", "64")) * 1024 * 1024
+MAX_ENTRIES = 256
+MAX_ITEM_BYTES = MAX_BYTES // 4  # one huge export shouldn't flush everything else
+
+_entries = OrderedDict()
+_size = 0
+_lock = threading.Lock()
+stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+
+def get(key):
+    with _lock:
+        data = _entries.get(key)
+        if data is None:
+            stats["misses"] += 1
+            return None
+        _entries.move_to_end(key)  # most recently used goes last
+        stats["hits"] += 1
+        return data
+
+
+def put(key, data):
+    global _size
+    if len(data) > MAX_ITEM_BYTES:
+        return  # too big to be worth keeping, caller still has its copy
+    with _lock:
+        old = _entries.pop(key, None)
+        if old is not None:
+            _size -= len(old)
+        _entries[key] = data
+        _size += len(data)
+        while _size > MAX_BYTES or len(_entries) > MAX_ENTRIES:
+            _, evicted = _entries.popitem(last=False)
+            _size -= len(evicted)
+            stats["evictions"] += 1
+
+
+def get_or_create(key, build):
+    data = get(key)
+    if data is None:
+        data = build()
+        put(key, data)
+    return data
+
+
+def clear():
+    global _size
+    with _lock:
+        _entries.clear()
+        _size = 0
@@ -0,0 +1,211 @@
+# file search over names (and extracted text of txt/docx/pdf) using an FTS5 trigram
+# index, so substring and prefix queries don't scan the user's whole file list
+import io
+import re
+import sqlite3
+import sys
+import zipfile
+
+import blob_store
+import metrics
+import vault_db
+
+try:
+    from pypdf import PdfReader
+    PYPDF_AVAILABLE = True
+except Exception:
+    PYPDF_AVAILABLE = False    # pdf text is skipped, names are still searchable
+
+PAGE_SIZE = 50
+MAX_TEXT = 64 * 1024  # characters of extracted text indexed per file
+MAX_EXTRACT_BYTES = 20 * 1024 * 1024  # bigger documents are indexed by name only
+PDF_PAGES = 3
+
+FTS_AVAILABLE = False
+
+# owner is indexed too, so a user's search is narrowed inside MATCH rather than after it
+CREATE_FTS = "CREATE VIRTUAL TABLE IF NOT EXISTS {name} USING fts5(filename, body, owner, tokenize='trigram')"
+SETUP = (
+    CREATE_FTS.format(name="files_fts"),
+    # names follow the files table; body is filled in by index_text() after upload
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_files_fts_insert AFTER INSERT ON files BEGIN
+        INSERT INTO files_fts (rowid, filename, body, owner) VALUES (NEW.id, NEW.filename, '', NEW.owner);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_files_fts_delete AFTER DELETE ON files BEGIN
+        DELETE FROM files_fts WHERE rowid = OLD.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_files_fts_rename AFTER UPDATE OF filename ON files BEGIN
+        UPDATE files_fts SET filename = NEW.filename WHERE rowid = NEW.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_files_fts_content AFTER UPDATE OF blob_hash ON files BEGIN
+        UPDATE files_fts SET body = '' WHERE rowid = NEW.id;
+    END
+    """,
+)
+SETUP_NAMES = {"files_fts", "trg_files_fts_insert", "trg_files_fts_delete", "trg_files_fts_rename", "trg_files_fts_content"}
+# files from before the index existed; the triggers keep it in step after that
+BACKFILL = """
+    INSERT INTO files_fts (rowid, filename, body, owner)
+    SELECT id, filename, '', owner FROM files WHERE id NOT IN (SELECT rowid FROM files_fts)
+"""
+
+_ready = False
+
+
+def init():
+    # once per process; after the first run on a db this is a single read of sqlite_master
+    global FTS_AVAILABLE, _ready
+    if _ready:
+        return
+    vault_db.migrate()
+    existing = {
+        row[0]: row[1] for row in vault_db.query_all(
+            f"SELECT name, sql FROM sqlite_master WHERE name IN ({','.join('?' * len(SETUP_NAMES))})", tuple(SETUP_NAMES)
+        )
+    }
+    rebuild = "owner UNINDEXED" in (existing.get("files_fts") or "")  # index from before owner was searchable
+    try:
+        if set(existing) != SETUP_NAMES or rebuild:
+            with vault_db.connection() as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                if rebuild:
+                    _rebuild(conn)
+                for statement in SETUP:
+                    conn.execute(statement)
+                if "files_fts" not in existing:
+                    conn.execute(BACKFILL)  # same transaction as the triggers, so no file is missed
+        FTS_AVAILABLE = True
+    except sqlite3.OperationalError:
+        FTS_AVAILABLE = False  # sqlite built without fts5 / trigram (< 3.34), fall back to LIKE
+    _ready = True
+
+
+def _rebuild(conn):
+    # copies names and extracted text into a table with owner indexed, nothing is extracted again.
+    # the triggers go first, a rename would otherwise trip over them pointing at a missing table
+    for name in SETUP_NAMES - {"files_fts"}:
+        conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+    conn.execute(CREATE_FTS.format(name="files_fts_new"))
+    conn.execute(
+        "INSERT INTO files_fts_new (rowid, filename, body, owner) SELECT rowid, filename, body, owner FROM files_fts"
+    )
+    conn.execute("DROP TABLE files_fts")
+    conn.execute("ALTER TABLE files_fts_new RENAME TO files_fts")
+
+
+def _read_head(owner, filename, limit):
+    with blob_store.open_file(owner, filename) as f:
+        return f.read(limit)
+
+
+def extract_text(owner, filename, mime_type=None, size=0):
+    name = filename.lower()
+    if size > MAX_EXTRACT_BYTES:
+        return ""
+    try:
+        if name.endswith((".txt", ".csv", ".md")) or (mime_type or "").startswith("text/"):
+            return _read_head(owner, filename, MAX_TEXT).decode("utf-8", errors="ignore")
+        if name.endswith(".docx"):
+            with zipfile.ZipFile(io.BytesIO(_read_head(owner, filename, MAX_EXTRACT_BYTES))) as z:
+                xml = z.read("word/document.xml").decode("utf-8", errors="ignore")
+            xml = re.sub(r"</w:p>", "\n", xml)
+            return re.sub(r"<[^>]+>", "", xml)[:MAX_TEXT]
+        if name.endswith(".pdf") and PYPDF_AVAILABLE:
+            reader = PdfReader(io.BytesIO(_read_head(owner, filename, MAX_EXTRACT_BYTES)))
+            text = "\n".join(page.extract_text() or "" for page in reader.pages[:PDF_PAGES])
+            return text[:MAX_TEXT]
+    except Exception:
+        return ""  # unreadable or malformed document, keep it searchable by name
+    return ""
+
+
+@metrics.timed("file")
+def index_text(owner, filename):
+    if not FTS_AVAILABLE:
+        return
+    row = vault_db.query_one(
+        "SELECT f.mime_type, f.size_bytes, b.encrypted FROM files f JOIN blobs b ON b.hash = f.blob_hash "
+        "WHERE f.owner = ? AND f.filename = ?",
+        (owner, filename),
+    )
+    if row is None:
+        return
+    if row["encrypted"]:
+        # searchable by name only, a plaintext body next to the ciphertext would undo the encryption.
+        # clears text indexed before the file was encrypted, so reindex scrubs old bodies too
+        vault_db.execute(
+            "UPDATE files_fts SET body = '' WHERE rowid = (SELECT id FROM files WHERE owner = ? AND filename = ?) "
+            "AND body != ''",
+            (owner, filename),
+        )
+        return
+    text = extract_text(owner, filename, row["mime_type"], row["size_bytes"] or 0)
+    if text:
+        vault_db.execute(
+            "UPDATE files_fts SET body = ? WHERE rowid = (SELECT id FROM files WHERE owner = ? AND filename = ?)",
+            (text, owner, filename),
+        )
+
+
+def _fts_phrase(query):
+    return '"' + query.replace('"', '""') + '"'  # whole query as one phrase, trigram makes it a substring match
+
+
+def search(query, owner=None, page=0, page_size=PAGE_SIZE, include_text=True):
+    # returns (rows, has_more); owner=None searches every user (admin)
+    query = query.strip()
+    where = []
+    params = []
+    if FTS_AVAILABLE and len(query) >= 3:
+        # CROSS JOIN pins the fts lookup as the outer loop, otherwise sqlite may run MATCH once per file row
+        sql = (
+            "SELECT f.owner, f.filename, f.size_bytes, f.modified_at, f.mime_type, f.blob_hash "
+            "FROM files_fts CROSS JOIN files f ON f.id = files_fts.rowid"
+        )
+        column = "{filename body} : " if include_text else "filename : "
+        match = column + _fts_phrase(query)
+        if owner is not None:
+            if len(owner) >= 3:
+                match = f"owner : {_fts_phrase(owner)} AND {match}"  # substring of the owner, f.owner below makes it exact
+            where.append("f.owner = ?")
+            params.append(owner)
+        where.insert(0, "files_fts MATCH ?")
+        params.insert(0, match)
+    else:
+        # under 3 characters trigrams can't help; a LIKE over one user's rows is still an index range
+        sql = "SELECT owner, filename, size_bytes, modified_at, mime_type, blob_hash FROM files f"
+        escaped = query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        where.append("f.filename LIKE ? ESCAPE '\\'")
+        params.append(f"%{escaped}%")
+        if owner is not None:
+            where.append("f.owner = ?")
+            params.append(owner)
+    sql += " WHERE " + " AND ".join(where) + " ORDER BY f.owner, f.filename LIMIT ? OFFSET ?"
+    params += [page_size + 1, page * page_size]
+    rows = vault_db.query_all(sql, params)
+    return rows[:page_size], len(rows) > page_size
+
+
+def reindex():
+    count = 0
+    for row in vault_db.query_all("SELECT owner, filename FROM files"):
+        index_text(row["owner"], row["filename"])
+        count += 1
+    if FTS_AVAILABLE:
+        vault_db.execute("INSERT INTO files_fts (files_fts) VALUES ('optimize')")  # merges away segments holding old bodies
+    return count
+
+
+if __name__ == "__main__":
+    init()
+    if len(sys.argv) == 2 and sys.argv[1] == "reindex":
+        print(f"Indexed text of {reindex()} files")
+    else:
+        print("usage: python file_search.py reindex")
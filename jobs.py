@@ -0,0 +1,345 @@
+# persistent job queue for work too slow to do inside a rerun (exports, maintenance).
+# jobs are rows in the jobs table, so any process can submit them and any process can run
+# them; no broker needed. the app runs WORKERS threads of its own, or none with
+# SECUREVAULT_JOB_WORKERS=0 when a separate worker process is used instead:
+#   python jobs.py worker [--workers 2]
+#   python jobs.py submit retention|reconcile|reindex|tiering|previews|purge
+#   python jobs.py list
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import traceback
+
+import activity_export
+import activity_queries
+import blob_store
+import file_search
+import metrics
+import previews
+import retention
+import storage_tier
+import vault_db
+
+WORKERS = int(os.environ.get("SECUREVAULT_JOB_WORKERS", "2"))
+RESULT_FOLDER = os.environ.get("SECUREVAULT_JOB_RESULTS", "job_results")
+POLL_INTERVAL = 1.0  # seconds an idle worker waits before looking for work again
+LEASE_SECONDS = 60  # a running job whose worker stopped heart-beating this long is run again
+RETRY_DELAY = 5  # seconds before the first retry, doubled for each one after
+PROGRESS_INTERVAL = 0.5  # progress is written at most this often per job
+KEEP_DAYS = 7  # finished jobs and their result files are purged after this
+MAX_ATTEMPTS = 3
+
+ACTIVE = ("queued", "running")
+MAINTENANCE = ["retention", "reconcile", "reindex", "tiering", "previews", "purge"]
+
+HANDLERS = {}  # kind -> fn(job_id, params, progress) returning a JSON-able dict
+_running = set()  # job ids this process is working on, kept alive by the heartbeat thread
+_lock = threading.Lock()
+_wake = threading.Event()
+_stop = threading.Event()
+_threads = []
+
+
+def register(kind, fn):
+    HANDLERS[kind] = fn
+
+
+def _params(params):
+    return json.dumps(params or {}, sort_keys=True)  # canonical, so equal params compare equal
+
+
+def find(kind, params=None, owner=None):
+    # newest job for exactly this work, whatever its status
+    return vault_db.query_one(
+        "SELECT * FROM jobs WHERE kind = ? AND params = ? AND owner IS ? ORDER BY id DESC LIMIT 1",
+        (kind, _params(params), owner),
+    )
+
+
+def submit(kind, params=None, owner=None, max_attempts=MAX_ATTEMPTS):
+    # the same work already queued or running is joined instead of being queued twice
+    with vault_db.connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute(
+            "SELECT id, status FROM jobs WHERE kind = ? AND params = ? AND owner IS ? ORDER BY id DESC LIMIT 1",
+            (kind, _params(params), owner),
+        ).fetchone()
+        if row is not None and row["status"] in ACTIVE:
+            return row["id"]
+        job_id = conn.execute(
+            "INSERT INTO jobs (kind, params, owner, max_attempts) VALUES (?,?,?,?)",
+            (kind, _params(params), owner, max_attempts),
+        ).lastrowid
+    _wake.set()  # local workers start on it straight away
+    return job_id
+
+
+def get(job_id):
+    return vault_db.query_one("SELECT * FROM jobs WHERE id = ?", (job_id,))
+
+
+def list_jobs(owner=None, limit=20):
+    if owner is None:
+        return vault_db.query_all("SELECT * FROM jobs ORDER BY id DESC LIMIT ?", (limit,))
+    return vault_db.query_all("SELECT * FROM jobs WHERE owner = ? ORDER BY id DESC LIMIT ?", (owner, limit))
+
+
+def retry(job_id):
+    changed = vault_db.execute(
+        "UPDATE jobs SET status = 'queued', attempts = 0, run_after = 0, error = NULL, progress = 0 "
+        "WHERE id = ? AND status = 'failed'",
+        (job_id,),
+    )
+    _wake.set()
+    return changed > 0
+
+
+def cancel(job_id):
+    return vault_db.execute(
+        "UPDATE jobs SET status = 'cancelled', finished_at = CURRENT_TIMESTAMP WHERE id = ? AND status = 'queued'",
+        (job_id,),
+    ) > 0
+
+
+def result(job):
+    return json.loads(job["result"]) if job["result"] else None
+
+
+def _claim():
+    now = time.time()
+    # cheap read first, so idle workers don't take the write lock every poll
+    if vault_db.query_one(
+        "SELECT 1 FROM jobs WHERE (status = 'queued' AND run_after <= ?) OR (status = 'running' AND heartbeat < ?) LIMIT 1",
+        (now, now - LEASE_SECONDS),
+    ) is None:
+        return None
+    with vault_db.connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute(
+            "UPDATE jobs SET status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'queued' END, "
+            "error = 'worker stopped responding', finished_at = CASE WHEN attempts >= max_attempts "
+            "THEN CURRENT_TIMESTAMP END WHERE status = 'running' AND heartbeat < ?",
+            (now - LEASE_SECONDS,),
+        )  # its worker died, the job goes back in the queue
+        row = conn.execute(
+            "SELECT * FROM jobs WHERE status = 'queued' AND run_after <= ? ORDER BY id LIMIT 1", (now,)
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute(
+            "UPDATE jobs SET status = 'running', attempts = attempts + 1, heartbeat = ?, message = NULL WHERE id = ?",
+            (now, row["id"]),
+        )
+        return row
+
+
+def _progress_fn(job_id):
+    last = [0.0]
+
+    def progress(fraction=None, message=None):
+        now = time.monotonic()
+        if now - last[0] < PROGRESS_INTERVAL:
+            return
+        last[0] = now
+        vault_db.execute(
+            "UPDATE jobs SET progress = COALESCE(?, progress), message = ?, heartbeat = ? WHERE id = ?",
+            (fraction, message, time.time(), job_id),
+        )
+
+    return progress
+
+
+def _run_job(row):
+    job_id = row["id"]
+    with _lock:
+        _running.add(job_id)
+    try:
+        handler = HANDLERS.get(row["kind"])
+        if handler is None:
+            raise LookupError(f"no handler for job kind {row['kind']!r}")
+        with metrics.span("job", row["kind"]):
+            outcome = handler(job_id, json.loads(row["params"]), _progress_fn(job_id)) or {}
+        path = outcome.pop("path", None)
+        vault_db.execute(
+            "UPDATE jobs SET status = 'done', progress = 1, message = NULL, result = ?, result_path = ?, "
+            "error = NULL, finished_at = CURRENT_TIMESTAMP WHERE id = ?",
+            (json.dumps(outcome), path, job_id),
+        )
+    except Exception as e:
+        traceback.print_exc()
+        attempts = row["attempts"] + 1
+        if attempts < row["max_attempts"]:
+            vault_db.execute(
+                "UPDATE jobs SET status = 'queued', error = ?, run_after = ? WHERE id = ?",
+                (f"{type(e).__name__}: {e}", time.time() + RETRY_DELAY * 2 ** (attempts - 1), job_id),
+            )
+        else:
+            vault_db.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, finished_at = CURRENT_TIMESTAMP WHERE id = ?",
+                (f"{type(e).__name__}: {e}", job_id),
+            )
+    finally:
+        with _lock:
+            _running.discard(job_id)
+
+
+def _worker():
+    while not _stop.is_set():
+        try:
+            row = _claim()
+        except Exception as e:
+            print(f"jobs: could not claim a job: {e}", file=sys.stderr)
+            row = None
+        if row is None:
+            _wake.wait(POLL_INTERVAL)
+            _wake.clear()
+            continue
+        _run_job(row)
+
+
+def _heartbeat():
+    while not _stop.wait(LEASE_SECONDS / 4):
+        with _lock:
+            ids = list(_running)
+        if ids:
+            try:
+                vault_db.execute(
+                    f"UPDATE jobs SET heartbeat = ? WHERE id IN ({','.join('?' * len(ids))})", (time.time(), *ids)
+                )
+            except Exception as e:
+                print(f"jobs: heartbeat failed: {e}", file=sys.stderr)
+
+
+def start(workers=WORKERS):
+    # idempotent: streamlit re-executes the app script, the threads are started once per process
+    with _lock:
+        if _threads or workers <= 0:
+            return
+        _stop.clear()
+        for i in range(workers):
+            _threads.append(threading.Thread(target=_worker, name=f"job-worker-{i}", daemon=True))
+        _threads.append(threading.Thread(target=_heartbeat, name="job-heartbeat", daemon=True))
+        for thread in _threads:
+            thread.start()
+
+
+def stop():
+    _stop.set()
+    _wake.set()
+    for thread in _threads:
+        thread.join()
+    _threads.clear()
+
+
+def purge(days=KEEP_DAYS):
+    rows = vault_db.query_all(
+        "SELECT id, result_path FROM jobs WHERE status IN ('done', 'failed', 'cancelled') "
+        "AND finished_at < datetime('now', ?)",
+        (f"-{int(days)} days",),
+    )
+    for row in rows:
+        if row["result_path"] and os.path.exists(row["result_path"]):
+            os.remove(row["result_path"])
+    with vault_db.connection() as conn:
+        conn.executemany("DELETE FROM jobs WHERE id = ?", [(row["id"],) for row in rows])
+    return len(rows)
+
+
+def _export(job_id, params, progress):
+    total = activity_queries.count_activity(params["user"], params["start"], params["end"])
+    done = 0
+
+    def rows_done(count):
+        nonlocal done
+        done += count
+        # archived rows aren't in the count, so never claim 100% before the end
+        progress(min(done / total, 0.99) if total else None, f"{done} rows written")
+
+    os.makedirs(RESULT_FOLDER, exist_ok=True)
+    path = os.path.join(RESULT_FOLDER, f"job-{job_id}.{params['fmt']}{'.gz' if params['compress'] else ''}")
+    size = activity_export.export_to_file(
+        path, params["fmt"], params["user"], params["start"], params["end"], params["compress"], rows_done
+    )
+    return {"rows": done, "bytes": size, "path": path}
+
+
+def _retention(job_id, params, progress):
+    progress(None, "rolling up and archiving activity")
+    return retention.run(params.get("days", retention.RETENTION_DAYS))
+
+
+def _reconcile(job_id, params, progress):
+    progress(None, "checking storage counters and blobs")
+    return blob_store.reconcile(fix=params.get("fix", True))
+
+
+def _reindex(job_id, params, progress):
+    progress(None, "re-extracting document text")
+    return {"files": file_search.reindex()}
+
+
+def _tiering(job_id, params, progress):
+    return storage_tier.run(params.get("days", storage_tier.COLD_DAYS), progress=progress)
+
+
+def _index(job_id, params, progress):
+    # after an upload: text for search first, so the preview's snippet can reuse it
+    file_search.index_text(params["owner"], params["filename"])
+    return {"preview": previews.generate(params["owner"], params["filename"])}
+
+
+def _preview(job_id, params, progress):
+    return {"kind": previews.generate(params["owner"], params["filename"])}
+
+
+def _previews(job_id, params, progress):
+    made = previews.backfill(params.get("limit", 1000), progress)
+    return {**made, "evicted": previews.evict()}
+
+
+def _purge(job_id, params, progress):
+    return {"removed": purge(params.get("days", KEEP_DAYS))}
+
+
+register("export", _export)
+register("retention", _retention)
+register("reconcile", _reconcile)
+register("reindex", _reindex)
+register("tiering", _tiering)
+register("index", _index)
+register("preview", _preview)
+register("previews", _previews)
+register("purge", _purge)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SecureVault background jobs")
+    parser.add_argument("--db", default=vault_db.DB_NAME)
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("worker", help="run queued jobs until interrupted")
+    p.add_argument("--workers", type=int, default=max(WORKERS, 1))
+    p = sub.add_parser("submit", help="queue a maintenance job")
+    p.add_argument("kind", choices=MAINTENANCE)
+    sub.add_parser("list", help="show the newest jobs")
+    args = parser.parse_args()
+
+    vault_db.configure(args.db)
+    vault_db.migrate()
+    if args.command == "worker":
+        start(args.workers)
+        print(f"{args.workers} workers running, Ctrl+C to stop")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            print("stopping after the current jobs...")
+            stop()
+    elif args.command == "submit":
+        print(f"job {submit(args.kind)} queued")
+    else:
+        for job in list_jobs(limit=20):
+            print(f"{job['id']:6d} {job['kind']:10s} {job['status']:9s} {job['progress'] * 100:5.0f}%  "
+                  f"{job['message'] or job['error'] or job['result'] or ''}")
@@ -0,0 +1,259 @@
+# in-process timing for the hot paths: page functions, every SQL statement (through the
+# connection factory in vault_db), blob reads / writes and background jobs. each (kind, name)
+# keeps a count and a latency histogram; the admin page shows them and they can be scraped
+# as Prometheus text or appended to a JSONL file.
+# SECUREVAULT_PROFILE=1 additionally samples the script thread's stack during each rerun and
+# writes one folded-stack profile per rerun to PROFILE_FOLDER (flamegraph.pl / speedscope).
+import functools
+import json
+import math
+import os
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+ENABLED = os.environ.get("SECUREVAULT_METRICS", "1") == "1"
+BUCKETS_MS = (0.1, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, math.inf)
+MAX_NAMES = 1000  # distinct (kind, name) series; anything past that is counted under "other"
+NAME_LENGTH = 80  # SQL statements are shortened to this for their series name
+JSONL_FILE = os.environ.get("SECUREVAULT_METRICS_FILE")  # snapshot appended here every JSONL_INTERVAL
+JSONL_INTERVAL = 60
+PROFILE = os.environ.get("SECUREVAULT_PROFILE") == "1"
+PROFILE_FOLDER = os.environ.get("SECUREVAULT_PROFILE_DIR", "profiles")
+PROFILE_INTERVAL = 0.005  # seconds between stack samples
+PROFILE_KEEP = 200  # newest profile files kept, older ones are deleted
+
+_series = {}  # (kind, name) -> [count, total seconds, max seconds, bucket counts]
+_lock = threading.Lock()
+_sql_names = {}
+_local = threading.local()
+_profiles = {}  # thread id -> {folded stack: samples} for reruns being profiled
+_threads = []
+
+
+def _sql_name(sql):
+    name = _sql_names.get(sql)
+    if name is None:
+        name = re.sub(r"\s+", " ", sql).strip()
+        name = re.sub(r"\?(\s*,\s*\?)+", "?,...", name)  # IN (?,?,?) lists of any length are one series
+        name = name[:NAME_LENGTH]
+        if len(_sql_names) < MAX_NAMES * 4:
+            _sql_names[sql] = name
+    return name
+
+
+def observe(kind, name, seconds):
+    ms = seconds * 1000
+    with _lock:
+        series = _series.get((kind, name))
+        if series is None:
+            if len(_series) >= MAX_NAMES:
+                name = "other"
+            series = _series.setdefault((kind, name), [0, 0.0, 0.0, [0] * len(BUCKETS_MS)])
+        series[0] += 1
+        series[1] += seconds
+        series[2] = max(series[2], seconds)
+        for i, bound in enumerate(BUCKETS_MS):
+            if ms <= bound:
+                series[3][i] += 1
+                break
+
+
+@contextmanager
+def span(kind, name):
+    if not ENABLED:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(kind, name, time.perf_counter() - start)
+
+
+def timed(kind, name=None):
+    # decorator form of span, named after the function unless told otherwise
+    def wrap(fn):
+        label = name or fn.__name__
+
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            with span(kind, label):
+                return fn(*args, **kwargs)
+
+        return inner
+
+    return wrap
+
+
+def query(sql):
+    return span("db", _sql_name(sql))
+
+
+def _percentile(buckets, count, peak_ms, pct):
+    # upper bound of the bucket holding the pct-th sample (as Prometheus estimates it), capped at the max
+    rank = count * pct / 100
+    seen = 0
+    for bound, n in zip(BUCKETS_MS, buckets):
+        seen += n
+        if seen >= rank and n:
+            return min(bound, round(peak_ms, 3))
+    return round(peak_ms, 3)
+
+
+def snapshot(kind=None):
+    with _lock:
+        items = [(k, (s[0], s[1], s[2], list(s[3]))) for k, s in _series.items() if kind is None or k[0] == kind]
+    rows = []
+    for (k, name), (count, total, peak, buckets) in items:
+        rows.append({
+            "kind": k,
+            "name": name,
+            "count": count,
+            "total_ms": round(total * 1000, 3),
+            "mean_ms": round(total * 1000 / count, 3),
+            "p50_ms": _percentile(buckets, count, peak * 1000, 50),
+            "p95_ms": _percentile(buckets, count, peak * 1000, 95),
+            "p99_ms": _percentile(buckets, count, peak * 1000, 99),
+            "max_ms": round(peak * 1000, 3),
+        })
+    return sorted(rows, key=lambda r: r["total_ms"], reverse=True)  # where the time goes, first
+
+
+def reset():
+    with _lock:
+        _series.clear()
+
+
+def _label(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+
+def prometheus():
+    # text exposition format, one histogram family for all spans
+    with _lock:
+        items = [(k, (s[0], s[1], list(s[3]))) for k, s in _series.items()]
+    lines = [
+        "# HELP securevault_span_seconds time spent in instrumented code",
+        "# TYPE securevault_span_seconds histogram",
+    ]
+    for (kind, name), (count, total, buckets) in sorted(items):
+        labels = f'kind="{_label(kind)}",name="{_label(name)}"'
+        seen = 0
+        for bound, n in zip(BUCKETS_MS, buckets):
+            seen += n
+            le = "+Inf" if bound == math.inf else repr(bound / 1000)
+            lines.append(f'securevault_span_seconds_bucket{{{labels},le="{le}"}} {seen}')
+        lines.append(f"securevault_span_seconds_sum{{{labels}}} {total}")
+        lines.append(f"securevault_span_seconds_count{{{labels}}} {count}")
+    return "\n".join(lines) + "\n"
+
+
+def jsonl():
+    now = time.time()
+    return "".join(json.dumps({"ts": now, **row}) + "\n" for row in snapshot())
+
+
+def write_jsonl(path=JSONL_FILE):
+    with open(path, "a") as f:
+        f.write(jsonl())
+
+
+def _jsonl_writer():
+    while True:
+        time.sleep(JSONL_INTERVAL)
+        try:
+            write_jsonl(JSONL_FILE)
+        except OSError as e:
+            print(f"metrics: could not write {JSONL_FILE}: {e}", file=sys.stderr)
+
+
+def _stack(frame):
+    parts = []
+    while frame is not None:
+        code = frame.f_code
+        parts.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(parts))
+
+
+def _sampler():
+    while True:
+        time.sleep(PROFILE_INTERVAL)
+        with _lock:
+            ids = list(_profiles)
+        if not ids:
+            continue
+        frames = sys._current_frames()
+        for thread_id in ids:
+            frame = frames.get(thread_id)
+            if frame is None:
+                with _lock:
+                    _profiles.pop(thread_id, None)  # script thread went away mid-rerun
+                continue
+            stack = _stack(frame)
+            with _lock:
+                samples = _profiles.get(thread_id)
+                if samples is not None:
+                    samples[stack] = samples.get(stack, 0) + 1
+
+
+def _start_threads():
+    with _lock:
+        if _threads:
+            return
+        if PROFILE:
+            _threads.append(threading.Thread(target=_sampler, name="metrics-profiler", daemon=True))
+        if JSONL_FILE:
+            _threads.append(threading.Thread(target=_jsonl_writer, name="metrics-jsonl", daemon=True))
+        for thread in _threads:
+            thread.start()
+
+
+def _write_profile(samples, page, seconds):
+    os.makedirs(PROFILE_FOLDER, exist_ok=True)
+    slug = re.sub(r"[^A-Za-z0-9_-]+", "_", page).strip("_") or "rerun"
+    path = os.path.join(PROFILE_FOLDER, f"{time.strftime('%Y%m%d-%H%M%S')}-{int(seconds * 1000)}ms-{slug}.folded")
+    with open(path, "w") as f:
+        for stack, count in sorted(samples.items(), key=lambda item: -item[1]):
+            f.write(f"{stack} {count}\n")
+    names = sorted(os.listdir(PROFILE_FOLDER))
+    for old in names[:-PROFILE_KEEP]:
+        os.remove(os.path.join(PROFILE_FOLDER, old))
+    return path
+
+
+def start_rerun():
+    # top of the script; a rerun cut short by st.rerun() / st.stop() is simply replaced by the next one
+    if not ENABLED:
+        return
+    _start_threads()
+    _local.started = time.perf_counter()
+    if PROFILE:
+        with _lock:
+            _profiles[threading.get_ident()] = {}
+
+
+def end_rerun(page):
+    # bottom of the script: records the whole rerun and writes its profile
+    started = getattr(_local, "started", None)
+    if started is None:
+        return None
+    _local.started = None
+    seconds = time.perf_counter() - started
+    observe("rerun", page, seconds)
+    with _lock:
+        samples = _profiles.pop(threading.get_ident(), None)
+    if samples:
+        return _write_profile(samples, page, seconds)
+    return None
+
+
+def profiles(limit=20):
+    try:
+        names = sorted(os.listdir(PROFILE_FOLDER), reverse=True)
+    except FileNotFoundError:
+        return []
+    return [os.path.join(PROFILE_FOLDER, name) for name in names[:limit]]
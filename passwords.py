@@ -0,0 +1,213 @@
+# salted, memory-hard password hashing. hashes carry their own parameters
+# (scrypt$n$r$p$salt$hash or pbkdf2_sha256$iterations$salt$hash) so cost can be
+# raised later; old unsalted SHA-256 hashes still verify and get upgraded on login.
+# all hashing runs on a small bounded pool so a login burst can't tie up every server thread
+import argparse
+import base64
+import collections
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+SCHEME = os.environ.get("SECUREVAULT_HASH_SCHEME", "scrypt")  # or pbkdf2_sha256
+SCRYPT_N = int(os.environ.get("SECUREVAULT_SCRYPT_N", str(2 ** 14)))
+SCRYPT_R = int(os.environ.get("SECUREVAULT_SCRYPT_R", "8"))
+SCRYPT_P = int(os.environ.get("SECUREVAULT_SCRYPT_P", "1"))
+PBKDF2_ITERATIONS = int(os.environ.get("SECUREVAULT_PBKDF2_ITERATIONS", "600000"))
+SALT_BYTES = 16
+
+HASH_WORKERS = int(os.environ.get("SECUREVAULT_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+MAX_PENDING = int(os.environ.get("SECUREVAULT_HASH_QUEUE", "32"))  # hashes running + waiting before we refuse
+WAIT_TIMEOUT = 10  # seconds a caller waits for a slot / a result
+
+
+class PoolBusyError(Exception):
+    pass
+
+
+def _b64(data):
+    return base64.b64encode(data).decode()
+
+
+def _scrypt(password, salt, n, r, p):
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r + 1024 * 1024, dklen=32)
+
+
+def _pbkdf2(password, salt, iterations):
+    return hashlib.pbkdf2_hmac("sha256", password.encode(), salt, iterations)
+
+
+def hash_now(password, scheme=None):
+    # hashes in the calling thread, for batch tools that bring their own worker processes
+    scheme = scheme or SCHEME
+    salt = secrets.token_bytes(SALT_BYTES)
+    if scheme == "pbkdf2_sha256":
+        return f"pbkdf2_sha256${PBKDF2_ITERATIONS}${_b64(salt)}${_b64(_pbkdf2(password, salt, PBKDF2_ITERATIONS))}"
+    digest = _scrypt(password, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+    return f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${_b64(salt)}${_b64(digest)}"
+
+
+def _is_legacy(stored):
+    return len(stored) == 64 and all(c in "0123456789abcdef" for c in stored)  # old unsalted sha256 hex
+
+
+def needs_rehash(stored):
+    if _is_legacy(stored):
+        return True
+    parts = stored.split("$")
+    if parts[0] != SCHEME:
+        return True
+    if SCHEME == "scrypt":
+        return (int(parts[1]), int(parts[2]), int(parts[3])) != (SCRYPT_N, SCRYPT_R, SCRYPT_P)
+    return int(parts[1]) != PBKDF2_ITERATIONS
+
+
+def _verify_now(password, stored):
+    if stored is None:
+        hash_now(password)  # unknown user: spend the same time so timing doesn't reveal it
+        return False
+    if _is_legacy(stored):
+        return hmac.compare_digest(hashlib.sha256(password.encode()).hexdigest(), stored)
+    parts = stored.split("$")
+    try:
+        if parts[0] == "scrypt":
+            n, r, p, salt, digest = int(parts[1]), int(parts[2]), int(parts[3]), parts[4], parts[5]
+            computed = _scrypt(password, base64.b64decode(salt), n, r, p)
+        elif parts[0] == "pbkdf2_sha256":
+            iterations, salt, digest = int(parts[1]), parts[2], parts[3]
+            computed = _pbkdf2(password, base64.b64decode(salt), iterations)
+        else:
+            return False
+    except (IndexError, ValueError):
+        return False  # malformed hash in the db
+    return hmac.compare_digest(computed, base64.b64decode(digest))
+
+
+# bounded pool: hashlib releases the GIL while hashing, so threads run in parallel
+_executor = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="pwhash")
+_slots = threading.BoundedSemaphore(MAX_PENDING)
+_stats_lock = threading.Lock()
+_queue_ms = collections.deque(maxlen=1000)
+_run_ms = collections.deque(maxlen=1000)
+_counts = {"completed": 0, "rejected": 0}
+
+
+def _run(fn, *args):
+    if not _slots.acquire(timeout=WAIT_TIMEOUT):
+        with _stats_lock:
+            _counts["rejected"] += 1
+        raise PoolBusyError("too many password checks in progress")
+    submitted = time.perf_counter()
+
+    def job():
+        started = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            _slots.release()  # only once the hash is done, so MAX_PENDING holds while callers give up
+            finished = time.perf_counter()
+            with _stats_lock:
+                _queue_ms.append((started - submitted) * 1000)
+                _run_ms.append((finished - started) * 1000)
+                _counts["completed"] += 1
+
+    future = _executor.submit(job)
+    try:
+        return future.result(timeout=WAIT_TIMEOUT)
+    except FutureTimeoutError:
+        if future.cancel():
+            _slots.release()  # never started, job() won't release it
+        with _stats_lock:
+            _counts["rejected"] += 1
+        raise PoolBusyError("password check timed out") from None
+
+
+def hash_password(password):
+    return _run(hash_now, password)
+
+
+def verify_password(password, stored):
+    # returns (ok, upgraded_hash); upgraded_hash is set when the stored one should be replaced
+    ok = _run(_verify_now, password, stored)
+    if ok and needs_rehash(stored):
+        return True, hash_password(password)
+    return ok, None
+
+
+def new_reset_token():
+    # one-time reset token: the user gets the token, the db only ever sees its sha256
+    token = secrets.token_urlsafe(24)
+    return token, hash_token(token)
+
+
+def hash_token(token):
+    return hashlib.sha256(token.encode()).hexdigest()  # tokens are random, no salt / stretching needed
+
+
+def _pct(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def stats():
+    with _stats_lock:
+        queue_ms, run_ms = list(_queue_ms), list(_run_ms)
+        counts = dict(_counts)
+    return {
+        **counts,
+        "workers": HASH_WORKERS,
+        "max_pending": MAX_PENDING,
+        "queue_ms_p50": _pct(queue_ms, 50),
+        "queue_ms_p95": _pct(queue_ms, 95),
+        "run_ms_p50": _pct(run_ms, 50),
+        "run_ms_p95": _pct(run_ms, 95),
+    }
+
+
+def calibrate(target_ms=250, scheme="scrypt", rounds=3):
+    # doubles the cost until one verify on this host takes about target_ms
+    def timed(fn):
+        start = time.perf_counter()
+        for _ in range(rounds):
+            fn()
+        return (time.perf_counter() - start) / rounds * 1000
+
+    salt = secrets.token_bytes(SALT_BYTES)
+    results = []
+    if scheme == "scrypt":
+        n = 2 ** 12
+        while True:
+            ms = timed(lambda: _scrypt("calibrate", salt, n, SCRYPT_R, SCRYPT_P))
+            results.append((n, ms))
+            if ms >= target_ms or n >= 2 ** 20:
+                break
+            n *= 2
+    else:
+        iterations = 50000
+        while True:
+            ms = timed(lambda: _pbkdf2("calibrate", salt, iterations))
+            results.append((iterations, ms))
+            if ms >= target_ms or iterations >= 10_000_000:
+                break
+            iterations *= 2
+    best = min(results, key=lambda r: abs(r[1] - target_ms))
+    return best, results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="pick password hashing cost for this host")
+    parser.add_argument("--target-ms", type=float, default=250)
+    parser.add_argument("--scheme", choices=["scrypt", "pbkdf2_sha256"], default="scrypt")
+    args = parser.parse_args()
+    (cost, ms), results = calibrate(args.target_ms, args.scheme)
+    for c, t in results:
+        print(f"{'n' if args.scheme == 'scrypt' else 'iterations'}={c:<10d} {t:8.1f} ms")
+    var = "SECUREVAULT_SCRYPT_N" if args.scheme == "scrypt" else "SECUREVAULT_PBKDF2_ITERATIONS"
+    print(f"suggested: {var}={cost}  (~{ms:.0f} ms per verify)")
@@ -0,0 +1,212 @@
+# file previews for the file browser: a small thumbnail for images, a text snippet for
+# txt / docx / pdf. each is made once per blob (background job after upload), kept under
+# uploads/.previews/<aa>/<hash> and tracked in the previews table, which drives LRU eviction
+# once the cache grows past MAX_BYTES. pages only ever read from the cache, never the blobs.
+import io
+import os
+import re
+import tempfile
+import threading
+
+import blob_store
+import file_search
+import vault_db
+
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except Exception:
+    PIL_AVAILABLE = False    # images get no thumbnail, documents still get text snippets
+
+PREVIEW_FOLDER = os.environ.get("SECUREVAULT_PREVIEWS", os.path.join(blob_store.UPLOAD_FOLDER, ".previews"))
+MAX_BYTES = int(os.environ.get("SECUREVAULT_PREVIEW_CACHE_MB", "256")) * 1024 * 1024
+THUMB_SIZE = 160  # longest side in pixels
+THUMB_QUALITY = 70
+SNIPPET_CHARS = 400
+MAX_SOURCE_BYTES = 50 * 1024 * 1024  # bigger files get no preview, not worth decoding
+MAX_PIXELS = 50_000_000  # decompression bomb guard for thumbnails
+TOUCH_AFTER = "-1 hour"  # last_used is refreshed at most this often, reads stay read-only otherwise
+RESYNC_EVERY = 100  # previews made between exact re-reads of the cache size (other processes add too)
+IMAGE_TYPES = (".png", ".jpg", ".jpeg", ".gif", ".webp", ".bmp")
+SUFFIX = {"thumbnail": ".webp", "text": ".txt"}
+
+_total = {"bytes": None, "added": 0}  # running size of the cache, so generate() doesn't sum the table
+_total_lock = threading.Lock()
+
+
+def preview_path(blob_hash, kind):
+    return os.path.join(PREVIEW_FOLDER, blob_hash[:2], blob_hash + SUFFIX[kind])
+
+
+def _thumbnail(owner, filename):
+    # whole file in memory (capped by MAX_SOURCE_BYTES): pillow seeks backwards, which compressed blobs can't
+    with Image.open(io.BytesIO(blob_store.read_file(owner, filename))) as img:
+        if img.width * img.height > MAX_PIXELS:
+            return None
+        img.draft("RGB", (THUMB_SIZE, THUMB_SIZE))  # JPEGs decode straight at a reduced scale
+        img.thumbnail((THUMB_SIZE, THUMB_SIZE))
+        out = io.BytesIO()
+        img.convert("RGB").save(out, "WEBP", quality=THUMB_QUALITY)
+    return out.getvalue()
+
+
+def _snippet(owner, filename, mime_type, size):
+    text = None
+    if file_search.FTS_AVAILABLE:  # usually extracted already at upload for the search index
+        row = vault_db.query_one(
+            "SELECT body FROM files_fts WHERE rowid = (SELECT id FROM files WHERE owner = ? AND filename = ?)",
+            (owner, filename),
+        )
+        text = row["body"] if row else None
+    if not text:
+        text = file_search.extract_text(owner, filename, mime_type, size)  # reads the head of the file only
+    text = re.sub(r"\s+", " ", text).strip()[:SNIPPET_CHARS]
+    return text.encode("utf-8") if text else None
+
+
+def _render(owner, row):
+    name = row["filename"].lower()
+    if (row["size_bytes"] or 0) > MAX_SOURCE_BYTES:
+        return "none", None
+    if name.endswith(IMAGE_TYPES) or (row["mime_type"] or "").startswith("image/"):
+        if not PIL_AVAILABLE:
+            return "none", None
+        try:
+            data = _thumbnail(owner, row["filename"])
+        except Exception:
+            data = None  # not an image pillow can read, or a broken one
+        return ("thumbnail", data) if data else ("none", None)
+    data = _snippet(owner, row["filename"], row["mime_type"], row["size_bytes"] or 0)
+    return ("text", data) if data else ("none", None)
+
+
+def _store(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def generate(owner, filename):
+    # makes the preview for one file unless its content already has one; returns the kind
+    row = vault_db.query_one(
+        "SELECT f.filename, f.size_bytes, f.mime_type, f.blob_hash, b.encrypted, p.kind FROM files f "
+        "JOIN blobs b ON b.hash = f.blob_hash LEFT JOIN previews p ON p.hash = f.blob_hash "
+        "WHERE f.owner = ? AND f.filename = ?",
+        (owner, filename),
+    )
+    if row is None:
+        return None  # renamed or deleted before the job ran
+    if row["kind"] is not None:
+        return row["kind"]
+    if row["encrypted"]:
+        kind, data = "none", None  # a plaintext thumbnail / snippet would undo the encryption
+    else:
+        kind, data = _render(owner, row)
+    if data is not None:
+        _store(preview_path(row["blob_hash"], kind), data)
+    vault_db.execute(
+        "INSERT OR REPLACE INTO previews (hash, kind, bytes) VALUES (?,?,?)",
+        (row["blob_hash"], kind, len(data) if data else 0),
+    )  # 'none' is remembered too, so nothing is retried on every page view
+    if data is not None and _grow(len(data)) > MAX_BYTES:
+        evict()
+    return kind
+
+
+def _grow(added):
+    with _total_lock:
+        if _total["bytes"] is None or _total["added"] >= RESYNC_EVERY:
+            _total["bytes"], _total["added"] = cache_bytes(), 0  # exact, this preview included
+        else:
+            _total["bytes"] += added
+            _total["added"] += 1
+        return _total["bytes"]
+
+
+def missing(limit=1000):
+    # files whose content has no preview yet, oldest first (backfill for files from before previews)
+    return vault_db.query_all(
+        "SELECT f.owner, f.filename FROM files f WHERE NOT EXISTS "
+        "(SELECT 1 FROM previews p WHERE p.hash = f.blob_hash) ORDER BY f.id LIMIT ?",
+        (limit,),
+    )
+
+
+def backfill(limit=1000, progress=None):
+    rows = missing(limit)
+    made = {}
+    for n, row in enumerate(rows):
+        kind = generate(row["owner"], row["filename"])
+        made[kind] = made.get(kind, 0) + 1
+        if progress:
+            progress((n + 1) / len(rows), f"{n + 1} of {len(rows)} previews")
+    return made
+
+
+def lookup(blob_hashes):
+    # {hash: (kind, data)} for one page of files, read from the cache only; missing = not made yet,
+    # ("evicted", None) = its file was evicted since, the caller queues a preview job to make it again
+    hashes = list(dict.fromkeys(h for h in blob_hashes if h))
+    if not hashes:
+        return {}
+    marks = ",".join("?" * len(hashes))
+    rows = vault_db.query_all(
+        f"SELECT hash, kind, last_used < datetime('now', ?) AS stale FROM previews WHERE hash IN ({marks})",
+        (TOUCH_AFTER, *hashes),
+    )
+    stale = [r["hash"] for r in rows if r["stale"]]
+    if stale:
+        vault_db.execute(
+            f"UPDATE previews SET last_used = CURRENT_TIMESTAMP WHERE hash IN ({','.join('?' * len(stale))})", stale
+        )
+    found = {}
+    for r in rows:
+        if r["kind"] == "none":
+            found[r["hash"]] = ("none", None)
+            continue
+        try:
+            with open(preview_path(r["hash"], r["kind"]), "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            vault_db.execute("DELETE FROM previews WHERE hash = ?", (r["hash"],))  # evicted meanwhile
+            found[r["hash"]] = ("evicted", None)
+            continue
+        found[r["hash"]] = (r["kind"], data.decode("utf-8") if r["kind"] == "text" else data)
+    return found
+
+
+def evict(max_bytes=None):
+    # drop previews of deleted content, then least recently used ones until the cache fits
+    max_bytes = MAX_BYTES if max_bytes is None else max_bytes
+    with vault_db.connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        removed = conn.execute(
+            "SELECT hash, kind, bytes FROM previews WHERE hash NOT IN (SELECT hash FROM blobs)"
+        ).fetchall()
+        total = conn.execute("SELECT COALESCE(SUM(bytes), 0) FROM previews").fetchone()[0]
+        total -= sum(r["bytes"] for r in removed)
+        if total > max_bytes:
+            for r in conn.execute(
+                "SELECT hash, kind, bytes FROM previews WHERE bytes > 0 AND hash IN (SELECT hash FROM blobs) "
+                "ORDER BY last_used"
+            ):
+                removed.append(r)
+                total -= r["bytes"]
+                if total <= max_bytes * 0.9:  # some headroom, so we don't evict on every new preview
+                    break
+        conn.executemany("DELETE FROM previews WHERE hash = ?", [(r["hash"],) for r in removed])
+    with _total_lock:
+        _total["bytes"], _total["added"] = total, 0
+    for r in removed:
+        if r["kind"] in SUFFIX:
+            try:
+                os.remove(preview_path(r["hash"], r["kind"]))
+            except FileNotFoundError:
+                pass
+    return len(removed)
+
+
+def cache_bytes():
+    return vault_db.query_one("SELECT COALESCE(SUM(bytes), 0) FROM previews")[0]
@@ -0,0 +1,228 @@
+# bulk user provisioning / password rotation:
+#   python provision_users.py import users.csv [--rotate] (or .jsonl: userid, email, password optional;
+#                                                          existing users keep their password unless the row
+#                                                          has one or --rotate is given)
+#   python provision_users.py rotate [--reset-tokens]
+# hashing is spread over worker processes, rows are written with executemany in bounded
+# transactions and progress is checkpointed so an interrupted run picks up where it stopped
+import argparse
+import csv
+import json
+import os
+import secrets
+import string
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import passwords
+import vault_db
+
+DB = "securevault.db"
+CHUNK_ROWS = 500  # rows per transaction
+RESET_TOKEN_HOURS = 72
+
+
+def gen_password(length=12):
+    alphabet = string.ascii_letters + string.digits + "!@#$%&*?"
+    return "".join(secrets.choice(alphabet) for _ in range(length))
+
+
+def _hash_chunk(items):
+    # runs in a worker process: [(userid, email, password)] -> [(userid, email, hash)]
+    return [(userid, email, passwords.hash_now(pw)) for userid, email, pw in items]
+
+
+def _read_input(path):
+    if path.endswith(".jsonl"):
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    row = json.loads(line)
+                    yield row["userid"], row.get("email"), row.get("password")
+    else:
+        with open(path, newline="") as f:
+            for row in csv.DictReader(f):
+                yield row["userid"], row.get("email") or None, row.get("password") or None
+
+
+def _chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _load_checkpoint(path):
+    if path and os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return {}
+
+
+def _save_checkpoint(path, state):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp, path)  # never leaves a half-written checkpoint behind
+
+
+def _open_output(path, resuming, reset_tokens):
+    new = not (resuming and os.path.exists(path))
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | (os.O_TRUNC if new else os.O_APPEND), 0o600)  # secrets inside
+    f = os.fdopen(fd, "w", newline="")
+    writer = csv.writer(f)
+    if new:
+        writer.writerow(["userid", "reset_token" if reset_tokens else "password"])
+    return f, writer
+
+
+def _prepare(chunk, reset_tokens, keep=()):
+    # gives every row a password to hash; with reset tokens that password is random and never shown.
+    # users in keep get nothing new (no password, token or output line), only their other columns
+    hash_input, secrets_out, tokens, kept = [], [], [], []
+    for userid, email, pw in chunk:
+        if userid in keep:
+            kept.append((userid, email, None))
+            continue
+        if reset_tokens:
+            token, token_hash = passwords.new_reset_token()
+            tokens.append((userid, token_hash))
+            secrets_out.append((userid, token))
+            pw = secrets.token_urlsafe(32)
+        elif pw is None:
+            pw = gen_password()
+            secrets_out.append((userid, pw))
+        hash_input.append((userid, email, pw))
+    return hash_input, secrets_out, tokens, kept
+
+
+def _write_chunk(sql, params, tokens):
+    with vault_db.connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")  # one bounded transaction per chunk
+        conn.executemany(sql, params)
+        if tokens:
+            conn.executemany(
+                "INSERT OR REPLACE INTO password_resets (userid, token_hash, expires_at) "
+                f"VALUES (?, ?, datetime('now', '+{RESET_TOKEN_HOURS} hours'))",
+                tokens,
+            )
+
+
+def _run(chunks, sql, to_params, args, position_of, keep=None):
+    checkpoint = _load_checkpoint(args.checkpoint)
+    out, writer = _open_output(args.output, bool(checkpoint), args.reset_tokens)
+    done = checkpoint.get("done", 0)
+    start = time.perf_counter()
+    written = 0
+    workers = args.workers or os.cpu_count() or 1
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for chunk in chunks(checkpoint):
+                hash_input, secrets_out, tokens, kept = _prepare(chunk, args.reset_tokens, keep(chunk) if keep else ())
+                per_worker = max(1, len(hash_input) // workers)
+                hashed = [row for part in pool.map(_hash_chunk, list(_chunks(hash_input, per_worker))) for row in part]
+                hashed += kept
+                writer.writerows(secrets_out)  # secrets are on disk before the db changes, never the other way round
+                out.flush()
+                os.fsync(out.fileno())
+                _write_chunk(sql, [to_params(*row) for row in hashed], tokens)
+                done += len(chunk)
+                written += len(chunk)
+                _save_checkpoint(args.checkpoint, {"done": done, **position_of(chunk)})
+                rate = written / (time.perf_counter() - start)
+                print(f"{done} users done, {rate:.0f} users/s", file=sys.stderr)
+    finally:
+        out.close()
+    if os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)  # finished, next run starts from scratch
+    return written
+
+
+def import_users(args):
+    # kept users are written with a placeholder hash that matches no password; it only lands in
+    # the table if the user was deleted since the lookup below, and then nobody can log in with it
+    sql = (
+        "INSERT INTO users (userid, email, password) VALUES (?,?,?) "
+        "ON CONFLICT(userid) DO UPDATE SET email = COALESCE(excluded.email, email), "
+        "password = CASE WHEN ? THEN excluded.password ELSE password END"
+    )
+
+    def keep(chunk):
+        # existing users whose row brings no password keep the one they have, unless --rotate
+        if args.rotate:
+            return set()
+        ids = [userid for userid, _, pw in chunk if pw is None]
+        if not ids:
+            return set()
+        rows = vault_db.query_all(f"SELECT userid FROM users WHERE userid IN ({','.join('?' * len(ids))})", ids)
+        return {r["userid"] for r in rows}
+
+    def chunks(checkpoint):
+        rows = _read_input(args.input)
+        for _ in range(checkpoint.get("done", 0)):
+            next(rows, None)  # already imported before the interruption
+        return _chunks(rows, CHUNK_ROWS)
+
+    def to_params(userid, email, pw_hash):
+        return userid, email, pw_hash or "!", pw_hash is not None
+
+    return _run(chunks, sql, to_params, args, lambda chunk: {}, keep)
+
+
+def rotate_users(args):
+    sql = "UPDATE users SET password = ? WHERE userid = ?"
+
+    def chunks(checkpoint):
+        last_id = checkpoint.get("last_id", 0)
+        while True:
+            rows = vault_db.query_all(
+                "SELECT id, userid FROM users WHERE id > ? ORDER BY id LIMIT ?", (last_id, CHUNK_ROWS)
+            )
+            if not rows:
+                return
+            last_id = rows[-1]["id"]
+            yield [(r["userid"], r["id"], None) for r in rows]  # email slot carries the id for the checkpoint
+
+    def position_of(chunk):
+        return {"last_id": chunk[-1][1]}
+
+    return _run(chunks, sql, lambda userid, _, pw_hash: (pw_hash, userid), args, position_of)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import users or rotate passwords")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("import", help="create / update users from CSV or JSONL")
+    p.add_argument("input")
+    p.add_argument("--rotate", action="store_true", help="also give existing users without a password in the file a new one")
+    p.set_defaults(func=import_users)
+    p = sub.add_parser("rotate", help="give every user a new password")
+    p.set_defaults(func=rotate_users)
+    for p in sub.choices.values():
+        p.add_argument("--db", default=DB)
+        p.add_argument("--output", default="passwords.csv", help="where new passwords / reset tokens are written")
+        p.add_argument("--reset-tokens", action="store_true", help="emit one-time reset tokens instead of passwords")
+        p.add_argument("--workers", type=int, default=0, help="hashing processes (default: one per core)")
+        p.add_argument("--checkpoint", default="provision.checkpoint.json")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f"ERROR: {args.db} not found.", file=sys.stderr)
+        sys.exit(1)
+    vault_db.configure(args.db)
+    vault_db.migrate()
+    start = time.perf_counter()
+    count = args.func(args)
+    elapsed = time.perf_counter() - start
+    print(f"{count} users in {elapsed:.1f} s ({count / max(elapsed, 1e-9):.0f} users/s). Output: {args.output}")
+    if not args.reset_tokens:
+        print("DON'T SHARE that CSV publicly. Use it only for testing.")
+
+
+if __name__ == "__main__":
+    main()
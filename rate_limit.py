@@ -0,0 +1,90 @@
+# token-bucket rate limiting for login attempts, keyed by user id and by client.
+# buckets live in process memory; with SECUREVAULT_SHARED_LIMITS=1 they live in the
+# rate_limits table instead, so several server processes share one budget
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import vault_db
+
+SHARED = os.environ.get("SECUREVAULT_SHARED_LIMITS") == "1"
+
+# kind -> (capacity, tokens refilled per second)
+LIMITS = {
+    "user": (5, 1 / 30),  # 5 quick attempts per account, then one every 30 s
+    "client": (20, 1 / 3),  # a single browser / IP gets more, it may try several accounts
+}
+MAX_BUCKETS = 100000  # in-memory buckets kept, the least recently hit ones are dropped past that
+PRUNE_INTERVAL = 60  # seconds between sweeps of refilled rows out of the shared table
+FULL_AFTER = max(capacity / rate for capacity, rate in LIMITS.values())  # seconds for any empty bucket to refill
+
+_buckets = OrderedDict()  # oldest hit first
+_lock = threading.Lock()
+_next_prune = 0.0
+
+
+def _refill(tokens, updated, now, capacity, rate):
+    return min(capacity, tokens + (now - updated) * rate)
+
+
+def _take_local(key, capacity, rate, cost, now):
+    with _lock:
+        tokens, updated = _buckets.get(key, (capacity, now))
+        tokens = _refill(tokens, updated, now, capacity, rate)
+        allowed = tokens >= cost
+        if allowed:
+            tokens -= cost
+        _buckets[key] = (tokens, now)
+        _buckets.move_to_end(key)
+        while len(_buckets) > MAX_BUCKETS:
+            _buckets.popitem(last=False)  # O(1); the oldest bucket is the one closest to full anyway
+        return allowed, tokens
+
+
+def _prune_shared(conn, now):
+    # a bucket that has refilled completely is the same as no bucket at all
+    global _next_prune
+    if now < _next_prune:
+        return
+    _next_prune = now + PRUNE_INTERVAL
+    conn.execute("DELETE FROM rate_limits WHERE updated < ?", (now - FULL_AFTER,))
+
+
+def _take_shared(key, capacity, rate, cost, now):
+    with vault_db.connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")  # read-modify-write of one bucket, serialised across processes
+        row = conn.execute("SELECT tokens, updated FROM rate_limits WHERE key = ?", ("/".join(key),)).fetchone()
+        tokens, updated = (row["tokens"], row["updated"]) if row else (capacity, now)
+        tokens = _refill(tokens, updated, now, capacity, rate)
+        allowed = tokens >= cost
+        if allowed:
+            tokens -= cost
+        conn.execute(
+            "INSERT OR REPLACE INTO rate_limits (key, tokens, updated) VALUES (?,?,?)", ("/".join(key), tokens, now)
+        )
+        _prune_shared(conn, now)
+        return allowed, tokens
+
+
+def hit(kind, value, cost=1):
+    # spends `cost` tokens; returns (allowed, seconds until the next attempt would be allowed)
+    capacity, rate = LIMITS[kind]
+    key = (kind, str(value))
+    now = time.time()
+    take = _take_shared if SHARED else _take_local
+    allowed, tokens = take(key, capacity, rate, cost, now)
+    retry_after = 0 if allowed else (cost - tokens) / rate
+    return allowed, retry_after
+
+
+def check_login(userid, client):
+    # both buckets are charged so one noisy client can't lock everyone else out of an account for free
+    user_ok, user_wait = hit("user", userid)
+    client_ok, client_wait = hit("client", client)
+    return user_ok and client_ok, max(user_wait, client_wait)
+
+
+def reset():
+    with _lock:
+        _buckets.clear()
@@ -0,0 +1,257 @@
+# keeps activity_log small: new rows are rolled up into the daily / hourly aggregates, rows older than
+# RETENTION_DAYS move to monthly gzip JSONL files under archive/ and the freed pages are
+# handed back with incremental vacuum. exports read the archives when a date range needs them.
+#   python retention.py run [--days 90]
+#   python retention.py enable-incremental-vacuum     (one-off, rewrites the db file)
+import argparse
+import datetime
+import glob
+import gzip
+import heapq
+import json
+import os
+import zlib
+
+import vault_db
+
+RETENTION_DAYS = int(os.environ.get("SECUREVAULT_RETENTION_DAYS", "90"))
+ARCHIVE_FOLDER = os.environ.get("SECUREVAULT_ARCHIVE", "archive")
+ROLLUP_CHUNK = 50000  # activity ids rolled up per transaction
+ARCHIVE_CHUNK = 5000  # rows archived + deleted per transaction
+VACUUM_PAGES = 2000  # pages released per step
+READ_BYTES = 256 * 1024  # compressed bytes read at a time from an archive
+
+COLUMNS = ("id", "userid", "action", "details", "ts")
+
+
+def _state(conn, name):
+    row = conn.execute("SELECT last_id FROM rollup_state WHERE name = ?", (name,)).fetchone()
+    return row[0] if row else 0
+
+
+def _set_state(conn, name, last_id):
+    conn.execute("INSERT OR REPLACE INTO rollup_state (name, last_id) VALUES (?, ?)", (name, last_id))
+
+
+# aggregate table -> statement folding activity ids in (?, ?] into it
+ROLLUPS = {
+    "activity_daily": """
+        INSERT INTO activity_daily (day, userid, action, count)
+        SELECT date(ts), COALESCE(userid, ''), action, COUNT(*) FROM activity_log
+        WHERE id > ? AND id <= ? GROUP BY 1, 2, 3
+        ON CONFLICT(day, userid, action) DO UPDATE SET count = count + excluded.count
+    """,
+    "activity_hourly": """
+        INSERT INTO activity_hourly (hour, action, count)
+        SELECT strftime('%Y-%m-%d %H:00', ts), action, COUNT(*) FROM activity_log
+        WHERE id > ? AND id <= ? GROUP BY 1, 2
+        ON CONFLICT(hour, action) DO UPDATE SET count = count + excluded.count
+    """,
+}
+
+
+def rollup():
+    # folds activity rows past each table's high-water mark into it, chunk by chunk.
+    # returns how many ids the slowest aggregate moved forward
+    start = None
+    while True:
+        with vault_db.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            if start is None:
+                start = _rolled_upto(conn)
+            max_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM activity_log").fetchone()[0]
+            behind = False
+            for name, sql in ROLLUPS.items():
+                last_id = _state(conn, name)
+                if last_id < max_id:
+                    upto = min(max_id, last_id + ROLLUP_CHUNK)
+                    conn.execute(sql, (last_id, upto))
+                    _set_state(conn, name, upto)
+                    behind = True
+            if not behind:
+                return _rolled_upto(conn) - start
+
+
+def _rolled_upto(conn):
+    # rows may only leave the hot table once every aggregate has counted them
+    return min(_state(conn, name) for name in ROLLUPS)
+
+
+def _archive_path(month):
+    return os.path.join(ARCHIVE_FOLDER, f"activity-{month}.jsonl.gz")
+
+
+def archive(days=RETENTION_DAYS):
+    # moves rolled-up rows older than the window out of the hot table.
+    # archive files are written and fsynced before the rows are deleted; if we die in between
+    # the rows are archived twice, which readers tolerate (they de-duplicate by id)
+    cutoff = (datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
+    os.makedirs(ARCHIVE_FOLDER, exist_ok=True)
+    moved = 0
+    while True:
+        with vault_db.connection() as conn:
+            rolled_upto = _rolled_upto(conn)
+            rows = conn.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM activity_log WHERE ts < ? AND id <= ? ORDER BY ts, id LIMIT ?",
+                (cutoff, rolled_upto, ARCHIVE_CHUNK),
+            ).fetchall()
+            if not rows:
+                return moved
+            by_month = {}
+            for r in rows:
+                by_month.setdefault(str(r["ts"])[:7], []).append(dict(zip(COLUMNS, r)))
+            for month, items in by_month.items():
+                with open(_archive_path(month), "ab") as raw:  # each append is its own gzip member
+                    with gzip.GzipFile(fileobj=raw, mode="wb") as gz:
+                        gz.write("".join(json.dumps(item) + "\n" for item in items).encode())
+                    raw.flush()
+                    os.fsync(raw.fileno())
+            conn.executemany("DELETE FROM activity_log WHERE id = ?", [(r["id"],) for r in rows])
+            conn.commit()
+            moved += len(rows)
+
+
+def vacuum(step=VACUUM_PAGES):
+    # hands free pages back to the filesystem a step at a time so no single transaction is long
+    released = 0
+    with vault_db.connection() as conn:
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            return 0  # needs enable_incremental_vacuum() once
+        while True:
+            free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            if not free:
+                break
+            conn.executescript(f"PRAGMA incremental_vacuum({int(step)})")  # execute() would free only one page
+            released += free - conn.execute("PRAGMA freelist_count").fetchone()[0]
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    return released
+
+
+def enable_incremental_vacuum():
+    with vault_db.connection() as conn:
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")  # one full rewrite so the setting takes effect
+
+
+def run(days=RETENTION_DAYS):
+    return {"rolled_up": rollup(), "archived": archive(days), "vacuumed_pages": vacuum()}
+
+
+def _months_between(start, end):
+    # archive months overlapping [start, end), newest first
+    months = sorted(
+        (os.path.basename(p)[len("activity-"):-len(".jsonl.gz")] for p in glob.glob(_archive_path("*"))),
+        reverse=True,
+    )
+    return [m for m in months if (end is None or m <= end[:7]) and (start is None or m >= start[:7])]
+
+
+def _members(path):
+    # (offset, (ts, id) of the last row) for each gzip member. archive() appends one member per
+    # chunk with its rows in (ts, id) order, so the last row is the member's newest
+    members = []
+    with open(path, "rb") as f:
+        start = pos = 0
+        d = zlib.decompressobj(wbits=31)
+        tail = b""
+        while True:
+            data = f.read(READ_BYTES)
+            if not data:
+                break
+            while data:
+                tail += d.decompress(data)
+                cut = tail.rfind(b"\n", 0, len(tail) - 1)
+                if cut >= 0:
+                    tail = tail[cut + 1:]  # only the last line is needed
+                if not d.eof:
+                    pos += len(data)
+                    break
+                pos += len(data) - len(d.unused_data)
+                if tail.strip():
+                    row = json.loads(tail)
+                    members.append((start, (row["ts"], row["id"])))
+                start = pos
+                data = d.unused_data
+                d = zlib.decompressobj(wbits=31)
+                tail = b""
+    return members
+
+
+def _member_rows(f, offset):
+    f.seek(offset)
+    d = zlib.decompressobj(wbits=31)
+    buffer = b""
+    while not d.eof:
+        data = f.read(READ_BYTES)
+        if not data:
+            break
+        buffer += d.decompress(data)
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield json.loads(line)
+    if buffer.strip():
+        yield json.loads(buffer)
+
+
+def _key(row):
+    return row["ts"], row["id"]
+
+
+def iter_archived(userid=None, start=None, end=None, chunk_size=1000):
+    # archived rows, newest first, in the same chunks as activity_queries.iter_activity.
+    # members are read newest first and merged; a row is handed out as soon as no unread member
+    # can hold anything newer, so only members with overlapping time ranges are in memory
+    # together - normally a single ARCHIVE_CHUNK of rows, whatever the size of the month
+    for month in _months_between(start, end):
+        path = _archive_path(month)
+        members = sorted(_members(path), key=lambda m: m[1], reverse=True)
+        pending = []  # newest first
+        out = []
+        last = None
+        with open(path, "rb") as f:
+            for i, (offset, newest) in enumerate(members):
+                if start is not None and newest[0] < start:
+                    break  # this member and every later one is older than the range
+                rows = [
+                    r for r in _member_rows(f, offset)
+                    if (userid is None or r["userid"] == userid)
+                    and (start is None or r["ts"] >= start) and (end is None or r["ts"] < end)
+                ]
+                rows.reverse()
+                pending = list(heapq.merge(pending, rows, key=_key, reverse=True))
+                bound = members[i + 1][1] if i + 1 < len(members) else None
+                done = 0
+                while done < len(pending) and (bound is None or _key(pending[done]) > bound):
+                    done += 1
+                for row in pending[:done]:
+                    if _key(row) != last:  # rows archived twice after a crash sit next to each other
+                        out.append(row)
+                        last = _key(row)
+                    if len(out) >= chunk_size:
+                        yield out
+                        out = []
+                pending = pending[done:]
+        if out:
+            yield out
+
+
+def oldest_hot_ts():
+    row = vault_db.query_one("SELECT MIN(ts) FROM activity_log")
+    return row[0] if row else None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="activity_log retention")
+    parser.add_argument("command", choices=["run", "rollup", "enable-incremental-vacuum"])
+    parser.add_argument("--days", type=int, default=RETENTION_DAYS)
+    parser.add_argument("--db", default=vault_db.DB_NAME)
+    args = parser.parse_args()
+    vault_db.configure(args.db)
+    vault_db.migrate()
+    if args.command == "run":
+        print(run(args.days))
+    elif args.command == "rollup":
+        print({"rolled_up": rollup()})
+    else:
+        enable_incremental_vacuum()
+        print("auto_vacuum set to INCREMENTAL")
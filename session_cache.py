@@ -0,0 +1,52 @@
+# short-lived cache for per-user rows the pages read on every rerun (profile, recent
+# activity). entries expire after TTL seconds and are dropped as soon as new activity
+# for that user is logged or committed
+import threading
+import time
+
+import activity_writer
+
+TTL = 60
+MAX_ENTRIES = 10000
+
+_entries = {}
+_lock = threading.Lock()
+stats = {"hits": 0, "misses": 0}
+
+
+def get_or_load(key, loader, ttl=TTL):
+    # key is a tuple whose second item is the user id, e.g. ("profile", "jay")
+    now = time.monotonic()
+    with _lock:
+        entry = _entries.get(key)
+        if entry is not None and entry[0] > now:
+            stats["hits"] += 1
+            return entry[1]
+        stats["misses"] += 1
+    value = loader()
+    with _lock:
+        if len(_entries) >= MAX_ENTRIES:
+            _evict_expired(now)
+        if len(_entries) < MAX_ENTRIES:
+            _entries[key] = (now + ttl, value)
+    return value
+
+
+def _evict_expired(now):
+    for key, (expires, _) in list(_entries.items()):
+        if expires <= now:
+            del _entries[key]
+
+
+def invalidate(userid):
+    with _lock:
+        for key in [k for k in _entries if k[1] == userid or k[1] is None]:  # None = all-users entries
+            del _entries[key]
+
+
+def _on_activity_written(userids):
+    for userid in userids:
+        invalidate(userid)
+
+
+activity_writer.add_listener(_on_activity_written)  # batch committed, those users' rows changed
@@ -0,0 +1,90 @@
+# theme CSS and background images, prepared once per file version instead of on every rerun.
+# backgrounds are either inlined as a data URI (default) or, with SECUREVAULT_STATIC_BG=1,
+# copied to ./static and referenced by URL so the browser caches them
+# (needs server.enableStaticServing, see .streamlit/config.toml)
+import base64
+import functools
+import io
+import os
+
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except Exception:
+    PIL_AVAILABLE = False    # backgrounds are used as they are, without resizing / WebP
+
+STATIC_FOLDER = "static"
+STATIC_URL = "app/static"
+STATIC_BACKGROUNDS = os.environ.get("SECUREVAULT_STATIC_BG") == "1"
+MAX_BG_WIDTH = int(os.environ.get("SECUREVAULT_BG_WIDTH", "1920"))  # wider backgrounds are scaled down
+WEBP_QUALITY = 80
+
+MIME_TYPES = {".jpg": "image/jpeg", ".jpeg": "image/jpeg", ".png": "image/png", ".webp": "image/webp"}
+
+BACKGROUND_CSS = """
+[data-testid="stAppViewContainer"] {{
+    background-image: url("{url}");
+    background-size: cover;
+    background-position: center;
+}}
+"""
+
+
+def _mtime(path):
+    return os.stat(path).st_mtime_ns  # part of every cache key, editing a file invalidates it
+
+
+@functools.lru_cache(maxsize=16)
+def _css(path, mtime):
+    with open(path) as f:
+        return f.read()
+
+
+def css(path):
+    return _css(path, _mtime(path))
+
+
+@functools.lru_cache(maxsize=8)
+def _optimised_image(path, mtime):
+    # (bytes, extension) of the background as it should be sent: downscaled + WebP when Pillow is around
+    ext = os.path.splitext(path)[1].lower()
+    with open(path, "rb") as f:
+        data = f.read()
+    if not PIL_AVAILABLE:
+        return data, ext
+    with Image.open(io.BytesIO(data)) as img:
+        if img.width > MAX_BG_WIDTH:
+            img = img.resize((MAX_BG_WIDTH, round(img.height * MAX_BG_WIDTH / img.width)))
+        out = io.BytesIO()
+        img.convert("RGB").save(out, "WEBP", quality=WEBP_QUALITY)
+    if out.tell() >= len(data):
+        return data, ext  # original was already smaller
+    return out.getvalue(), ".webp"
+
+
+@functools.lru_cache(maxsize=8)
+def _inline_background(path, mtime):
+    data, ext = _optimised_image(path, mtime)
+    encoded = base64.b64encode(data).decode()
+    return BACKGROUND_CSS.format(url=f"data:{MIME_TYPES.get(ext, 'image/jpeg')};base64,{encoded}")
+
+
+@functools.lru_cache(maxsize=8)
+def _static_background(path, mtime):
+    data, ext = _optimised_image(path, mtime)
+    name = f"{os.path.splitext(os.path.basename(path))[0]}-{mtime}{ext}"  # new name per version, safe to cache forever
+    target = os.path.join(STATIC_FOLDER, name)
+    if not os.path.exists(target):
+        os.makedirs(STATIC_FOLDER, exist_ok=True)
+        tmp = target + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, target)
+    return BACKGROUND_CSS.format(url=f"{STATIC_URL}/{name}")
+
+
+def background_css(path):
+    mtime = _mtime(path)
+    if STATIC_BACKGROUNDS:
+        return _static_background(path, mtime)
+    return _inline_background(path, mtime)
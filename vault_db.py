@@ -0,0 +1,373 @@
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import metrics
+
+DB_NAME = os.environ.get("SECUREVAULT_DB", "securevault.db")
+POOL_SIZE = int(os.environ.get("SECUREVAULT_DB_POOL", "8"))  # max open connections per process
+POOL_TIMEOUT = 10  # seconds to wait for a free connection before giving up
+STATEMENT_CACHE = 256  # prepared statements kept per connection by sqlite3
+
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",  # readers don't block the writer and vice versa
+    "PRAGMA synchronous=NORMAL",  # safe with WAL, fsync only at checkpoints
+    "PRAGMA cache_size=-16000",  # ~16 MB page cache per connection
+    "PRAGMA mmap_size=268435456",  # map up to 256 MB of the db file
+    "PRAGMA busy_timeout=5000",  # wait for locks instead of failing straight away
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA foreign_keys=ON",
+)
+
+
+class _TimedConnection(sqlite3.Connection):
+    # every statement shows up in metrics as a ("db", sql) span; rows fetched later are not included
+    def execute(self, sql, params=()):
+        with metrics.query(sql):
+            return super().execute(sql, params)
+
+    def executemany(self, sql, params):
+        with metrics.query(sql):
+            return super().executemany(sql, params)
+
+    def executescript(self, script):
+        with metrics.query(script):
+            return super().executescript(script)
+
+
+def _open(path):
+    conn = sqlite3.connect(
+        path,
+        timeout=POOL_TIMEOUT,
+        check_same_thread=False,  # connections move between Streamlit script threads via the pool
+        cached_statements=STATEMENT_CACHE,
+        factory=_TimedConnection if metrics.ENABLED else sqlite3.Connection,
+    )
+    conn.row_factory = sqlite3.Row
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn  # new connection with our tuned settings
+
+
+class _Pool:
+    def __init__(self, path, size):
+        self.path = path
+        self.size = size
+        self.idle = queue.LifoQueue()  # LIFO so the warmest connection is reused first
+        self.opened = 0
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def acquire(self):
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self.lock:
+            if self.opened < self.size:
+                self.opened += 1
+                try:
+                    return _open(self.path)
+                except Exception:
+                    self.opened -= 1
+                    raise
+        try:
+            return self.idle.get(timeout=POOL_TIMEOUT)
+        except queue.Empty:
+            raise RuntimeError("database connection pool exhausted") from None
+
+    def release(self, conn):
+        self.idle.put(conn)
+
+    def close(self):
+        with self.lock:
+            while True:
+                try:
+                    self.idle.get_nowait().close()
+                except queue.Empty:
+                    break
+            self.opened = 0  # connections still checked out are closed when they come back
+
+
+_pool = _Pool(DB_NAME, POOL_SIZE)
+_pool_lock = threading.Lock()
+
+
+def configure(path=None, pool_size=None):
+    global _pool, DB_NAME
+    with _pool_lock:
+        _pool.close()
+        DB_NAME = path or DB_NAME
+        _pool = _Pool(DB_NAME, pool_size or POOL_SIZE)  # point the pool at another db (scripts, benchmarks)
+
+
+@contextmanager
+def connection():
+    pool = _pool
+    held = getattr(pool.local, "conn", None)
+    if held is not None:
+        yield held  # nested use in the same thread shares the outer connection
+        return
+    conn = pool.acquire()
+    pool.local.conn = conn
+    try:
+        yield conn
+        if conn.in_transaction:
+            conn.commit()
+    except BaseException:
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+    finally:
+        pool.local.conn = None
+        if pool is _pool:
+            pool.release(conn)
+        else:
+            conn.close()  # pool was reconfigured while we held this one
+
+
+# schema migrations, applied in order; PRAGMA user_version records how many have run.
+# each entry is a tuple of statements so triggers (which contain ';') stay intact
+MIGRATIONS = [
+    (
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            userid TEXT UNIQUE,
+            password TEXT,
+            email TEXT
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS activity_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            userid TEXT,
+            action TEXT NOT NULL,
+            details TEXT,
+            ts DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+    ),
+    (
+        "CREATE INDEX IF NOT EXISTS idx_activity_user_ts ON activity_log (userid, ts)",
+        "CREATE INDEX IF NOT EXISTS idx_activity_ts ON activity_log (ts)",
+    ),
+    (
+        """
+        CREATE TABLE IF NOT EXISTS files (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            owner TEXT NOT NULL,
+            filename TEXT NOT NULL,
+            size_bytes INTEGER,
+            uploaded_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            mime_type TEXT,
+            FOREIGN KEY(owner) REFERENCES users(userid)
+        )
+        """,
+        "ALTER TABLE files ADD COLUMN blob_hash TEXT",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_files_owner_name ON files (owner, filename)",
+        "CREATE INDEX IF NOT EXISTS idx_files_blob ON files (blob_hash)",
+        """
+        CREATE TABLE IF NOT EXISTS blobs (
+            hash TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            refcount INTEGER NOT NULL DEFAULT 0,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+    ),
+    (
+        "ALTER TABLE files ADD COLUMN modified_at DATETIME",
+        "UPDATE files SET modified_at = uploaded_at",
+        """
+        CREATE TABLE IF NOT EXISTS user_storage (
+            owner TEXT PRIMARY KEY,
+            file_count INTEGER NOT NULL DEFAULT 0,
+            bytes_used INTEGER NOT NULL DEFAULT 0
+        )
+        """,
+        """
+        INSERT OR REPLACE INTO user_storage (owner, file_count, bytes_used)
+        SELECT owner, COUNT(*), COALESCE(SUM(size_bytes), 0) FROM files GROUP BY owner
+        """,
+        # per-user counters follow the files table inside the same transaction
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_files_insert AFTER INSERT ON files BEGIN
+            INSERT OR IGNORE INTO user_storage (owner) VALUES (NEW.owner);
+            UPDATE user_storage SET file_count = file_count + 1, bytes_used = bytes_used + COALESCE(NEW.size_bytes, 0)
+            WHERE owner = NEW.owner;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_files_delete AFTER DELETE ON files BEGIN
+            UPDATE user_storage SET file_count = file_count - 1, bytes_used = bytes_used - COALESCE(OLD.size_bytes, 0)
+            WHERE owner = OLD.owner;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_files_update AFTER UPDATE OF owner, size_bytes ON files BEGIN
+            UPDATE user_storage SET file_count = file_count - 1, bytes_used = bytes_used - COALESCE(OLD.size_bytes, 0)
+            WHERE owner = OLD.owner;
+            INSERT OR IGNORE INTO user_storage (owner) VALUES (NEW.owner);
+            UPDATE user_storage SET file_count = file_count + 1, bytes_used = bytes_used + COALESCE(NEW.size_bytes, 0)
+            WHERE owner = NEW.owner;
+        END
+        """,
+    ),
+    (
+        """
+        CREATE TABLE IF NOT EXISTS password_resets (
+            userid TEXT PRIMARY KEY,
+            token_hash TEXT NOT NULL,
+            expires_at DATETIME NOT NULL
+        )
+        """,
+    ),
+    (
+        """
+        CREATE TABLE IF NOT EXISTS rate_limits (
+            key TEXT PRIMARY KEY,
+            tokens REAL NOT NULL,
+            updated REAL NOT NULL
+        )
+        """,
+    ),
+    (
+        """
+        CREATE TABLE IF NOT EXISTS activity_daily (
+            day TEXT NOT NULL,
+            userid TEXT NOT NULL,
+            action TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (day, userid, action)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_activity_daily_user ON activity_daily (userid, day)",
+        """
+        CREATE TABLE IF NOT EXISTS rollup_state (
+            name TEXT PRIMARY KEY,
+            last_id INTEGER NOT NULL
+        )
+        """,
+    ),
+    (
+        """
+        CREATE TABLE IF NOT EXISTS activity_hourly (
+            hour TEXT NOT NULL,
+            action TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (hour, action)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_user_storage_bytes ON user_storage (bytes_used)",
+    ),
+    (
+        "CREATE INDEX IF NOT EXISTS idx_files_owner_size ON files (owner, size_bytes)",
+        "CREATE INDEX IF NOT EXISTS idx_files_owner_modified ON files (owner, modified_at)",
+        "CREATE INDEX IF NOT EXISTS idx_user_storage_count ON user_storage (file_count)",
+    ),
+    (
+        """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            params TEXT NOT NULL,
+            owner TEXT,
+            status TEXT NOT NULL DEFAULT 'queued',
+            progress REAL NOT NULL DEFAULT 0,
+            message TEXT,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL DEFAULT 3,
+            run_after REAL NOT NULL DEFAULT 0,
+            heartbeat REAL,
+            result TEXT,
+            result_path TEXT,
+            error TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            finished_at DATETIME
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, run_after)",
+        "CREATE INDEX IF NOT EXISTS idx_jobs_lookup ON jobs (kind, params)",
+        "CREATE INDEX IF NOT EXISTS idx_jobs_finished ON jobs (finished_at)",
+    ),
+    (
+        "ALTER TABLE blobs ADD COLUMN stored_size INTEGER",
+        "UPDATE blobs SET stored_size = size",
+        "ALTER TABLE blobs ADD COLUMN encrypted INTEGER NOT NULL DEFAULT 0",
+    ),
+    (
+        "ALTER TABLE blobs ADD COLUMN codec TEXT NOT NULL DEFAULT 'raw'",
+        "ALTER TABLE blobs ADD COLUMN last_access DATETIME",
+        "UPDATE blobs SET last_access = created_at",
+        "ALTER TABLE blobs ADD COLUMN entropy REAL",
+        "CREATE INDEX IF NOT EXISTS idx_blobs_cold ON blobs (codec, last_access)",
+    ),
+    (
+        """
+        CREATE TABLE IF NOT EXISTS previews (
+            hash TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            bytes INTEGER NOT NULL DEFAULT 0,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            last_used DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_previews_used ON previews (last_used)",
+    ),
+    (
+        "CREATE INDEX IF NOT EXISTS idx_rate_limits_updated ON rate_limits (updated)",  # for rate_limit pruning
+    ),
+    (
+        # an upsert's DO UPDATE overrides OR IGNORE inside the trigger, so re-uploading a name failed
+        "DROP TRIGGER IF EXISTS trg_files_update",
+        """
+        CREATE TRIGGER trg_files_update AFTER UPDATE OF owner, size_bytes ON files BEGIN
+            UPDATE user_storage SET file_count = file_count - 1, bytes_used = bytes_used - COALESCE(OLD.size_bytes, 0)
+            WHERE owner = OLD.owner;
+            INSERT INTO user_storage (owner) SELECT NEW.owner
+            WHERE NOT EXISTS (SELECT 1 FROM user_storage WHERE owner = NEW.owner);
+            UPDATE user_storage SET file_count = file_count + 1, bytes_used = bytes_used + COALESCE(NEW.size_bytes, 0)
+            WHERE owner = NEW.owner;
+        END
+        """,
+    ),
+]
+
+_migrated = set()
+
+
+def migrate():
+    path = DB_NAME
+    if path in _migrated:
+        return  # once per process is enough, reruns skip straight past
+    with _pool_lock, connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")  # one process migrates at a time
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for number, statements in enumerate(MIGRATIONS[version:], start=version + 1):
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {number}")
+        conn.commit()
+    _migrated.add(path)
+
+
+def query_one(sql, params=()):
+    with connection() as conn:
+        return conn.execute(sql, params).fetchone()
+
+
+def query_all(sql, params=()):
+    with connection() as conn:
+        return conn.execute(sql, params).fetchall()
+
+
+def execute(sql, params=()):
+    with connection() as conn:
+        return conn.execute(sql, params).rowcount  # committed when the connection goes back to the pool
+
+
+def close_all():
+    _pool.close()